@@ -0,0 +1,251 @@
+"""
+Per-user and per-guild admission control for pwnedBot's commands.
+
+Every command must hold a slot of its user and, outside direct
+messages, a slot of its guild while it runs. A command that finds its
+user or guild at the in-flight limit waits in a short FIFO queue; when
+that queue is full too it is rejected at once. Admission runs just
+after discord.py has converted the command's arguments, before the
+command touches HIBP. One user or raid bot flooding commands therefore
+only ever occupies a few slots, and everyone else keeps predictable
+latency.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import asyncio
+from collections import deque
+from collections.abc import Hashable
+from discord.ext import commands
+
+# Users remembered as already told about a rejection; past this the
+# memory is cleared, at worst costing one extra reply per user
+MAX_NOTIFIED = 10000
+
+REASONS = {
+    "user": "You have too many commands in progress",
+    "guild": "This server has too many commands in progress",
+    "timeout": "The bot is busy",
+}
+
+
+class Overloaded(commands.CommandError):
+    """
+    Raised when a command is shed because its user or guild is busy.
+
+    Attributes:
+        scope (str): "user" or "guild", whichever queue was full, or
+            "timeout" if the command waited too long.
+        notify (bool): False if the user was already told about an
+            earlier rejection and has not been admitted since, so a
+            flood of commands does not become a flood of replies.
+    """
+
+    def __init__(self, scope: str, notify: bool) -> None:
+        super().__init__(REASONS[scope])
+        self.scope = scope
+        self.notify = notify
+
+
+class _Slots:
+    """In-flight count and FIFO waiters of one user or guild."""
+    __slots__ = ("active", "waiters")
+
+    def __init__(self) -> None:
+        self.active = 0
+        self.waiters: deque[asyncio.Future[None]] = deque()
+
+
+class Limiter:
+    """
+    Keyed concurrency limit with a bounded wait queue per key.
+
+    Released slots are handed straight to the oldest waiter of the key,
+    so waiters are served in order. Idle keys are forgotten.
+    """
+
+    def __init__(self, limit: int, queue_size: int) -> None:
+        self.limit = limit
+        self.queue_size = queue_size
+        self._slots: dict[Hashable, _Slots] = {}
+
+    @property
+    def active(self) -> int:
+        """Number of slots held."""
+        return sum(slots.active for slots in self._slots.values())
+
+    @property
+    def queued(self) -> int:
+        """Number of commands waiting for a slot."""
+        return sum(len(slots.waiters) for slots in self._slots.values())
+
+    def free(self, key: Hashable) -> bool:
+        """Whether `key` has a slot free right now."""
+        slots = self._slots.get(key)
+        return (self.limit <= 0 or slots is None or
+                (slots.active < self.limit and not slots.waiters))
+
+    def full(self, key: Hashable) -> bool:
+        """Whether a command for `key` would be rejected."""
+        slots = self._slots.get(key)
+        return (not self.free(key) and slots is not None and
+                len(slots.waiters) >= self.queue_size)
+
+    async def acquire(self, key: Hashable) -> None:
+        """
+        Takes a slot of `key`, queueing for it if none is free.
+
+        Call `full` first; queueing here is not bounded.
+
+        Args:
+            key (Hashable): The user or guild ID.
+        """
+        if self.limit <= 0:
+            return
+        slots = self._slots.setdefault(key, _Slots())
+        if slots.active < self.limit and not slots.waiters:
+            slots.active += 1
+            return
+        future: asyncio.Future[None] = (
+            asyncio.get_running_loop().create_future())
+        slots.waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the wait was abandoned
+                self.release(key)
+            else:
+                if future in slots.waiters:
+                    slots.waiters.remove(future)
+                self._forget(key, slots)
+            raise
+
+    def release(self, key: Hashable) -> None:
+        """
+        Returns a slot of `key`, handing it to the oldest waiter.
+
+        Args:
+            key (Hashable): The user or guild ID.
+        """
+        slots = self._slots.get(key)
+        if self.limit <= 0 or slots is None:
+            return
+        while slots.waiters:
+            future = slots.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        slots.active -= 1
+        self._forget(key, slots)
+
+    def _forget(self, key: Hashable, slots: _Slots) -> None:
+        """Drops the entry of a key with no running or waiting commands."""
+        if (slots.active <= 0 and not slots.waiters and
+                self._slots.get(key) is slots):
+            del self._slots[key]
+
+
+class AdmissionController:
+    """
+    Admits commands under per-user and per-guild in-flight limits.
+
+    A user may run `user_limit` commands at once with `user_queue` more
+    waiting, and a guild `guild_limit` with `guild_queue` waiting. A
+    limit of 0 disables it. Commands still waiting after `timeout`
+    seconds are rejected.
+    """
+
+    def __init__(self,
+                 user_limit: int = 2,
+                 guild_limit: int = 10,
+                 user_queue: int = 2,
+                 guild_queue: int = 20,
+                 timeout: float = 30.0) -> None:
+        self.users = Limiter(user_limit, user_queue)
+        self.guilds = Limiter(guild_limit, guild_queue)
+        self.timeout = timeout
+        self._notified: set[int] = set()
+
+    @property
+    def active(self) -> int:
+        """Number of user and guild slots held by running commands."""
+        return self.users.active + self.guilds.active
+
+    @property
+    def queued(self) -> int:
+        """Number of commands waiting to be admitted."""
+        return self.users.queued + self.guilds.queued
+
+    def must_wait(self, user_id: int, guild_id: int | None) -> bool:
+        """
+        Whether a command would have to queue before running.
+
+        Args:
+            user_id (int): The invoking user.
+            guild_id (int | None): The guild, or None in direct messages.
+
+        Returns:
+            bool: True if the user or guild has no free slot.
+        """
+        return not self.users.free(user_id) or (
+            guild_id is not None and not self.guilds.free(guild_id))
+
+    async def acquire(self, user_id: int, guild_id: int | None) -> None:
+        """
+        Waits until a command may run, or rejects it.
+
+        Slots are taken user first, then guild, so waiters never block
+        each other in a cycle.
+
+        Args:
+            user_id (int): The invoking user.
+            guild_id (int | None): The guild, or None in direct messages.
+
+        Raises:
+            Overloaded: If the user's or guild's queue is full, or the
+                command waited longer than `timeout` seconds.
+        """
+        scope = "user" if self.users.full(user_id) else None
+        if scope is None and guild_id is not None and self.guilds.full(
+                guild_id):
+            scope = "guild"
+        if scope is not None:
+            raise self._reject(user_id, scope)
+        try:
+            async with asyncio.timeout(self.timeout):
+                await self.users.acquire(user_id)
+                try:
+                    if guild_id is not None:
+                        await self.guilds.acquire(guild_id)
+                except BaseException:
+                    self.users.release(user_id)
+                    raise
+        except TimeoutError:
+            raise self._reject(user_id, "timeout") from None
+        self._notified.discard(user_id)
+
+    def release(self, user_id: int, guild_id: int | None) -> None:
+        """
+        Returns the slots of a finished command.
+
+        Args:
+            user_id (int): The invoking user.
+            guild_id (int | None): The guild, or None in direct messages.
+        """
+        if guild_id is not None:
+            self.guilds.release(guild_id)
+        self.users.release(user_id)
+
+    def _reject(self, user_id: int, scope: str) -> Overloaded:
+        """Builds the error of a rejected command."""
+        if len(self._notified) >= MAX_NOTIFIED:
+            self._notified.clear()
+        notify = user_id not in self._notified
+        self._notified.add(user_id)
+        return Overloaded(scope, notify)
@@ -0,0 +1,438 @@
+"""
+Bulk account and password audits for pwnedBot.
+
+A list of accounts is checked by a bounded pool of workers whose HIBP
+requests are paced by the shared rate limit scheduler. Progress is
+reported periodically, and the results are returned as a single
+gzip-compressed CSV or JSON file rather than one message per account.
+
+Password and hash lists are streamed in chunks, each hashed in a
+process pool. Long lists are spilled to temporary files partitioned by
+SHA-1 prefix and looked up a partition at a time, so each Pwned
+Passwords range is fetched once and memory stays bounded however long
+the file is.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import asyncio
+import csv
+import gzip
+import heapq
+import io
+import json
+import os
+import re
+import tempfile
+import time
+from collections.abc import (AsyncIterator, Awaitable, Callable, Iterable,
+                             Iterator)
+from concurrent.futures import Executor
+from contextlib import ExitStack
+from typing import IO, NamedTuple
+import aiohttp
+from requests.exceptions import RequestException
+from hibp_client import HIBPClient, sha1_hex
+from pwned_passwords import PasswordEngine
+
+# Called with (done, total) as an audit makes progress
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+# Lines of a password audit that are already SHA-1 hashes
+SHA1_HEX = re.compile(r"[0-9A-Fa-f]{40}")
+
+# Hash prefix partitions a long password audit is spilled into, one per
+# leading pair of hex digits
+PARTITIONS = 256
+
+# Header cells recognised, and skipped, in CSV files
+HEADER_NAMES = {"account", "accounts", "email", "emails", "username",
+                "user", "mail", "address"}
+
+
+class AuditRow(NamedTuple):
+    """The audit result of one account."""
+    account: str
+    status: str
+    breach_count: int
+    breaches: list[str]
+
+
+class PasswordAuditSummary(NamedTuple):
+    """Totals of a password audit."""
+    lines: int
+    compromised: int
+    max_count: int
+
+
+def parse_accounts(text: str) -> list[str]:
+    """
+    Extracts accounts from inline text or a text/CSV file.
+
+    Each CSV row contributes its first non-empty cell, and single-column
+    lines may hold several accounts separated by whitespace or
+    semicolons. Header cells and duplicates are skipped, ignoring case.
+
+    Args:
+        text (str): The inline arguments or file contents.
+
+    Returns:
+        list[str]: The unique accounts in their original order.
+    """
+    accounts: list[str] = []
+    seen: set[str] = set()
+    for row in csv.reader(io.StringIO(text)):
+        cells = [cell.strip() for cell in row if cell.strip()]
+        if not cells:
+            continue
+        if len(row) == 1:
+            tokens = re.split(r"[\s;]+", cells[0])
+        else:
+            tokens = [cells[0]]
+        for token in tokens:
+            key = token.lower()
+            if not token or key in seen or key in HEADER_NAMES:
+                continue
+            seen.add(key)
+            accounts.append(token)
+    return accounts
+
+
+async def audit_accounts(client: HIBPClient,
+                         accounts: list[str],
+                         workers: int = 4,
+                         progress: ProgressCallback | None = None,
+                         interval: float = 5.0) -> list[AuditRow]:
+    """
+    Checks every account for breaches with a bounded pool of workers.
+
+    Args:
+        client (HIBPClient): The shared HIBP client.
+        accounts (list[str]): The accounts to check.
+        workers (int): The maximum number of concurrent lookups.
+        progress (ProgressCallback | None): Awaited with (done, total) at
+            most every `interval` seconds while the audit runs.
+        interval (float): Minimum seconds between progress reports.
+
+    Returns:
+        list[AuditRow]: One row per account, in input order.
+    """
+    results: list[AuditRow | None] = [None] * len(accounts)
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for index in range(len(accounts)):
+        queue.put_nowait(index)
+    done = 0
+    reported = time.monotonic()
+
+    async def worker() -> None:
+        nonlocal done, reported
+        while True:
+            try:
+                index = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            results[index] = await check_account(client, accounts[index])
+            done += 1
+            now = time.monotonic()
+            if progress is not None and now - reported >= interval:
+                reported = now
+                await progress(done, len(accounts))
+
+    await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+    return [row for row in results if row is not None]
+
+
+async def check_account(client: HIBPClient, account: str) -> AuditRow:
+    """
+    Checks a single account, turning failures into an error row.
+
+    Args:
+        client (HIBPClient): The shared HIBP client.
+        account (str): The account to check.
+
+    Returns:
+        AuditRow: The account's result.
+    """
+    try:
+        result = await client.search_all_breaches(account, truncate=True)
+    except RequestException:
+        return AuditRow(account, "error", 0, [])
+    if isinstance(result, int):
+        if result == 404:
+            return AuditRow(account, "clean", 0, [])
+        return AuditRow(account, f"error {result}", 0, [])
+    names = [str(breach.get("Name")) for breach in result]
+    return AuditRow(account, "pwned", len(names), names)
+
+
+def export_rows(rows: Iterable[AuditRow], fmt: str = "csv") -> bytes:
+    """
+    Serialises audit results into a gzip-compressed CSV or JSON file.
+
+    Args:
+        rows (Iterable[AuditRow]): The audit results.
+        fmt (str): "csv" or "json".
+
+    Returns:
+        bytes: The compressed file contents.
+    """
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb") as gz_file:
+        text = io.TextIOWrapper(gz_file, encoding="utf-8", newline="")
+        if fmt == "json":
+            json.dump([row._asdict() for row in rows], text)
+        else:
+            writer = csv.writer(text)
+            writer.writerow(["account", "status", "breach_count",
+                             "breaches"])
+            for row in rows:
+                writer.writerow([row.account, row.status, row.breach_count,
+                                 ";".join(row.breaches)])
+        text.flush()
+        text.detach()
+    return buffer.getvalue()
+
+
+def hash_lines(lines: list[str]) -> list[str]:
+    """
+    Hashes plaintext passwords, passing SHA-1 hashes through.
+
+    Runs in a worker process. A line of exactly 40 hex characters is
+    treated as a SHA-1 hash rather than a password.
+
+    Args:
+        lines (list[str]): Passwords or SHA-1 hashes, one per entry.
+
+    Returns:
+        list[str]: The upper-case SHA-1 hex digest of each entry.
+    """
+    return [line.upper() if SHA1_HEX.fullmatch(line) else sha1_hex(line)
+            for line in lines]
+
+
+async def iter_url_lines(url: str) -> AsyncIterator[str]:
+    """
+    Streams the lines of a file, such as a Discord attachment.
+
+    A separate session is used so the HIBP API key is never sent to
+    other hosts.
+
+    Args:
+        url (str): The file URL.
+
+    Yields:
+        str: Each line without its line ending.
+
+    Raises:
+        RequestException: If the file could not be downloaded.
+        ValueError: If a line is too long to read.
+    """
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as resp:
+                resp.raise_for_status()
+                async for raw in resp.content:
+                    yield raw.decode("utf-8", errors="replace").rstrip("\r\n")
+    except aiohttp.ClientError as exc:
+        raise RequestException(str(exc)) from exc
+    except ValueError as exc:
+        # aiohttp's line reader refuses lines over its buffer limit
+        raise ValueError("a line of the file is too long") from exc
+
+
+class _Partitions:
+    """
+    Hashes of a password audit spilled to temporary files by prefix.
+
+    Each partition holds the "line,hash" records of one leading hex
+    digit pair, in input order, so it covers every hash of its range
+    prefixes. Results are written back per partition as "line,count".
+    The methods block, so run them in a thread.
+    """
+
+    def __init__(self) -> None:
+        self.directory = tempfile.TemporaryDirectory(prefix="pwnedbot-")
+        self._writers: dict[int, IO[str]] = {}
+
+    def _path(self, part: int, kind: str) -> str:
+        """Returns the path of a partition's input or output file."""
+        return os.path.join(self.directory.name, f"{part:02X}.{kind}")
+
+    def add(self, numbers: list[int], hexdigests: list[str]) -> None:
+        """Appends hashes and their line numbers to their partitions."""
+        for number, hexdig in zip(numbers, hexdigests):
+            part = int(hexdig[:2], 16)
+            writer = self._writers.get(part)
+            if writer is None:
+                writer = open(self._path(part, "in"), "a", encoding="ascii")
+                self._writers[part] = writer
+            writer.write(f"{number},{hexdig}\n")
+
+    def read(self, part: int) -> tuple[list[int], list[str]]:
+        """Returns a partition's line numbers and hashes, in line order."""
+        writer = self._writers.pop(part, None)
+        if writer is None:
+            return [], []
+        writer.close()
+        numbers: list[int] = []
+        hexdigests: list[str] = []
+        path = self._path(part, "in")
+        with open(path, encoding="ascii") as records:
+            for record in records:
+                number, _, hexdig = record.rstrip("\n").partition(",")
+                numbers.append(int(number))
+                hexdigests.append(hexdig)
+        os.remove(path)
+        return numbers, hexdigests
+
+    def write_counts(self, part: int, numbers: list[int],
+                     counts: list[int]) -> None:
+        """Saves a partition's results."""
+        with open(self._path(part, "out"), "w", encoding="ascii") as out:
+            out.writelines(f"{number},{count}\n"
+                           for number, count in zip(numbers, counts))
+
+    def results(self) -> Iterator[tuple[int, int]]:
+        """Yields every saved (line, count) result in line order."""
+        with ExitStack() as stack:
+            streams = []
+            for part in range(PARTITIONS):
+                path = self._path(part, "out")
+                if os.path.exists(path):
+                    rows = stack.enter_context(open(path, encoding="ascii"))
+                    streams.append(_parse_counts(rows))
+            yield from heapq.merge(*streams)
+
+    def close(self) -> None:
+        """Deletes the temporary files."""
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+        self.directory.cleanup()
+
+
+def _parse_counts(rows: Iterable[str]) -> Iterator[tuple[int, int]]:
+    """Parses the "line,count" rows of a partition's results."""
+    for row in rows:
+        number, _, count = row.rstrip("\n").partition(",")
+        yield int(number), int(count)
+
+
+def export_counts(rows: Iterable[tuple[int, int]]) -> bytes:
+    """
+    Serialises password audit results into a gzip-compressed CSV file.
+
+    Args:
+        rows (Iterable[tuple[int, int]]): (line, count) results.
+
+    Returns:
+        bytes: The compressed file contents.
+    """
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb") as gz_file:
+        text = io.TextIOWrapper(gz_file, encoding="utf-8", newline="")
+        writer = csv.writer(text)
+        writer.writerow(["line", "count"])
+        writer.writerows(rows)
+        text.flush()
+        text.detach()
+    return buffer.getvalue()
+
+
+async def audit_passwords(engine: PasswordEngine,
+                          lines: AsyncIterator[str],
+                          executor: Executor | None = None,
+                          chunk_size: int = 50000,
+                          progress: ProgressCallback | None = None
+                          ) -> tuple[bytes, PasswordAuditSummary]:
+    """
+    Counts how often each password or hash of a list has been pwned.
+
+    The input is read `chunk_size` lines at a time and each chunk is
+    hashed in `executor`. An input of a single chunk is looked up at
+    once. A longer one is first spilled to temporary files partitioned
+    by hash prefix, and then looked up one partition at a time, so every
+    range is fetched once however long the file is and memory stays
+    bounded. The output is a gzip-compressed CSV of "line,count" rows,
+    one per non-empty input line in input order; the passwords
+    themselves are never written out.
+
+    Args:
+        engine (PasswordEngine): The password engine to query.
+        lines (AsyncIterator[str]): The passwords or SHA-1 hashes.
+        executor (Executor | None): Where to hash, e.g. a process pool.
+        chunk_size (int): Lines processed per chunk.
+        progress (ProgressCallback | None): Awaited with (done, 0) as
+            lines are read, then with (done, total) as roughly every
+            `chunk_size` lines are looked up.
+
+    Returns:
+        tuple[bytes, PasswordAuditSummary]: The compressed results file
+            and the audit totals.
+
+    Raises:
+        RateLimitError: If a remote request stayed rate limited.
+        RequestException: If the input or a range could not be fetched.
+        ValueError: If the input could not be read.
+    """
+    loop = asyncio.get_running_loop()
+    totals = [0, 0, 0]
+
+    def tally(counts: list[int]) -> None:
+        totals[1] += sum(1 for count in counts if count)
+        totals[2] = max([totals[2], *counts])
+
+    partitions: _Partitions | None = None
+    numbers: list[int] = []
+    chunk: list[str] = []
+    line_number = 0
+    try:
+        async for line in lines:
+            line_number += 1
+            if not line:
+                continue
+            numbers.append(line_number)
+            chunk.append(line)
+            totals[0] += 1
+            if len(chunk) >= chunk_size:
+                if partitions is None:
+                    partitions = _Partitions()
+                hexdigests = await loop.run_in_executor(executor, hash_lines,
+                                                        chunk)
+                await asyncio.to_thread(partitions.add, numbers, hexdigests)
+                numbers, chunk = [], []
+                if progress is not None:
+                    await progress(totals[0], 0)
+        hexdigests = (await loop.run_in_executor(executor, hash_lines, chunk)
+                      if chunk else [])
+        if partitions is None:
+            counts = await engine.count_hashes(hexdigests)
+            tally(counts)
+            data = export_counts(zip(numbers, counts))
+            return data, PasswordAuditSummary(*totals)
+
+        await asyncio.to_thread(partitions.add, numbers, hexdigests)
+        done = reported = 0
+        for part in range(PARTITIONS):
+            numbers, hexdigests = await asyncio.to_thread(partitions.read,
+                                                          part)
+            if not hexdigests:
+                continue
+            counts = await engine.count_hashes(hexdigests)
+            tally(counts)
+            await asyncio.to_thread(partitions.write_counts, part, numbers,
+                                    counts)
+            done += len(counts)
+            if progress is not None and done - reported >= chunk_size:
+                reported = done
+                await progress(done, totals[0])
+        data = await asyncio.to_thread(export_counts, partitions.results())
+        return data, PasswordAuditSummary(*totals)
+    finally:
+        if partitions is not None:
+            partitions.close()
@@ -0,0 +1,236 @@
+"""
+Local stand-in for the haveibeenpwned.com and Pwned Passwords APIs.
+
+Serves synthetic but well-formed responses for every endpoint pwnedBot
+uses, with configurable latency, payload sizes and 429 injection, so
+benchmarks never touch the real service.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import io
+import json
+import random
+import socket
+from collections import Counter
+from typing import Any, NamedTuple
+from aiohttp import web
+from PIL import Image
+
+
+class FakeSettings(NamedTuple):
+    """Shape of the fake service's responses."""
+    latency: float = 0.05
+    breaches: int = 20
+    pastes: int = 20
+    catalog: int = 800
+    range_size: int = 800
+    rate_limit_ratio: float = 0.0
+    retry_after: float = 1.0
+    seed: int = 1
+    domain_aliases: int = 20000
+
+
+def breach(index: int, base_url: str) -> dict[str, Any]:
+    """Returns a synthetic breach shaped like the HIBP breach model."""
+    name = f"Breach{index:05d}"
+    return {
+        "Name": name,
+        "Title": f"Breach {index}",
+        "Domain": f"breach{index}.example.com",
+        "BreachDate": "2019-01-01",
+        "AddedDate": "2019-02-01T00:00:00Z",
+        "ModifiedDate": "2019-02-01T00:00:00Z",
+        "PwnCount": 1000 + index,
+        "Description": (f"In 2019, <a href=\"https://{name}.example.com/"
+                        "news\" target=\"_blank\">the site</a> suffered a "
+                        "breach exposing &quot;email addresses&quot; and "
+                        "<em>passwords</em>."),
+        "LogoPath": f"{base_url}logos/{name}.png",
+        "DataClasses": ["Email addresses", "Passwords"],
+        "IsVerified": True,
+        "IsFabricated": False,
+        "IsSensitive": False,
+        "IsRetired": False,
+        "IsSpamList": False,
+        "IsMalware": False,
+    }
+
+
+class FakeHIBP:
+    """
+    aiohttp application emulating the HIBP endpoints.
+
+    Every response is delayed by `latency` seconds, and a fraction
+    `rate_limit_ratio` of API requests is answered with a 429 carrying a
+    Retry-After header. Requests are counted per endpoint in `hits`.
+    Bump `revision` after changing the catalog to change its ETag.
+    """
+
+    def __init__(self, settings: FakeSettings) -> None:
+        self.settings = settings
+        self.random = random.Random(settings.seed)
+        self.hits: Counter[str] = Counter()
+        self.base_url = ""
+        self.runner: web.AppRunner | None = None
+        self._catalog: list[dict[str, Any]] = []
+        self.revision = 1
+        self._logo = b""
+
+    @property
+    def api_url(self) -> str:
+        """Base URL to use as HIBP_API_URL."""
+        return f"{self.base_url}api/v3/"
+
+    @property
+    def range_url(self) -> str:
+        """Base URL to use as HIBP_RANGE_URL."""
+        return f"{self.base_url}range/"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        """Starts serving; port 0 picks a free port."""
+        app = web.Application()
+        app.router.add_get("/api/v3/breachedaccount/{account}",
+                           self.breached_account)
+        app.router.add_get("/api/v3/breaches", self.breaches)
+        app.router.add_get("/api/v3/breach/{name}", self.single_breach)
+        app.router.add_get("/api/v3/latestbreach", self.latest_breach)
+        app.router.add_get("/api/v3/pasteaccount/{account}", self.pastes)
+        app.router.add_get("/api/v3/breacheddomain/{domain}",
+                           self.breached_domain)
+        app.router.add_get("/range/{prefix}", self.range)
+        app.router.add_get("/logos/{name}", self.logo)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        sock = socket.socket()
+        sock.bind((host, port))
+        await web.SockSite(self.runner, sock).start()
+        self.base_url = f"http://{host}:{sock.getsockname()[1]}/"
+        self._catalog = [breach(i, self.base_url)
+                         for i in range(self.settings.catalog)]
+        buffer = io.BytesIO()
+        Image.new("RGBA", (400, 400), (200, 30, 30, 255)).save(buffer, "PNG")
+        self._logo = buffer.getvalue()
+
+    async def stop(self) -> None:
+        """Stops serving."""
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def _delay(self, endpoint: str) -> web.Response | None:
+        """Applies latency and 429 injection to an API request."""
+        self.hits[endpoint] += 1
+        await asyncio.sleep(self.settings.latency)
+        if self.random.random() < self.settings.rate_limit_ratio:
+            self.hits["429"] += 1
+            return web.Response(
+                status=429,
+                headers={"Retry-After": str(self.settings.retry_after)})
+        return None
+
+    async def breached_account(self, request: web.Request) -> web.Response:
+        limited = await self._delay("breachedaccount")
+        if limited is not None:
+            return limited
+        if request.match_info["account"].startswith("clean"):
+            return web.Response(status=404)
+        count = min(self.settings.breaches, len(self._catalog))
+        if request.query.get("truncateResponse") == "false":
+            return web.json_response(self._catalog[:count])
+        return web.json_response([{"Name": b["Name"]}
+                                  for b in self._catalog[:count]])
+
+    async def breaches(self, request: web.Request) -> web.Response:
+        limited = await self._delay("breaches")
+        if limited is not None:
+            return limited
+        etag = f'"catalog-{self.revision}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304)
+        return web.json_response(self._catalog, headers={"ETag": etag})
+
+    async def single_breach(self, request: web.Request) -> web.Response:
+        limited = await self._delay("breach")
+        if limited is not None:
+            return limited
+        name = request.match_info["name"].lower()
+        for item in self._catalog:
+            if str(item["Name"]).lower() == name:
+                return web.json_response(item)
+        return web.Response(status=404)
+
+    async def latest_breach(self, _: web.Request) -> web.Response:
+        limited = await self._delay("latestbreach")
+        if limited is not None:
+            return limited
+        return web.json_response(self._catalog[-1])
+
+    async def pastes(self, request: web.Request) -> web.Response:
+        limited = await self._delay("pasteaccount")
+        if limited is not None:
+            return limited
+        if request.match_info["account"].startswith("clean"):
+            return web.Response(status=404)
+        return web.json_response([{
+            "Source": "Pastebin",
+            "Id": f"paste{i}",
+            "Title": f"Paste {i}",
+            "Date": "2019-01-01T00:00:00Z",
+            "EmailCount": 100 + i,
+        } for i in range(self.settings.pastes)])
+
+    async def breached_domain(self,
+                              request: web.Request) -> web.StreamResponse:
+        limited = await self._delay("breacheddomain")
+        if limited is not None:
+            return limited
+        if request.match_info["domain"].startswith("clean"):
+            return web.Response(status=404)
+        names = [str(b["Name"]) for b in self._catalog] or ["Breach"]
+        resp = web.StreamResponse(
+            headers={"Content-Type": "application/json"})
+        await resp.prepare(request)
+        await resp.write(b"{")
+        for start in range(0, self.settings.domain_aliases, 1000):
+            members = []
+            for i in range(start, min(start + 1000,
+                                      self.settings.domain_aliases)):
+                breaches = [names[(i * 7 + k * 13) % len(names)]
+                            for k in range(1 + i % 3)]
+                members.append(f'"alias{i}":{json.dumps(breaches)}')
+            await resp.write(("," if start else "").encode() +
+                             ",".join(members).encode())
+        await resp.write(b"}")
+        await resp.write_eof()
+        return resp
+
+    async def range(self, request: web.Request) -> web.Response:
+        self.hits["range"] += 1
+        await asyncio.sleep(self.settings.latency)
+        prefix = request.match_info["prefix"].upper()
+        suffixes = sorted(
+            hashlib.sha1(f"{prefix}{i}".encode()).hexdigest().upper()[5:]
+            for i in range(self.settings.range_size))
+        # Make "password" and "password1" appear in their ranges
+        for known in ("password", "password1"):
+            digest = hashlib.sha1(known.encode()).hexdigest().upper()
+            if digest.startswith(prefix):
+                suffixes.append(digest[5:])
+        body = "\r\n".join(f"{suffix}:{index + 1}"
+                           for index, suffix in enumerate(sorted(suffixes)))
+        return web.Response(text=body)
+
+    async def logo(self, request: web.Request) -> web.Response:
+        self.hits["logo"] += 1
+        if "hibp-api-key" in request.headers:
+            # Logos live on other hosts, which must never see the key
+            self.hits["logo_with_api_key"] += 1
+        await asyncio.sleep(self.settings.latency)
+        return web.Response(body=self._logo, content_type="image/png")
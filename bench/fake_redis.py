@@ -0,0 +1,151 @@
+"""
+Local Redis-compatible stand-in for the shared cache backend.
+
+Speaks enough of the RESP protocol for pwnedBot's RedisBackend (PING,
+AUTH, SELECT, GET, MGET, SET with EX/PX, DEL, SCAN with MATCH, DBSIZE and
+FLUSHDB), keeps everything in memory and counts the commands it receives,
+so the shared cache can be tried without a Redis server:
+
+    python bench/fake_redis.py --port 6379
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import fnmatch
+import time
+from collections import Counter
+
+
+def bulk(value: bytes | None) -> bytes:
+    """Encodes a RESP bulk string, or the null bulk string."""
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%b\r\n" % (len(value), value)
+
+
+class FakeRedis:
+    """
+    In-memory server answering the commands RedisBackend sends.
+
+    Commands are counted by name in `commands`.
+    """
+
+    def __init__(self) -> None:
+        self.data: dict[bytes, tuple[float, bytes]] = {}
+        self.commands: Counter[str] = Counter()
+        self.port = 0
+        self.server: asyncio.Server | None = None
+
+    @property
+    def url(self) -> str:
+        """URL to use as CACHE_URL."""
+        return f"redis://127.0.0.1:{self.port}/0"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        """Starts serving; port 0 picks a free port."""
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        """Stops serving."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def _live(self, key: bytes) -> bytes | None:
+        """Returns an unexpired value."""
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[0] and entry[0] <= time.time():
+            del self.data[key]
+            return None
+        return entry[1]
+
+    def execute(self, args: list[bytes]) -> bytes:
+        """Runs one command and returns its encoded reply."""
+        name = args[0].upper().decode()
+        self.commands[name] += 1
+        if name in ("PING", "AUTH", "SELECT", "FLUSHDB"):
+            if name == "FLUSHDB":
+                self.data.clear()
+            return b"+PONG\r\n" if name == "PING" else b"+OK\r\n"
+        if name == "GET":
+            return bulk(self._live(args[1]))
+        if name == "MGET":
+            values = [bulk(self._live(key)) for key in args[1:]]
+            return b"*%d\r\n" % len(values) + b"".join(values)
+        if name == "SET":
+            expires = 0.0
+            options = [arg.upper() for arg in args[3:]]
+            if b"PX" in options:
+                expires = time.time() + int(
+                    args[4 + options.index(b"PX")]) / 1000
+            elif b"EX" in options:
+                expires = time.time() + int(args[4 + options.index(b"EX")])
+            self.data[args[1]] = (expires, args[2])
+            return b"+OK\r\n"
+        if name == "DEL":
+            removed = sum(self.data.pop(key, None) is not None
+                          for key in args[1:])
+            return b":%d\r\n" % removed
+        if name == "SCAN":
+            # Everything in one step; COUNT is only a hint to Redis too
+            options = [arg.upper() for arg in args[2:]]
+            pattern = (args[3 + options.index(b"MATCH")].decode("latin-1")
+                       if b"MATCH" in options else "*")
+            keys = [bulk(key) for key in list(self.data)
+                    if self._live(key) is not None and
+                    fnmatch.fnmatchcase(key.decode("latin-1"), pattern)]
+            return (b"*2\r\n" + bulk(b"0") +
+                    b"*%d\r\n" % len(keys) + b"".join(keys))
+        if name == "DBSIZE":
+            return b":%d\r\n" % len(self.data)
+        return b"-ERR unknown command '%b'\r\n" % args[0]
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        """Serves one client connection."""
+        try:
+            while True:
+                writer.write(self.execute(await self._read_command(reader)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> list[bytes]:
+        """Reads one command sent as a RESP array of bulk strings."""
+        header = await reader.readexactly(1)
+        count = int((await reader.readuntil(b"\r\n"))[:-2])
+        if header != b"*":
+            raise ConnectionError("Expected a RESP array")
+        args = []
+        for _ in range(count):
+            await reader.readuntil(b"$")
+            length = int((await reader.readuntil(b"\r\n"))[:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+
+async def serve(port: int) -> None:
+    """Serves until interrupted."""
+    server = FakeRedis()
+    await server.start(port=port)
+    print(f"Serving on {server.url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Redis server")
+    parser.add_argument("--port", type=int, default=6379)
+    asyncio.run(serve(parser.parse_args().port))
@@ -0,0 +1,370 @@
+"""
+Reproducible pwnedBot benchmark.
+
+Starts a local fake HIBP server, imports the real bot module against it
+and runs the real command functions through a recording fake Discord
+context. Nothing is sent to Discord or haveibeenpwned.com.
+
+For each command it reports commands per second, p50/p99 latency and
+the messages sent per command, e.g.:
+
+    python bench/run_bench.py --iterations 200 --concurrency 20
+
+`--slash` runs the commands as slash commands, following discord.py's
+hybrid command error handling, and `--users` shares the invocations
+between fewer users so admission control queues and rejects them. The
+"held" column counts admission slots still held after a command's runs;
+anything but 0 is a leak and fails the run:
+
+    python bench/run_bench.py --slash --users 1 --commands breaches
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import statistics
+import sys
+import time
+from types import ModuleType, SimpleNamespace
+from typing import Any, NamedTuple
+from discord.ext import commands
+from fake_hibp import FakeHIBP, FakeSettings
+from fake_redis import FakeRedis
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Command name and a function building its arguments from the iteration
+COMMANDS: dict[str, Any] = {
+    "password": lambda i, unique: [f"password{i}" if unique else "password"],
+    "search": lambda i, unique: [f"user{i if unique else 0}@example.com"],
+    "breaches": lambda i, unique: [],
+    "breach_name": lambda i, unique: [f"Breach{i % 100 if unique else 0:05d}"],
+    "pastes": lambda i, unique: [f"user{i if unique else 0}@example.com"],
+    "paste_id": lambda i, unique: [f"user{i if unique else 0}@example.com",
+                                   "paste1"],
+    "domain_search": lambda i, unique: [f"example{i if unique else 0}.com",
+                                        "csv"],
+}
+
+
+class FakeMessage:
+    """A sent message; edits are recorded on the owning context."""
+
+    def __init__(self, ctx: FakeContext, message_id: int) -> None:
+        self.ctx = ctx
+        self.id = message_id
+        self.attachments: list[Any] = []
+
+    async def edit(self, **_: Any) -> FakeMessage:
+        self.ctx.edits += 1
+        return self
+
+
+class FakeResponse:
+    """An interaction response, which may only be sent once."""
+
+    def __init__(self) -> None:
+        self.done = False
+
+    def is_done(self) -> bool:
+        """Whether the interaction was acknowledged."""
+        return self.done
+
+    async def defer(self, **_: Any) -> None:
+        """Acknowledges the interaction, failing as discord.py does if
+        it already was."""
+        if self.done:
+            raise RuntimeError("This interaction has already been "
+                               "responded to before")
+        self.done = True
+
+
+class FakeContext:
+    """
+    Stands in for commands.Context, recording what a command sends.
+
+    Only the attributes pwnedBot's commands and hooks use are provided.
+    """
+
+    def __init__(self, command: Any, user_id: int, guild_id: int,
+                 slash: bool = False) -> None:
+        self.command = command
+        self.cog = None
+        self.command_failed = False
+        self.author = SimpleNamespace(id=user_id)
+        self.guild = SimpleNamespace(id=guild_id,
+                                     filesize_limit=8 * 1024 * 1024)
+        self.message = FakeMessage(self, 0)
+        self.interaction = (SimpleNamespace(response=FakeResponse())
+                            if slash else None)
+        self.messages = 0
+        self.embeds = 0
+        self.files = 0
+        self.edits = 0
+
+    async def send(self, content: str | None = None, **kwargs: Any
+                   ) -> FakeMessage:
+        self.messages += 1
+        embeds = kwargs.get("embeds") or []
+        self.embeds += len(embeds) + (1 if kwargs.get("embed") else 0)
+        self.files += len(kwargs.get("files") or [])
+        return FakeMessage(self, self.messages)
+
+    async def defer(self, **kwargs: Any) -> None:
+        if self.interaction is not None:
+            await self.interaction.response.defer(**kwargs)
+
+
+class Result(NamedTuple):
+    """Benchmark results of one command."""
+    command: str
+    runs: int
+    errors: int
+    per_second: float
+    p50_ms: float
+    p99_ms: float
+    messages: float
+    embeds: float
+    edits: float
+    held: int
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Returns the nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+async def invoke(bot_module: ModuleType, name: str, args: list[str],
+                 user_id: int, slash: bool = False) -> FakeContext:
+    """
+    Runs one command with the bot's own hooks and error handler.
+
+    As in discord.py, a failing before hook skips the after hook, and a
+    failing slash command skips it too.
+    """
+    command = bot_module.bot.get_command(name)
+    ctx = FakeContext(command, user_id, guild_id=user_id % 10, slash=slash)
+    try:
+        await bot_module.before_command(ctx)
+    except commands.CommandError as exc:
+        # Shed by admission control
+        ctx.command_failed = True
+        await bot_module.on_command_error(ctx, exc)
+        return ctx
+    error: commands.CommandError | None = None
+    try:
+        # Passed by name, as some commands take keyword-only arguments
+        await command.callback(ctx, **dict(zip(command.clean_params, args)))
+    except Exception as exc:  # pylint: disable=broad-except
+        ctx.command_failed = True
+        error = (exc if isinstance(exc, commands.CommandError)
+                 else commands.CommandInvokeError(exc))
+    if error is None or not slash:
+        await bot_module.after_command(ctx)
+    if error is not None:
+        await bot_module.on_command_error(ctx, error)
+    return ctx
+
+
+async def run_command(bot_module: ModuleType, name: str, iterations: int,
+                      concurrency: int, unique: bool, users: int = 0,
+                      slash: bool = False) -> Result:
+    """
+    Runs a command `iterations` times with `concurrency` in flight.
+
+    Args:
+        bot_module (ModuleType): The imported pwned_bot module.
+        name (str): The command to run.
+        iterations (int): Number of invocations.
+        concurrency (int): Maximum concurrent invocations.
+        unique (bool): Whether each invocation uses distinct arguments,
+            defeating the bot's caches.
+        users (int): Number of users invoking it; 0 for one per
+            invocation.
+        slash (bool): Whether to invoke it as a slash command.
+
+    Returns:
+        Result: The command's throughput, latency and message counts.
+    """
+    latencies: list[float] = []
+    contexts: list[FakeContext] = []
+    next_index = 0
+
+    async def worker() -> None:
+        nonlocal next_index
+        while next_index < iterations:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            ctx = await invoke(bot_module, name,
+                               COMMANDS[name](index, unique),
+                               index % users if users else index, slash)
+            latencies.append(time.perf_counter() - started)
+            contexts.append(ctx)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return Result(
+        command=name,
+        runs=iterations,
+        errors=sum(1 for ctx in contexts if ctx.command_failed),
+        per_second=iterations / elapsed if elapsed else 0.0,
+        p50_ms=percentile(latencies, 0.50) * 1000,
+        p99_ms=percentile(latencies, 0.99) * 1000,
+        messages=statistics.fmean(ctx.messages for ctx in contexts),
+        embeds=statistics.fmean(ctx.embeds for ctx in contexts),
+        edits=statistics.fmean(ctx.edits for ctx in contexts),
+        held=bot_module.admission.active,
+    )
+
+
+def import_bot(server: FakeHIBP, rate_limit: float,
+               cache_url: str | None) -> ModuleType:
+    """Imports pwned_bot configured to talk to the fake servers."""
+    env = {
+        "HIBP_API_KEY": "bench",
+        "APP_NAME": "pwnedBot-bench",
+        "DISCORD_TOKEN": "bench",
+        "DISCORD_CLIENT_ID": "0",
+        "BOT_PREFIX": "!",
+        "HIBP_API_URL": server.api_url,
+        "HIBP_RANGE_URL": server.range_url,
+        "HIBP_RATE_LIMIT": str(rate_limit),
+        "HIBP_RATE_BURST": str(max(1, int(rate_limit // 60))),
+        "PASSWORD_MODE": "remote",
+    }
+    if cache_url:
+        env["CACHE_URL"] = cache_url
+    os.environ.update(env)
+    os.chdir(ROOT)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return importlib.import_module("pwned_bot")
+
+
+def print_table(results: list[Result]) -> None:
+    """Prints results as an aligned table."""
+    header = (f"{'command':<12} {'runs':>6} {'errors':>6} {'cmd/s':>9} "
+              f"{'p50 ms':>9} {'p99 ms':>9} {'msgs':>6} {'embeds':>7} "
+              f"{'edits':>6} {'held':>5}")
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        print(f"{row.command:<12} {row.runs:>6} {row.errors:>6} "
+              f"{row.per_second:>9.1f} {row.p50_ms:>9.2f} "
+              f"{row.p99_ms:>9.2f} {row.messages:>6.2f} "
+              f"{row.embeds:>7.2f} {row.edits:>6.2f} {row.held:>5}")
+
+
+async def run(options: argparse.Namespace) -> list[Result]:
+    """Starts the fake server and benchmarks each selected command."""
+    server = FakeHIBP(FakeSettings(
+        latency=options.latency,
+        breaches=options.breaches,
+        pastes=options.pastes,
+        catalog=options.catalog,
+        range_size=options.range_size,
+        rate_limit_ratio=options.rate_limit_ratio,
+        retry_after=options.retry_after,
+        seed=options.seed,
+        domain_aliases=options.domain_aliases,
+    ))
+    await server.start()
+    redis = None
+    cache_url = "memory://" if options.cache == "memory" else None
+    if options.cache == "redis":
+        redis = FakeRedis()
+        await redis.start()
+        cache_url = redis.url
+    bot_module = import_bot(server, options.rate_limit, cache_url)
+    results = []
+    try:
+        async with bot_module.hibp, bot_module.logos:
+            for name in options.commands:
+                results.append(await run_command(
+                    bot_module, name, options.iterations,
+                    options.concurrency, options.unique, options.users,
+                    options.slash))
+    finally:
+        if bot_module.hash_pool is not None:
+            bot_module.hash_pool.shutdown(cancel_futures=True)
+        if bot_module.backend is not None:
+            await bot_module.backend.close()
+        await server.stop()
+        if redis is not None:
+            await redis.stop()
+    if options.verbose:
+        print(f"HIBP requests: {dict(server.hits)}", file=sys.stderr)
+        if redis is not None:
+            print(f"Redis commands: {dict(redis.commands)}", file=sys.stderr)
+    return results
+
+
+def main() -> None:
+    """Parses the command line and runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1],
+                                     formatter_class=argparse
+                                     .RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", nargs="+", choices=list(COMMANDS),
+                        default=list(COMMANDS))
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--unique", action="store_true",
+                        help="use distinct arguments to defeat caches")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="fake HIBP latency in seconds")
+    parser.add_argument("--breaches", type=int, default=20,
+                        help="breaches per account")
+    parser.add_argument("--pastes", type=int, default=20,
+                        help="pastes per account")
+    parser.add_argument("--catalog", type=int, default=800,
+                        help="breaches in the full catalog")
+    parser.add_argument("--range-size", type=int, default=800,
+                        help="hash suffixes per password range")
+    parser.add_argument("--domain-aliases", type=int, default=20000,
+                        help="breached addresses per domain search")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0,
+                        help="fraction of API requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0,
+                        help="Retry-After seconds sent with a 429")
+    parser.add_argument("--rate-limit", type=float, default=600000.0,
+                        help="bot HIBP_RATE_LIMIT in requests per minute")
+    parser.add_argument("--cache", choices=("none", "memory", "redis"),
+                        default="none",
+                        help="cache backend; redis starts a fake server")
+    parser.add_argument("--users", type=int, default=0,
+                        help="users sharing the invocations; 0 for one "
+                        "per invocation")
+    parser.add_argument("--slash", action="store_true",
+                        help="invoke the commands as slash commands")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true",
+                        help="print results as JSON")
+    parser.add_argument("--verbose", action="store_true",
+                        help="print fake server request counts")
+    options = parser.parse_args()
+    results = asyncio.run(run(options))
+    if options.json:
+        print(json.dumps([row._asdict() for row in results], indent=2))
+    else:
+        print_table(results)
+    if any(row.held for row in results):
+        sys.exit("Admission slots were leaked")
+
+
+if __name__ == "__main__":
+    main()
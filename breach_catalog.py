@@ -0,0 +1,235 @@
+"""
+In-process cache of the haveibeenpwned.com breach catalog.
+
+The full catalog is loaded once at startup and refreshed in the
+background with conditional (ETag) requests, so the `breaches` and
+`breach_name` commands are answered from memory and HIBP sees roughly
+one catalog request per refresh interval regardless of command volume.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import time
+from collections.abc import Callable
+from typing import Any
+from requests.exceptions import RequestException
+from breach_index import BreachIndex
+from cache_backend import CacheBackend, dumps, loads
+from hibp_client import HIBPClient, ReturnAlias, SingleFlight
+
+# Seconds a saved catalog may be used after a restart; it is revalidated
+# with its ETag as soon as the bot starts
+SAVED_TTL = 7 * 86400.0
+
+
+class BreachCatalog:
+    """
+    Name-indexed breach catalog kept fresh by a background task.
+
+    Until the first load succeeds, lookups fetch the catalog on demand
+    and concurrent callers wait for the same request. A failed refresh
+    keeps serving the previous catalog. With a cache backend, the catalog
+    and its ETag are saved after each change and restored on startup.
+
+    Every callable in `listeners` is called with the new breach list
+    whenever the catalog is loaded or changes.
+    """
+
+    def __init__(self, client: HIBPClient, ttl: float = 3600.0,
+                 backend: CacheBackend | None = None) -> None:
+        self.client = client
+        self.ttl = ttl
+        self.backend = backend
+        self.breaches: list[dict[str, Any]] = []
+        self.by_name: dict[str, dict[str, Any]] = {}
+        self.index = BreachIndex()
+        self.listeners: list[Callable[[list[dict[str, Any]]], None]] = []
+        self.etag: str | None = None
+        self.loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self._first_load: SingleFlight[int | None] = SingleFlight()
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def loaded(self) -> bool:
+        """Whether a catalog has been loaded."""
+        return self.loaded_at > 0
+
+    def _index(self, breaches: list[dict[str, Any]]) -> None:
+        """Replaces the catalog and rebuilds the name and search
+        indexes."""
+        self.breaches = breaches
+        self.by_name = {str(b["Name"]).lower(): b for b in breaches}
+        self.index = BreachIndex(breaches)
+        for listener in self.listeners:
+            listener(breaches)
+
+    async def refresh(self) -> int:
+        """
+        Fetches the catalog if it has changed since the last load.
+
+        Returns:
+            int: The HTTP status code of the catalog request; 304 when
+                the cached catalog is still current.
+
+        Raises:
+            RequestException: If the request could not be completed.
+        """
+        async with self._lock:
+            headers = {"If-None-Match": self.etag} if self.etag else None
+            # The catalog needs no API key, so it skips the key's rate
+            # limit and never delays users' lookups
+            resp = await self.client.request(self.client.api_url +
+                                             "breaches",
+                                             headers=headers, limited=False)
+            if resp.status == 200:
+                data = json.loads(resp.body)
+                if isinstance(data, list):
+                    self._index(data)
+                    self.etag = resp.headers.get("ETag")
+                    if self.backend is not None:
+                        self.backend.put("catalog", "breaches",
+                                         dumps([self.etag, data]), SAVED_TTL)
+            if resp.status in (200, 304):
+                self.loaded_at = time.monotonic()
+            return resp.status
+
+    async def restore(self) -> bool:
+        """
+        Loads the catalog saved by a previous run, if there is one.
+
+        Returns:
+            bool: Whether a saved catalog was loaded.
+        """
+        if self.backend is None:
+            return False
+        saved = await self.backend.get("catalog", "breaches")
+        if saved is None:
+            return False
+        try:
+            etag, data = loads(saved)
+        except (TypeError, ValueError):
+            return False
+        if not isinstance(data, list):
+            return False
+        self._index(data)
+        self.etag = etag or None
+        self.loaded_at = time.monotonic()
+        return True
+
+    async def _ensure_loaded(self) -> int | None:
+        """Loads the catalog on demand, returning a failure status."""
+        if self.loaded:
+            return None
+        return await self._first_load.do("catalog", self._load)
+
+    async def _load(self) -> int | None:
+        """Restores or fetches the catalog, returning a failure status."""
+        async with self._lock:
+            if self.loaded or await self.restore():
+                return None
+        status = await self.refresh()
+        return None if self.loaded else status
+
+    async def _run(self) -> None:
+        """Refreshes the catalog every `ttl` seconds."""
+        if not self.loaded:
+            async with self._lock:
+                await self.restore()
+        while True:
+            try:
+                status = await self.refresh()
+                if status not in (200, 304):
+                    print(f"Breach catalog refresh returned {status}")
+            except RequestException as exc:
+                print(f"Breach catalog refresh failed: {exc}")
+            await asyncio.sleep(self.ttl if self.loaded else 60.0)
+
+    def start(self) -> None:
+        """Starts the background refresh task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the background refresh task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def all_breaches(self) -> ReturnAlias:
+        """
+        Returns every breached site in the system.
+
+        Returns:
+            ReturnAlias: The breach list or the HTTP status code of a
+                failed initial load.
+        """
+        status = await self._ensure_loaded()
+        if status is not None:
+            return status
+        return self.breaches
+
+    async def single_breach(self, name: str) -> ReturnAlias:
+        """
+        Returns a single breach by its name, title or domain.
+
+        Case, spacing and punctuation are ignored, so "linked in" and
+        "linkedin.com" both find the LinkedIn breach.
+
+        Args:
+            name (str): The breach name, title or domain.
+
+        Returns:
+            ReturnAlias: A one item list holding a copy of the breach, 404
+                if it is not in the catalog, or the HTTP status code of a
+                failed initial load.
+        """
+        status = await self._ensure_loaded()
+        if status is not None:
+            return status
+        breach = self.by_name.get(name.lower())
+        if breach is None:
+            match = self.index.resolve(name)
+            breach = self.by_name.get(match.lower()) if match else None
+        if breach is None:
+            return 404
+        return [dict(breach)]
+
+    def suggest(self, name: str, limit: int = 5) -> list[str]:
+        """
+        Returns the names of the breaches most similar to a misspelt one.
+
+        Args:
+            name (str): The breach name, title or domain that was not found.
+            limit (int): Maximum number of suggestions.
+
+        Returns:
+            list[str]: Breach names, most similar first; empty until the
+                catalog has loaded.
+        """
+        return self.index.suggest(name, limit)
+
+    def complete(self, prefix: str, limit: int = 25) -> list[str]:
+        """
+        Returns the names of breaches matching a partly typed name, title
+        or domain, for autocompletion.
+
+        Args:
+            prefix (str): What has been typed so far.
+            limit (int): Maximum number of names.
+
+        Returns:
+            list[str]: Breach names; empty until the catalog has loaded.
+        """
+        return self.index.complete(prefix, limit)
@@ -0,0 +1,269 @@
+"""
+New and updated breach alerts for subscribed Discord channels.
+
+A background watcher polls HIBP's latest breach endpoint, which returns
+a single small object, and only refreshes the full catalog when that
+breach is not yet in it. Whenever the catalog changes, whether through
+the watcher or the catalog's own periodic refresh, it is diffed against
+the previous one by breach name and ModifiedDate and only the new and
+updated breaches are posted to the subscribed channels.
+
+Subscriptions are kept in a small SQLite database, so they survive
+restarts and can be shared by the processes of a sharded bot; each
+process only posts to the channels it can see.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import asyncio
+import sqlite3
+from typing import Any
+import discord
+from requests.exceptions import RequestException
+from breach_catalog import BreachCatalog
+from breach_render import cleanhtml
+from delivery import SOURCE_FOOTER, send_batched
+from hibp_client import HIBPClient
+
+# Most breaches posted for a single catalog change; a larger change,
+# such as a bulk reclassification, is summarised instead
+MAX_ALERTS = 20
+
+BREACH_URL = "https://haveibeenpwned.com/PwnedWebsites#"
+
+
+def alert_embed(breach: dict[str, Any], updated: bool) -> discord.Embed:
+    """
+    Builds the alert embed of a new or updated breach.
+
+    Args:
+        breach (dict[str, Any]): The breach.
+        updated (bool): Whether the breach was updated rather than added.
+
+    Returns:
+        discord.Embed: The alert.
+    """
+    name = str(breach.get("Name"))
+    title = str(breach.get("Title") or name)
+    desc = breach.get("Description")
+    desc = cleanhtml(desc).replace("&quot;", '"') if isinstance(
+        desc, str) else ""
+    embed = discord.Embed(
+        title=f"{'Updated' if updated else 'New'} breach: {title}",
+        url=BREACH_URL + name,
+        description=desc[:1000],
+        color=0xFF8C00 if updated else 0xFF0000)
+    embed.add_field(name="Domain", value=str(breach.get("Domain") or "None"))
+    embed.add_field(name="Breach date", value=str(breach.get("BreachDate")))
+    embed.add_field(name="Accounts", value=f"{breach.get('PwnCount', 0):,}")
+    classes = breach.get("DataClasses")
+    if isinstance(classes, list) and classes:
+        embed.add_field(name="Compromised data",
+                        value=", ".join(map(str, classes))[:1024],
+                        inline=False)
+    return embed
+
+
+class Subscriptions:
+    """SQLite-backed set of subscribed channel IDs."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = asyncio.Lock()
+
+    def _run(self, query: str, args: tuple[int, ...] = ()) -> list[Any]:
+        """Runs one statement in its own connection and transaction."""
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS subscriptions ("
+                           "channel_id INTEGER PRIMARY KEY, "
+                           "guild_id INTEGER NOT NULL)")
+                cursor = db.execute(query, args)
+                return cursor.fetchall() if cursor.description else [
+                    cursor.rowcount]
+        finally:
+            db.close()
+
+    async def _execute(self, query: str,
+                       args: tuple[int, ...] = ()) -> list[Any]:
+        """Runs a statement on a worker thread."""
+        async with self._lock:
+            return await asyncio.to_thread(self._run, query, args)
+
+    async def add(self, channel_id: int, guild_id: int) -> bool:
+        """
+        Subscribes a channel.
+
+        Args:
+            channel_id (int): The channel to post alerts in.
+            guild_id (int): The channel's server.
+
+        Returns:
+            bool: False if the channel was already subscribed.
+        """
+        result = await self._execute(
+            "INSERT OR IGNORE INTO subscriptions VALUES (?, ?)",
+            (channel_id, guild_id))
+        return bool(result[0])
+
+    async def remove(self, channel_id: int) -> bool:
+        """
+        Unsubscribes a channel.
+
+        Args:
+            channel_id (int): The subscribed channel.
+
+        Returns:
+            bool: False if the channel was not subscribed.
+        """
+        result = await self._execute(
+            "DELETE FROM subscriptions WHERE channel_id = ?", (channel_id,))
+        return bool(result[0])
+
+    async def channels(self) -> list[int]:
+        """
+        Returns every subscribed channel.
+
+        Returns:
+            list[int]: The channel IDs.
+        """
+        rows = await self._execute("SELECT channel_id FROM subscriptions")
+        return [row[0] for row in rows]
+
+
+class BreachFeed:
+    """
+    Watches for new and updated breaches and posts them to subscribers.
+
+    Register `on_catalog_change` as a BreachCatalog listener and call
+    `start` to poll the latest breach every `interval` seconds. Alerts
+    for changes seen before the bot is ready, e.g. by the catalog refresh
+    at startup, are held until it is and its channel cache is filled.
+    """
+
+    def __init__(self,
+                 bot: discord.Client,
+                 client: HIBPClient,
+                 catalog: BreachCatalog,
+                 subscriptions: Subscriptions,
+                 interval: float = 300.0) -> None:
+        self.bot = bot
+        self.client = client
+        self.catalog = catalog
+        self.subscriptions = subscriptions
+        self.interval = interval
+        self.known: dict[str, str] | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._posts: set[asyncio.Task[None]] = set()
+
+    def on_catalog_change(self, breaches: list[dict[str, Any]]) -> None:
+        """
+        Diffs a changed catalog against the previous one and posts the
+        new and updated breaches.
+
+        The first catalog seen is only recorded, so a restart does not
+        announce the whole catalog.
+
+        Args:
+            breaches (list[dict[str, Any]]): The new catalog.
+        """
+        current = {str(b.get("Name")): str(b.get("ModifiedDate"))
+                   for b in breaches}
+        known, self.known = self.known, current
+        if known is None:
+            return
+        added, updated = [], []
+        for breach in breaches:
+            name = str(breach.get("Name"))
+            if name not in known:
+                added.append(breach)
+            elif known[name] != current[name]:
+                updated.append(breach)
+        if added or updated:
+            task = asyncio.get_running_loop().create_task(
+                self.post(added, updated))
+            self._posts.add(task)
+            task.add_done_callback(self._posts.discard)
+
+    async def post(self, added: list[dict[str, Any]],
+                   updated: list[dict[str, Any]]) -> None:
+        """
+        Posts alerts to every subscribed channel this process can see,
+        once the bot is ready.
+
+        Args:
+            added (list[dict[str, Any]]): Breaches new to the catalog.
+            updated (list[dict[str, Any]]): Breaches whose ModifiedDate
+                changed.
+        """
+        await self.bot.wait_until_ready()
+        embeds = ([alert_embed(b, False) for b in added] +
+                  [alert_embed(b, True) for b in updated])
+        content = ""
+        if len(embeds) > MAX_ALERTS:
+            content = (f"{len(added)} new and {len(updated)} updated "
+                       f"breaches; showing the first {MAX_ALERTS}.")
+            embeds = embeds[:MAX_ALERTS]
+        for channel_id in await self.subscriptions.channels():
+            channel = self.bot.get_channel(channel_id)
+            if not isinstance(channel, discord.abc.Messageable):
+                continue
+            copies = [embed.copy() for embed in embeds]
+            try:
+                await send_batched(channel, content, copies,
+                                   footer=SOURCE_FOOTER)
+            except discord.NotFound:
+                await self.subscriptions.remove(channel_id)
+            except discord.HTTPException as exc:
+                print(f"Breach alert to {channel_id} failed: {exc}")
+
+    async def check(self) -> None:
+        """
+        Refreshes the catalog if the latest breach is not in it yet.
+
+        Raises:
+            RequestException: If a request could not be completed.
+        """
+        latest = await self.client.latest_breach()
+        if isinstance(latest, int):
+            print(f"Latest breach request returned {latest}")
+            return
+        name = str(latest[0].get("Name"))
+        modified = str(latest[0].get("ModifiedDate"))
+        if self.known is not None and self.known.get(name) == modified:
+            return
+        await self.catalog.refresh()
+
+    async def _run(self) -> None:
+        """Checks for new breaches every `interval` seconds."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except RequestException as exc:
+                print(f"Breach feed check failed: {exc}")
+
+    def start(self) -> None:
+        """Starts the background watcher."""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the background watcher and any alerts still waiting to
+        be posted."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._posts):
+            task.cancel()
+        await asyncio.gather(*self._posts, return_exceptions=True)
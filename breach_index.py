@@ -0,0 +1,157 @@
+"""
+Fuzzy and prefix search over the breach catalog.
+
+Breach names, titles and domains are normalised (lower case, letters
+and digits only) so "linked in", "LinkedIn" and "linkedin.com" all find
+the same breach. Exact and prefix lookups use a sorted key list, and
+typos are matched through a trigram index, so every query is answered
+from memory in microseconds.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import bisect
+import re
+from collections import defaultdict
+from collections.abc import Iterable
+from typing import Any
+
+NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+# Lowest trigram similarity offered as a "did you mean" suggestion
+MIN_SIMILARITY = 0.3
+
+
+def normalize(text: str) -> str:
+    """
+    Returns the search key of a name, title, domain or query.
+
+    Args:
+        text (str): The text to normalise.
+
+    Returns:
+        str: The text in lower case with everything but letters and
+            digits removed.
+    """
+    return NON_ALNUM.sub("", text.lower())
+
+
+def trigrams(key: str) -> set[str]:
+    """
+    Returns the trigrams of a normalised key, padded at both ends.
+
+    Args:
+        key (str): A normalised key.
+
+    Returns:
+        set[str]: The key's trigrams.
+    """
+    padded = f"^{key}$"
+    return {padded[i:i + 3] for i in range(max(1, len(padded) - 2))}
+
+
+class BreachIndex:
+    """
+    Search index over the name, title and domain of every breach.
+
+    Lookups return breach names, which are the catalog's stable keys.
+    The index is immutable; build a new one when the catalog changes.
+    """
+
+    def __init__(self, breaches: Iterable[dict[str, Any]] = ()) -> None:
+        # Exact key -> breach name; names win over titles over domains
+        self.exact: dict[str, str] = {}
+        # Sorted (key, priority, name) tuples for prefix lookups
+        self.keys: list[tuple[str, int, str]] = []
+        self.grams: defaultdict[str, list[int]] = defaultdict(list)
+        self._gram_counts: list[int] = []
+        for breach in breaches:
+            name = str(breach.get("Name", ""))
+            for priority, field in enumerate(("Name", "Title", "Domain")):
+                key = normalize(str(breach.get(field) or ""))
+                if key:
+                    self.exact.setdefault(key, name)
+                    self.keys.append((key, priority, name))
+        self.keys.sort()
+        for position, (key, _, _) in enumerate(self.keys):
+            grams = trigrams(key)
+            self._gram_counts.append(len(grams))
+            for gram in grams:
+                self.grams[gram].append(position)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def resolve(self, query: str) -> str | None:
+        """
+        Returns the breach whose name, title or domain matches a query.
+
+        Args:
+            query (str): The name, title or domain, in any case or
+                spacing.
+
+        Returns:
+            str | None: The breach name, or None if nothing matches
+                exactly.
+        """
+        return self.exact.get(normalize(query))
+
+    def complete(self, prefix: str, limit: int = 25) -> list[str]:
+        """
+        Returns breaches whose name, title or domain starts with a prefix.
+
+        Suitable for autocompletion: matches are returned in key order,
+        with name matches before title and domain matches of the same key.
+
+        Args:
+            prefix (str): What has been typed so far.
+            limit (int): Maximum number of breach names to return.
+
+        Returns:
+            list[str]: Matching breach names.
+        """
+        key = normalize(prefix)
+        names: list[str] = []
+        start = bisect.bisect_left(self.keys, (key,))
+        for candidate, _, name in self.keys[start:]:
+            if len(names) >= limit or not candidate.startswith(key):
+                break
+            if name not in names:
+                names.append(name)
+        return names
+
+    def suggest(self, query: str, limit: int = 5) -> list[str]:
+        """
+        Returns the breaches most similar to a query, for typos.
+
+        Similarity is the Dice coefficient of the trigram sets of the
+        query and each name, title or domain.
+
+        Args:
+            query (str): The misspelt name, title or domain.
+            limit (int): Maximum number of breach names to return.
+
+        Returns:
+            list[str]: Breach names, most similar first.
+        """
+        key = normalize(query)
+        if not key:
+            return []
+        grams = trigrams(key)
+        shared: defaultdict[int, int] = defaultdict(int)
+        for gram in grams:
+            for position in self.grams.get(gram, ()):
+                shared[position] += 1
+        scores: dict[str, float] = {}
+        for position, count in shared.items():
+            score = 2 * count / (len(grams) + self._gram_counts[position])
+            name = self.keys[position][2]
+            if score >= MIN_SIMILARITY and score > scores.get(name, 0.0):
+                scores[name] = score
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [name for name, _ in ranked[:limit]]
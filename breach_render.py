@@ -0,0 +1,120 @@
+"""
+Precomputed `breach_name` output for every breach in the catalog.
+
+A breach's description is static between catalog updates, so its
+sanitised fields, article links and embed payload are rendered once when
+the catalog loads or refreshes and reused by every `breach_name` call. A
+breach is rendered again only when its ModifiedDate changes.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import re
+from collections.abc import Iterable
+from typing import Any, NamedTuple
+import discord
+from discord.types.embed import Embed as EmbedData
+from profiling import traced
+
+HTML_TAG = re.compile("<.*?>")
+LINK = re.compile('(https?.*?)"')
+
+
+def cleanhtml(raw_html: str) -> str:
+    """
+    Removes HTML tags from a raw HTML string.
+
+    Args:
+        raw_html (str): The raw HTML string to be cleaned.
+
+    Returns:
+        str: The cleaned string with HTML tags removed.
+    """
+    return HTML_TAG.sub("", raw_html)
+
+
+class RenderedBreach(NamedTuple):
+    """The `breach_name` output of one breach."""
+    modified: str
+    embed: EmbedData
+    links: list[str]
+    logo: str
+
+
+@traced("render")
+def render_breach(breach: dict[str, Any]) -> RenderedBreach:
+    """
+    Renders a breach into its embed payload, links and logo URL.
+
+    Every field but LogoPath becomes an embed field, empty values show
+    as "None", and the description is stripped of HTML with its article
+    links listed separately.
+
+    Args:
+        breach (dict[str, Any]): The breach, as returned by HIBP.
+
+    Returns:
+        RenderedBreach: The rendered output.
+    """
+    logo = breach.get("LogoPath")
+    desc = breach.get("Description")
+    desc = desc if isinstance(desc, str) else ""
+    embed = discord.Embed()
+    for key, value in breach.items():
+        if key == "LogoPath":
+            continue
+        if key == "Description":
+            value = cleanhtml(desc).replace("&quot;", '"')
+        value = "None" if value is None or value == "" else value
+        embed.add_field(name=f"{key}", value=f"{value}")
+    return RenderedBreach(str(breach.get("ModifiedDate")), embed.to_dict(),
+                          LINK.findall(desc),
+                          logo if isinstance(logo, str) else "")
+
+
+class BreachRenderer:
+    """Cache of rendered breaches keyed by breach name."""
+
+    def __init__(self) -> None:
+        self.rendered: dict[str, RenderedBreach] = {}
+
+    def sync(self, breaches: Iterable[dict[str, Any]]) -> None:
+        """
+        Renders new and modified breaches and forgets removed ones.
+
+        Registered as a BreachCatalog listener.
+
+        Args:
+            breaches (Iterable[dict[str, Any]]): The whole catalog.
+        """
+        rendered = {}
+        for breach in breaches:
+            name = str(breach.get("Name"))
+            entry = self.rendered.get(name)
+            if entry is None or entry.modified != str(
+                    breach.get("ModifiedDate")):
+                entry = render_breach(breach)
+            rendered[name] = entry
+        self.rendered = rendered
+
+    def get(self, breach: dict[str, Any]) -> RenderedBreach:
+        """
+        Returns the rendered output of a breach, rendering it if it is
+        new or was modified since it was rendered.
+
+        Args:
+            breach (dict[str, Any]): The breach.
+
+        Returns:
+            RenderedBreach: The rendered output.
+        """
+        name = str(breach.get("Name"))
+        entry = self.rendered.get(name)
+        if entry is None or entry.modified != str(breach.get("ModifiedDate")):
+            entry = self.rendered[name] = render_breach(breach)
+        return entry
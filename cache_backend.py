@@ -0,0 +1,549 @@
+"""
+Shared result cache backends for pwnedBot.
+
+The lookup paths store HIBP results through the small `CacheBackend`
+interface, so where they live is a setting:
+
+    memory://                  this process only
+    sqlite:///path/to/db       a local SQLite file that survives restarts
+    redis://[:password@]host[:port][/db]
+                               a Redis-compatible server shared by every
+                               worker process and shard
+
+With Redis, a result fetched by one process is a cache hit for all the
+others, so N processes spend about as much HIBP quota as one. Requests
+to Redis are pipelined: every get and put made during one event loop
+iteration goes out as a single write and MGET. A request that takes
+longer than the backend's timeout is given up, and its lookups are
+misses.
+
+Structured values are serialised with msgpack when it is installed and
+compact JSON otherwise; each value records its format, so processes
+with and without msgpack can share a cache.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import time
+import zlib
+from collections.abc import Sequence
+from typing import Any, Protocol
+from urllib.parse import unquote, urlsplit
+from caches import TTLCache
+from disk_cache import DiskCache
+
+try:
+    import msgpack  # type: ignore[import-not-found, unused-ignore]
+except ImportError:
+    msgpack = None
+
+# Values at least this large are zlib-compressed before going to Redis
+COMPRESS_BYTES = 1024
+
+# Redis errors that only lose cached results, never a lookup
+CONNECTION_ERRORS = (OSError, ConnectionError, TimeoutError,
+                     asyncio.IncompleteReadError)
+
+# Seconds between counts of the backend's keys on the Redis server
+COUNT_INTERVAL = 60.0
+
+
+class CacheBackend(Protocol):
+    """
+    A byte cache keyed by (namespace, key) with per-entry TTLs.
+
+    `put` may buffer the entry; `flush` waits until buffered entries are
+    stored. Reads must see the process's own buffered entries.
+    """
+
+    @property
+    def hits(self) -> int:
+        ...
+
+    @property
+    def misses(self) -> int:
+        ...
+
+    def __len__(self) -> int:
+        ...
+
+    async def get(self, namespace: str, key: str) -> bytes | None:
+        ...
+
+    async def get_many(self, namespace: str,
+                       keys: Sequence[str]) -> list[bytes | None]:
+        ...
+
+    def put(self, namespace: str, key: str, value: bytes, ttl: float) -> None:
+        ...
+
+    async def flush(self) -> None:
+        ...
+
+    async def close(self) -> None:
+        ...
+
+
+def dumps(value: Any) -> bytes:
+    """
+    Serialises a JSON-compatible value for a cache backend.
+
+    Args:
+        value (Any): The value.
+
+    Returns:
+        bytes: A format tag followed by the msgpack or JSON encoding.
+    """
+    if msgpack is not None:
+        return b"m" + bytes(msgpack.packb(value))
+    return b"j" + json.dumps(value, separators=(",", ":")).encode()
+
+
+def loads(data: bytes) -> Any:
+    """
+    Deserialises a value written by `dumps`.
+
+    Args:
+        data (bytes): The stored value.
+
+    Returns:
+        Any: The value.
+
+    Raises:
+        ValueError: If the value's format is unknown or unavailable.
+    """
+    tag, body = data[:1], data[1:]
+    if tag == b"j":
+        return json.loads(body)
+    if tag == b"m" and msgpack is not None:
+        return msgpack.unpackb(body)
+    raise ValueError("Unreadable cache entry")
+
+
+class MemoryBackend:
+    """
+    In-process backend holding at most `max_bytes` of values.
+
+    Least recently used entries are evicted first.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.cache: TTLCache[tuple[str, str], bytes] = TTLCache(0.0,
+                                                                max_bytes,
+                                                                len)
+
+    @property
+    def hits(self) -> int:
+        """Lookups answered from the cache."""
+        return self.cache.hits
+
+    @property
+    def misses(self) -> int:
+        """Lookups not in the cache."""
+        return self.cache.misses
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    async def get(self, namespace: str, key: str) -> bytes | None:
+        """
+        Returns a live entry.
+
+        Args:
+            namespace (str): The kind of entry, e.g. "range".
+            key (str): The entry's key within the namespace.
+
+        Returns:
+            bytes | None: The stored value, or None if absent or expired.
+        """
+        return self.cache.get((namespace, key))
+
+    async def get_many(self, namespace: str,
+                       keys: Sequence[str]) -> list[bytes | None]:
+        """
+        Returns several live entries of one namespace.
+
+        Args:
+            namespace (str): The kind of entries.
+            keys (Sequence[str]): Their keys.
+
+        Returns:
+            list[bytes | None]: The values, in the order of `keys`.
+        """
+        return [self.cache.get((namespace, key)) for key in keys]
+
+    def put(self, namespace: str, key: str, value: bytes, ttl: float) -> None:
+        """
+        Stores an entry.
+
+        Args:
+            namespace (str): The kind of entry, e.g. "range".
+            key (str): The entry's key within the namespace.
+            value (bytes): The value to store.
+            ttl (float): Seconds until the entry expires.
+        """
+        self.cache.put((namespace, key), value, ttl)
+
+    async def flush(self) -> None:
+        """Does nothing; entries are stored immediately."""
+
+    async def close(self) -> None:
+        """Drops every entry."""
+        self.cache.clear()
+
+
+class RedisError(Exception):
+    """An error reply from the Redis server."""
+
+
+def encode_command(*args: bytes) -> bytes:
+    """Encodes a command as a RESP array of bulk strings."""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        parts.append(b"$%d\r\n%b\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+class RedisConnection:
+    """
+    Minimal RESP client that sends commands in pipelines.
+
+    The connection is opened on first use and reopened after a failure.
+    Connecting, and sending a pipeline and reading its replies, may each
+    take up to `timeout` seconds. Error replies are returned as
+    RedisError instances rather than raised, so one failed command does
+    not lose the rest of a pipeline.
+    """
+
+    def __init__(self, url: str, timeout: float = 2.0) -> None:
+        parts = urlsplit(url)
+        self.timeout = timeout
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.strip("/") or 0)
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> tuple[asyncio.StreamReader,
+                                      asyncio.StreamWriter]:
+        """Opens the connection, authenticating and selecting the db."""
+        if self._reader is None or self._writer is None:
+            reader, writer = await asyncio.open_connection(self.host,
+                                                           self.port)
+            setup = []
+            if self.password is not None:
+                setup.append((b"AUTH", self.password.encode()))
+            if self.db:
+                setup.append((b"SELECT", b"%d" % self.db))
+            if setup:
+                writer.write(b"".join(encode_command(*c) for c in setup))
+                await writer.drain()
+                for _ in setup:
+                    reply = await self._read_reply(reader)
+                    if isinstance(reply, RedisError):
+                        writer.close()
+                        raise ConnectionError(f"Redis setup failed: {reply}")
+            self._reader, self._writer = reader, writer
+        return self._reader, self._writer
+
+    async def _read_reply(self, reader: asyncio.StreamReader) -> Any:
+        """Reads one RESP reply."""
+        line = await reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Redis closed the connection")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest
+        if kind == b"-":
+            return RedisError(rest.decode(errors="replace"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            if int(rest) < 0:
+                return None
+            return (await reader.readexactly(int(rest) + 2))[:-2]
+        if kind == b"*":
+            if int(rest) < 0:
+                return None
+            return [await self._read_reply(reader) for _ in range(int(rest))]
+        raise ConnectionError(f"Unexpected Redis reply: {line!r}")
+
+    async def pipeline(self, commands: Sequence[Sequence[bytes]]) -> list[Any]:
+        """
+        Sends commands in a single write and returns their replies.
+
+        Args:
+            commands (Sequence[Sequence[bytes]]): The commands and their
+                arguments.
+
+        Returns:
+            list[Any]: One reply per command.
+
+        Raises:
+            ConnectionError: If the server could not be reached.
+            TimeoutError: If it did not answer within `timeout` seconds.
+        """
+        async with self._lock:
+            try:
+                async with asyncio.timeout(self.timeout):
+                    reader, writer = await self._connect()
+                async with asyncio.timeout(self.timeout):
+                    writer.write(b"".join(encode_command(*c)
+                                          for c in commands))
+                    await writer.drain()
+                    return [await self._read_reply(reader) for _ in commands]
+            except BaseException:
+                await self.close()
+                raise
+
+    async def close(self) -> None:
+        """Closes the connection."""
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except CONNECTION_ERRORS:
+                pass
+
+
+class RedisBackend:
+    """
+    Backend on a Redis-compatible server shared between processes.
+
+    Gets and puts are queued and sent together once per event loop
+    iteration, puts first, as one pipeline ending in an MGET. Keys are
+    "<prefix>:<namespace>:<key>" and expire through Redis' own TTLs.
+    If the server is unreachable or slower than `timeout` seconds,
+    lookups are treated as misses.
+
+    `entries` counts the keys under the prefix, recounted with SCAN at
+    most every `COUNT_INTERVAL` seconds, so other data in the same Redis
+    database is not included.
+    """
+
+    def __init__(self, url: str, prefix: str = "pwnedbot",
+                 timeout: float = 2.0) -> None:
+        self.connection = RedisConnection(url, timeout)
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.entries = 0
+        self._gets: list[tuple[bytes, asyncio.Future[bytes | None]]] = []
+        self._pending: dict[bytes, tuple[float, bytes]] = {}
+        self._writing: dict[bytes, tuple[float, bytes]] = {}
+        self._batch: asyncio.Task[None] | None = None
+        self._counting: asyncio.Task[None] | None = None
+        self._counted = float("-inf")
+
+    def __len__(self) -> int:
+        return self.entries
+
+    def _key(self, namespace: str, key: str) -> bytes:
+        """Returns the Redis key of an entry."""
+        return f"{self.prefix}:{namespace}:{key}".encode()
+
+    @staticmethod
+    def _pack(value: bytes) -> bytes:
+        """Prefixes a value with its encoding, compressing large ones."""
+        if len(value) >= COMPRESS_BYTES:
+            return b"z" + zlib.compress(value, 1)
+        return b"r" + value
+
+    @staticmethod
+    def _unpack(data: bytes) -> bytes | None:
+        """Reverses `_pack`; None for values it did not write."""
+        tag, body = data[:1], data[1:]
+        if tag == b"r":
+            return body
+        if tag == b"z":
+            try:
+                return zlib.decompress(body)
+            except zlib.error:
+                return None
+        return None
+
+    def _schedule(self) -> None:
+        """Starts sending queued requests unless a batch is running."""
+        if self._batch is None or self._batch.done():
+            self._batch = asyncio.get_running_loop().create_task(
+                self._run_batches())
+        if time.monotonic() - self._counted >= COUNT_INTERVAL:
+            self._counted = time.monotonic()
+            self._counting = asyncio.get_running_loop().create_task(
+                self._count_entries())
+
+    async def _count_entries(self) -> None:
+        """Counts the keys under the prefix with SCAN."""
+        pattern = f"{self.prefix}:*".encode()
+        cursor = b"0"
+        entries = 0
+        try:
+            while True:
+                reply = (await self.connection.pipeline(
+                    [(b"SCAN", cursor, b"MATCH", pattern,
+                      b"COUNT", b"1000")]))[0]
+                if not isinstance(reply, list) or len(reply) != 2:
+                    print(f"Redis cache count failed: {reply}")
+                    return
+                cursor, keys = reply
+                entries += len(keys)
+                if cursor == b"0":
+                    break
+        except CONNECTION_ERRORS as exc:
+            print(f"Redis cache count failed: {exc!r}")
+            return
+        self.entries = entries
+
+    async def _run_batches(self) -> None:
+        """Sends queued requests until none are left."""
+        # Let the rest of this loop iteration queue its requests too
+        await asyncio.sleep(0)
+        while self._gets or self._pending:
+            gets, self._gets = self._gets, []
+            self._writing, self._pending = self._pending, {}
+            try:
+                await self._send(gets, self._writing)
+            finally:
+                self._writing = {}
+
+    async def _send(self, gets: list[tuple[bytes,
+                                           asyncio.Future[bytes | None]]],
+                    writes: dict[bytes, tuple[float, bytes]]) -> None:
+        """Sends one pipeline and resolves the waiting gets, as misses
+        if it fails in any way."""
+        replies: list[Any] = []
+        try:
+            now = time.time()
+            commands: list[tuple[bytes, ...]] = []
+            for key, (expires, value) in writes.items():
+                if expires > now:
+                    ttl = max(1, int((expires - now) * 1000))
+                    commands.append((b"SET", key, self._pack(value), b"PX",
+                                     b"%d" % ttl))
+            if gets:
+                commands.append((b"MGET", *(key for key, _ in gets)))
+            if commands:
+                try:
+                    replies = await self.connection.pipeline(commands)
+                except CONNECTION_ERRORS as exc:
+                    print(f"Redis cache request failed: {exc!r}")
+        finally:
+            values = replies[-1] if gets and replies else None
+            if not isinstance(values, list):
+                values = [None] * len(gets)
+            for (_, future), value in zip(gets, values):
+                data = (self._unpack(value) if isinstance(value, bytes)
+                        else None)
+                if data is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                if not future.done():
+                    future.set_result(data)
+
+    async def get(self, namespace: str, key: str) -> bytes | None:
+        """
+        Returns a live entry.
+
+        Args:
+            namespace (str): The kind of entry, e.g. "range".
+            key (str): The entry's key within the namespace.
+
+        Returns:
+            bytes | None: The stored value, or None if absent, expired
+                or unreachable.
+        """
+        redis_key = self._key(namespace, key)
+        entry = (self._pending.get(redis_key) or
+                 self._writing.get(redis_key))
+        if entry is not None and entry[0] > time.time():
+            self.hits += 1
+            return entry[1]
+        future: asyncio.Future[bytes | None] = (
+            asyncio.get_running_loop().create_future())
+        self._gets.append((redis_key, future))
+        self._schedule()
+        return await future
+
+    async def get_many(self, namespace: str,
+                       keys: Sequence[str]) -> list[bytes | None]:
+        """
+        Returns several live entries of one namespace in one round trip.
+
+        Args:
+            namespace (str): The kind of entries.
+            keys (Sequence[str]): Their keys.
+
+        Returns:
+            list[bytes | None]: The values, in the order of `keys`.
+        """
+        return list(await asyncio.gather(*(self.get(namespace, key)
+                                           for key in keys)))
+
+    def put(self, namespace: str, key: str, value: bytes, ttl: float) -> None:
+        """
+        Queues an entry to be stored with the next pipeline.
+
+        Args:
+            namespace (str): The kind of entry, e.g. "range".
+            key (str): The entry's key within the namespace.
+            value (bytes): The value to store.
+            ttl (float): Seconds until the entry expires.
+        """
+        self._pending[self._key(namespace, key)] = (time.time() + ttl, value)
+        self._schedule()
+
+    async def flush(self) -> None:
+        """Waits until every queued entry is sent."""
+        while self._batch is not None and not self._batch.done():
+            await self._batch
+
+    async def close(self) -> None:
+        """Sends queued entries and closes the connection."""
+        await self.flush()
+        if self._counting is not None:
+            self._counting.cancel()
+            try:
+                await self._counting
+            except asyncio.CancelledError:
+                pass
+        await self.connection.close()
+
+
+def open_backend(url: str, max_bytes: int,
+                 timeout: float = 2.0) -> CacheBackend:
+    """
+    Creates the backend a cache URL names.
+
+    Args:
+        url (str): "memory://", "sqlite:///<path>" or "redis://...".
+        max_bytes (int): Size ceiling of the memory and SQLite backends;
+            a Redis server's is set with its own maxmemory setting.
+        timeout (float): Seconds a Redis request may take before its
+            lookups are treated as misses.
+
+    Returns:
+        CacheBackend: The backend.
+
+    Raises:
+        ValueError: If the URL's scheme is not supported.
+    """
+    parts = urlsplit(url)
+    if parts.scheme == "memory":
+        return MemoryBackend(max_bytes)
+    if parts.scheme == "sqlite":
+        # sqlite:///relative/path and sqlite:////absolute/path
+        return DiskCache(parts.path[1:], max_bytes)
+    if parts.scheme == "redis":
+        return RedisBackend(url, timeout=timeout)
+    raise ValueError(f"Unsupported cache URL: {url}")
@@ -0,0 +1,107 @@
+"""
+Bounded in-memory caches shared by pwnedBot's lookup paths.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Generic, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Least recently used cache with a time-to-live and a size ceiling.
+
+    Entries expire `ttl` seconds after they are stored. When the summed
+    `sizeof` of all entries exceeds `max_size`, the least recently used
+    entries are evicted first. By default every entry has size 1, which
+    makes `max_size` an item count.
+    """
+
+    def __init__(self,
+                 ttl: float,
+                 max_size: int,
+                 sizeof: Callable[[V], int] | None = None) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[K, tuple[float, int, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K) -> V | None:
+        """
+        Returns a live entry and marks it as recently used.
+
+        Args:
+            key (K): The cache key.
+
+        Returns:
+            V | None: The cached value, or None if absent or expired.
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] <= time.monotonic():
+            self.pop(key)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, key: K, value: V, ttl: float | None = None) -> None:
+        """
+        Stores a value, evicting least recently used entries as needed.
+
+        Args:
+            key (K): The cache key.
+            value (V): The value to store.
+            ttl (float | None): Overrides the cache's time-to-live.
+        """
+        self.pop(key)
+        size = self.sizeof(value) if self.sizeof is not None else 1
+        if size > self.max_size:
+            return
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires, size, value)
+        self.size += size
+        while self.size > self.max_size:
+            _, (_, old_size, _) = self._data.popitem(last=False)
+            self.size -= old_size
+
+    def pop(self, key: K) -> V | None:
+        """
+        Removes an entry.
+
+        Args:
+            key (K): The cache key.
+
+        Returns:
+            V | None: The removed value, or None if it was absent.
+        """
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return None
+        self.size -= entry[1]
+        return entry[2]
+
+    def clear(self) -> None:
+        """Removes every entry."""
+        self._data.clear()
+        self.size = 0
@@ -0,0 +1,172 @@
+"""
+Batched Discord message delivery for pwnedBot.
+
+Command output is packed into as few messages as Discord allows: up to
+10 embeds (and 6000 embed characters) per message, with the leading
+text, attached images and the attribution footer carried on the same
+payloads instead of being sent one message at a time.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+from collections.abc import Callable, Iterable, Sequence
+from typing import Any
+import discord
+from profiling import traced_async
+
+# Discord's per-message limits
+MAX_CONTENT = 2000
+MAX_EMBEDS = 10
+MAX_EMBED_CHARS = 6000
+MAX_FILES = 10
+
+# Attribution sent after every result
+SOURCE_FOOTER = "*All data sourced from https://haveibeenpwned.com*"
+
+# Called with the destination of every message sent through `send`
+on_send: list[Callable[[discord.abc.Messageable], None]] = []
+
+
+def chunk_text(lines: Iterable[str], limit: int = MAX_CONTENT) -> list[str]:
+    """
+    Joins lines into as few message bodies as fit within `limit`.
+
+    Args:
+        lines (Iterable[str]): The lines to send, in order.
+        limit (int): The maximum characters per message.
+
+    Returns:
+        list[str]: The message bodies.
+    """
+    chunks: list[str] = []
+    current = ""
+    for line in lines:
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def chunk_embeds(embeds: Iterable[discord.Embed]) -> list[list[discord.Embed]]:
+    """
+    Groups embeds into per-message batches within Discord's limits.
+
+    Args:
+        embeds (Iterable[discord.Embed]): The embeds to send, in order.
+
+    Returns:
+        list[list[discord.Embed]]: The embeds for each message.
+    """
+    groups: list[list[discord.Embed]] = []
+    group: list[discord.Embed] = []
+    chars = 0
+    for embed in embeds:
+        size = len(embed)
+        if group and (len(group) == MAX_EMBEDS or
+                      chars + size > MAX_EMBED_CHARS):
+            groups.append(group)
+            group, chars = [], 0
+        group.append(embed)
+        chars += size
+    if group:
+        groups.append(group)
+    return groups
+
+
+async def send(destination: discord.abc.Messageable, *args: Any,
+               **kwargs: Any) -> discord.Message:
+    """
+    Sends one message and reports it to every `on_send` callback.
+
+    Unlike the on_message event, this also sees ephemeral replies and
+    interaction follow-ups.
+
+    Args:
+        destination (discord.abc.Messageable): Where to send, e.g. a
+            command context.
+        *args (Any): Passed on to the destination's send.
+        **kwargs (Any): Passed on to the destination's send.
+
+    Returns:
+        discord.Message: The message sent.
+    """
+    message = await destination.send(*args, **kwargs)
+    for callback in on_send:
+        callback(destination)
+    return message
+
+
+@traced_async("send")
+async def send_batched(destination: discord.abc.Messageable,
+                       content: str | Sequence[str] = "",
+                       embeds: Iterable[discord.Embed] = (),
+                       files: Sequence[discord.File] = (),
+                       footer: str | None = None,
+                       ephemeral: bool = False) -> int:
+    """
+    Sends text, files and embeds in as few messages as possible.
+
+    The text and files ride on the first message with the first batch of
+    embeds; files beyond Discord's 10 per message are sent in messages of
+    their own just before it. The footer is set on the last embed, or
+    appended to the text when there are no embeds, so it always comes
+    last.
+
+    Args:
+        destination (discord.abc.Messageable): Where to send, e.g. a
+            command context.
+        content (str | Sequence[str]): Leading text, or lines of text.
+        embeds (Iterable[discord.Embed]): Embeds to send, in order.
+        files (Sequence[discord.File]): Files to attach, in order.
+        footer (str | None): Attribution to send after everything else.
+        ephemeral (bool): Show the messages only to the invoking user; the
+            destination must then be a command context.
+
+    Returns:
+        int: The number of messages sent.
+    """
+    options: dict[str, Any] = {"ephemeral": True} if ephemeral else {}
+    lines = [content] if isinstance(content, str) else list(content)
+    embeds = list(embeds)
+    if footer:
+        # Set before grouping so the footer counts towards the limits
+        if embeds:
+            embeds[-1].set_footer(text=footer.strip("*"))
+        else:
+            lines.append(footer)
+    groups = chunk_embeds(embeds)
+    texts = chunk_text(line for line in lines if line)
+    file_groups = [list(files[i:i + MAX_FILES])
+                   for i in range(0, len(files), MAX_FILES)]
+    sent = 0
+    for text in texts[:-1]:
+        await send(destination, text, **options)
+        sent += 1
+    for file_group in file_groups[:-1]:
+        await send(destination, files=file_group, **options)
+        sent += 1
+    first_text = texts[-1] if texts else None
+    first_files = file_groups[-1] if file_groups else []
+    if first_text is not None or first_files or groups:
+        await send(destination, content=first_text,
+                   embeds=groups[0] if groups else [],
+                   files=first_files, **options)
+        sent += 1
+    for group in groups[1:]:
+        await send(destination, embeds=group, **options)
+        sent += 1
+    return sent
@@ -0,0 +1,254 @@
+"""
+Persistent SQLite result cache for pwnedBot.
+
+Sits behind the in-memory caches so a restarted bot can answer from the
+results it fetched before the restart instead of asking HIBP again.
+Entries carry a wall-clock expiry, values are zlib-compressed, and the
+database is kept under a size ceiling by evicting the entries closest to
+expiry first.
+
+All SQLite work, compression included, runs on one background thread.
+Writes are buffered in memory and committed in batches, so storing a
+result never blocks the event loop.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import asyncio
+import sqlite3
+import time
+import zlib
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+EntryKey = tuple[str, str]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    expires REAL NOT NULL,
+    size INTEGER NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires);
+"""
+
+
+class DiskCache:
+    """
+    SQLite-backed byte cache with per-entry TTLs and a size ceiling.
+
+    Keys are (namespace, key) pairs. `put` only buffers the entry; the
+    buffer is committed `flush_interval` seconds after the first pending
+    write, or as soon as `batch_size` entries are waiting. Reads see
+    buffered entries immediately.
+    """
+
+    def __init__(self,
+                 path: str,
+                 max_bytes: int = 256 * 1024 * 1024,
+                 flush_interval: float = 2.0,
+                 batch_size: int = 500) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self.entries = 0
+        self.size = 0
+        self._pending: dict[EntryKey, tuple[float, bytes]] = {}
+        self._writing: dict[EntryKey, tuple[float, bytes]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix="disk-cache")
+        self._db: sqlite3.Connection | None = None
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushing: asyncio.Task[None] | None = None
+
+    def __len__(self) -> int:
+        return self.entries
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens the database on the cache thread, creating it if needed."""
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self._db = db
+            self._update_totals(db)
+        return self._db
+
+    def _update_totals(self, db: sqlite3.Connection) -> None:
+        """Reads the entry count and stored size of the database."""
+        self.entries, self.size = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+
+    def _read(self, namespace: str, key: str) -> bytes | None:
+        """Returns a live stored value; runs on the cache thread."""
+        row = self._connect().execute(
+            "SELECT value, expires FROM entries "
+            "WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return zlib.decompress(row[0])
+
+    def _read_many(self, namespace: str,
+                   keys: list[str]) -> list[bytes | None]:
+        """Returns several live stored values; runs on the cache thread."""
+        return [self._read(namespace, key) for key in keys]
+
+    def _write(self, batch: dict[EntryKey, tuple[float, bytes]]) -> None:
+        """Commits a batch, then drops expired and excess entries."""
+        db = self._connect()
+        rows = []
+        for (namespace, key), (expires, value) in batch.items():
+            blob = zlib.compress(value)
+            rows.append((namespace, key, expires, len(blob), blob))
+        with db:
+            db.executemany("INSERT OR REPLACE INTO entries "
+                           "VALUES (?, ?, ?, ?, ?)", rows)
+            db.execute("DELETE FROM entries WHERE expires <= ?",
+                       (time.time(),))
+            self._update_totals(db)
+            excess = self.size - self.max_bytes
+            if excess > 0:
+                victims = []
+                for rowid, size in db.execute(
+                        "SELECT rowid, size FROM entries ORDER BY expires"):
+                    if excess <= 0:
+                        break
+                    victims.append((rowid,))
+                    excess -= size
+                db.executemany("DELETE FROM entries WHERE rowid = ?",
+                               victims)
+                self._update_totals(db)
+
+    async def get(self, namespace: str, key: str) -> bytes | None:
+        """
+        Returns a live entry.
+
+        Args:
+            namespace (str): The kind of entry, e.g. "range".
+            key (str): The entry's key within the namespace.
+
+        Returns:
+            bytes | None: The stored value, or None if absent or expired.
+        """
+        entry = (self._pending.get((namespace, key)) or
+                 self._writing.get((namespace, key)))
+        if entry is not None:
+            value: bytes | None = entry[1] if entry[0] > time.time() else None
+        else:
+            loop = asyncio.get_running_loop()
+            try:
+                value = await loop.run_in_executor(self._executor, self._read,
+                                                   namespace, key)
+            except (sqlite3.Error, zlib.error) as exc:
+                print(f"Disk cache read failed: {exc}")
+                value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def get_many(self, namespace: str,
+                       keys: Sequence[str]) -> list[bytes | None]:
+        """
+        Returns several live entries of one namespace with a single trip
+        to the cache thread.
+
+        Args:
+            namespace (str): The kind of entries, e.g. "range".
+            keys (Sequence[str]): Their keys.
+
+        Returns:
+            list[bytes | None]: The values, in the order of `keys`.
+        """
+        values: list[bytes | None] = [None] * len(keys)
+        unread = []
+        now = time.time()
+        for position, key in enumerate(keys):
+            entry = (self._pending.get((namespace, key)) or
+                     self._writing.get((namespace, key)))
+            if entry is None:
+                unread.append(position)
+            elif entry[0] > now:
+                values[position] = entry[1]
+        if unread:
+            loop = asyncio.get_running_loop()
+            try:
+                read = await loop.run_in_executor(
+                    self._executor, self._read_many, namespace,
+                    [keys[position] for position in unread])
+            except (sqlite3.Error, zlib.error) as exc:
+                print(f"Disk cache read failed: {exc}")
+                read = [None] * len(unread)
+            for position, value in zip(unread, read):
+                values[position] = value
+        found = sum(value is not None for value in values)
+        self.hits += found
+        self.misses += len(values) - found
+        return values
+
+    def put(self, namespace: str, key: str, value: bytes, ttl: float) -> None:
+        """
+        Buffers an entry to be committed with the next batch.
+
+        Args:
+            namespace (str): The kind of entry, e.g. "range".
+            key (str): The entry's key within the namespace.
+            value (bytes): The value to store.
+            ttl (float): Seconds until the entry expires.
+        """
+        self._pending[(namespace, key)] = (time.time() + ttl, value)
+        if len(self._pending) >= self.batch_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.flush_interval, self._start_flush)
+
+    def _start_flush(self) -> None:
+        """Starts committing the buffer unless a commit is running."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.get_running_loop().create_task(
+                self.flush())
+
+    async def flush(self) -> None:
+        """Commits every buffered entry."""
+        while self._pending:
+            self._writing, self._pending = self._pending, {}
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(self._executor, self._write,
+                                           self._writing)
+            except sqlite3.Error as exc:
+                print(f"Disk cache write failed: {exc}")
+            finally:
+                self._writing = {}
+
+    async def close(self) -> None:
+        """Commits buffered entries and closes the database."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._flushing is not None:
+            await self._flushing
+        await self.flush()
+        if self._db is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self._db.close)
+            self._db = None
+        self._executor.shutdown()
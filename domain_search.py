@@ -0,0 +1,267 @@
+"""
+Streaming breached-domain search for pwnedBot.
+
+HIBP's domain search returns one JSON object mapping every breached
+alias of a domain to its breach names, which for a large company runs
+to tens of thousands of entries. The response is parsed member by
+member as it downloads and each alias is written straight into a
+gzip-compressed CSV or JSON file in memory, so neither the raw response
+nor the decoded object is ever held as a whole, and the result is sent
+as one attachment.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import codecs
+import csv
+import gzip
+import io
+import json
+from collections import Counter
+from collections.abc import AsyncGenerator, AsyncIterable, Callable
+from contextlib import aclosing
+from typing import Any, NamedTuple
+from hibp_client import HIBPClient
+from profiling import traced
+
+WHITESPACE = " \t\n\r"
+# Characters that may continue a JSON number
+NUMBER_CHARS = "0123456789+-.eE"
+
+# Room left under the size limit for what the compressor still buffers
+TRAILER_BYTES = 256 * 1024
+
+
+class DomainSummary(NamedTuple):
+    """Totals of a domain search."""
+    aliases: int
+    breaches: int
+    top: list[tuple[str, int]]
+    truncated: bool
+
+
+class ObjectStream:
+    """
+    Incremental parser for the members of one top-level JSON object.
+
+    Text is fed in pieces of any size; each call returns the members
+    completed so far, and keeps only the unparsed remainder.
+    """
+
+    def __init__(self) -> None:
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.state = "start"
+        self.key = ""
+        # The parser for each state, called with (buffer, position of the
+        # next non-whitespace character, final, members); each returns
+        # the position after what it consumed, or None to wait for more
+        self.steps: dict[str, Callable[[str, int, bool,
+                                        list[tuple[str, Any]]],
+                                       int | None]] = {
+            "start": self._read_start,
+            "first": self._read_key,
+            "key": self._read_key,
+            "colon": self._read_colon,
+            "value": self._read_value,
+            "next": self._read_next,
+            "done": self._read_done,
+        }
+
+    @traced("transform")
+    def feed(self, text: str, final: bool = False) -> list[tuple[str, Any]]:
+        """
+        Parses more of the object.
+
+        Args:
+            text (str): The next piece of the document.
+            final (bool): Whether this is the end of the document.
+
+        Returns:
+            list[tuple[str, Any]]: The (key, value) members completed.
+
+        Raises:
+            ValueError: If the document is not a JSON object, or ends
+                before the object does.
+        """
+        buffer = self.buffer + text
+        members: list[tuple[str, Any]] = []
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in WHITESPACE:
+                pos += 1
+            if pos == len(buffer):
+                break
+            end = self.steps[self.state](buffer, pos, final, members)
+            if end is None:
+                break
+            pos = end
+        self.buffer = buffer[pos:]
+        if final and self.state != "done":
+            raise ValueError("The JSON object ended early")
+        return members
+
+    def _read_start(self, buffer: str, pos: int, final: bool,
+                    members: list[tuple[str, Any]]) -> int | None:
+        """Reads the opening brace."""
+        if buffer[pos] != "{":
+            raise ValueError("Expected a JSON object")
+        self.state = "first"
+        return pos + 1
+
+    def _read_key(self, buffer: str, pos: int, final: bool,
+                  members: list[tuple[str, Any]]) -> int | None:
+        """Reads a member's key, or the closing brace of an empty
+        object."""
+        char = buffer[pos]
+        if char == "}" and self.state == "first":
+            self.state = "done"
+            return pos + 1
+        if char != '"':
+            raise ValueError(f"Expected a key at {char!r}")
+        try:
+            self.key, end = self.decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return None
+        self.state = "colon"
+        return end
+
+    def _read_colon(self, buffer: str, pos: int, final: bool,
+                    members: list[tuple[str, Any]]) -> int | None:
+        """Reads the colon between a key and its value."""
+        if buffer[pos] != ":":
+            raise ValueError(f"Expected ':' at {buffer[pos]!r}")
+        self.state = "value"
+        return pos + 1
+
+    def _read_value(self, buffer: str, pos: int, final: bool,
+                    members: list[tuple[str, Any]]) -> int | None:
+        """Reads a member's value and adds the member to `members`."""
+        try:
+            value, end = self.decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return None
+        if not final and (end == len(buffer) or
+                          (isinstance(value, (int, float)) and
+                           buffer[end] in NUMBER_CHARS)):
+            # A number may continue in the next piece; "-1." decodes as -1
+            return None
+        members.append((self.key, value))
+        self.state = "next"
+        return end
+
+    def _read_next(self, buffer: str, pos: int, final: bool,
+                   members: list[tuple[str, Any]]) -> int | None:
+        """Reads the comma before the next member, or the closing
+        brace."""
+        char = buffer[pos]
+        if char not in ",}":
+            raise ValueError(f"Expected ',' or '}}' at {char!r}")
+        self.state = "key" if char == "," else "done"
+        return pos + 1
+
+    def _read_done(self, buffer: str, pos: int, final: bool,
+                   members: list[tuple[str, Any]]) -> int | None:
+        """Rejects anything after the object."""
+        raise ValueError("Data after the JSON object")
+
+
+async def iter_object(chunks: AsyncIterable[bytes]
+                      ) -> AsyncGenerator[tuple[str, Any], None]:
+    """
+    Yields the members of a JSON object as its bytes arrive.
+
+    Args:
+        chunks (AsyncIterable[bytes]): The UTF-8 document in pieces.
+
+    Yields:
+        tuple[str, Any]: Each (key, value) member, in document order.
+
+    Raises:
+        ValueError: If the document is not a complete JSON object.
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    stream = ObjectStream()
+    async for chunk in chunks:
+        for member in stream.feed(utf8.decode(chunk)):
+            yield member
+    for member in stream.feed(utf8.decode(b"", final=True), final=True):
+        yield member
+
+
+async def export_domain(client: HIBPClient,
+                        domain: str,
+                        fmt: str = "csv",
+                        max_bytes: int = 8 * 1024 * 1024
+                        ) -> tuple[int, bytes, DomainSummary]:
+    """
+    Streams a domain search into a gzip-compressed CSV or JSON file.
+
+    Each row holds an alias, its email address, breach count and breach
+    names. Once the file nears `max_bytes` the search stops and the
+    summary is marked as truncated.
+
+    Args:
+        client (HIBPClient): The shared HIBP client.
+        domain (str): The verified domain to search.
+        fmt (str): "csv" or "json".
+        max_bytes (int): Largest file to produce, e.g. Discord's upload
+            limit.
+
+    Returns:
+        tuple[int, bytes, DomainSummary]: The HTTP status, the
+            compressed file (empty unless the status is 200) and the
+            search totals.
+
+    Raises:
+        RequestException: If the search could not be completed.
+        ValueError: If the response is not a JSON object.
+    """
+    counts: Counter[str] = Counter()
+    aliases = 0
+    truncated = False
+    buffer = io.BytesIO()
+    async with client.breached_domain(domain) as resp:
+        if resp.status != 200:
+            return resp.status, b"", DomainSummary(0, 0, [], False)
+        with gzip.GzipFile(fileobj=buffer, mode="wb") as gz_file:
+            text = io.TextIOWrapper(gz_file, encoding="utf-8", newline="")
+            writer = csv.writer(text)
+            if fmt == "json":
+                text.write("[")
+            else:
+                writer.writerow(["alias", "email", "breach_count",
+                                 "breaches"])
+            async with aclosing(iter_object(resp.chunks)) as members:
+                async for alias, names in members:
+                    if buffer.tell() >= max_bytes - TRAILER_BYTES:
+                        truncated = True
+                        break
+                    names = ([str(name) for name in names]
+                             if isinstance(names, list) else [])
+                    counts.update(names)
+                    email = f"{alias}@{domain}"
+                    if fmt == "json":
+                        text.write("," if aliases else "")
+                        text.write(json.dumps({"alias": alias,
+                                               "email": email,
+                                               "breaches": names}))
+                    else:
+                        writer.writerow([alias, email, len(names),
+                                         ";".join(names)])
+                    aliases += 1
+            if fmt == "json":
+                text.write("]")
+            text.flush()
+            text.detach()
+    return 200, buffer.getvalue(), DomainSummary(
+        aliases, len(counts), counts.most_common(5), truncated)
@@ -0,0 +1,527 @@
+"""
+Asynchronous client for the haveibeenpwned.com API.
+
+Every pwnedBot command awaits a single shared HIBPClient instead of
+building a blocking hibpwned.Pwned object per call, so lookups no longer
+stall the discord.py event loop and all requests reuse one keep-alive
+connection pool.
+
+All data is sourced from https://haveibeenpwned.com
+Visit https://haveibeenpwned.com/API/v3 to read the Acceptable Use Policy
+for rules regarding acceptable usage of this API.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import time
+from collections.abc import (AsyncIterator, Awaitable, Callable, Hashable,
+                             Mapping)
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from types import TracebackType
+from typing import Any, Generic, NamedTuple, TypeVar
+from urllib.parse import quote, urlencode
+import aiohttp
+from requests.exceptions import RequestException
+from cache_backend import CacheBackend, dumps, loads
+from profiling import traced, tracer
+from rate_limit import RequestScheduler, request_origin
+
+API_URL = "https://haveibeenpwned.com/api/v3/"
+RANGE_URL = "https://api.pwnedpasswords.com/range/"
+
+# Same shape hibpwned.Pwned returns: an HTTP status code on failure or
+# the decoded JSON list on success.
+ReturnAlias = int | list[dict[str, Any]]
+
+T = TypeVar("T")
+
+# Bytes read at a time from a streamed response
+STREAM_CHUNK = 64 * 1024
+
+
+class RateLimitError(RequestException):
+    """Raised when a request is still rate limited after all retries."""
+
+
+class Response(NamedTuple):
+    """Status, case-insensitive headers and raw body of a completed HIBP
+    request."""
+    status: int
+    headers: Mapping[str, str]
+    body: bytes
+
+
+class StreamedResponse(NamedTuple):
+    """Status, headers and body chunks of a response being read."""
+    status: int
+    headers: Mapping[str, str]
+    chunks: AsyncIterator[bytes]
+
+
+class SingleFlight(Generic[T]):
+    """
+    Coalesces concurrent calls for the same key into one in-flight call.
+
+    The first caller for a key starts the call as a task; callers that
+    arrive while it is running await the same task and receive the same
+    result or exception. A cancelled caller does not cancel the shared
+    call for the others. Results are shared objects and must be treated
+    as read-only.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Future[T]] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable,
+                 func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs `func`, or joins the call already running for `key`.
+
+        Args:
+            key (Hashable): Identifies identical calls.
+            func (Callable[[], Awaitable[T]]): Starts the call.
+
+        Returns:
+            T: The result of the shared call.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(func())
+            self._calls[key] = call
+            call.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(call)
+
+
+def sha1_hex(password: str) -> str:
+    """
+    Returns the upper-case SHA-1 hex digest of a UTF-8 encoded password.
+
+    Args:
+        password (str): The plaintext password.
+
+    Returns:
+        str: The 40 character upper-case hex digest.
+    """
+    return hashlib.sha1(password.encode("utf-8")).hexdigest().upper()
+
+
+class HIBPClient:
+    """
+    Non-blocking haveibeenpwned.com API client.
+
+    The client owns one aiohttp.ClientSession, created lazily on the
+    running event loop, whose connection pool is shared by every lookup.
+    Public methods mirror the hibpwned.Pwned API and return either the
+    decoded JSON data or the HTTP status code of a failed request.
+    Network failures are raised as requests.exceptions.RequestException
+    so command handlers keep a single error path.
+
+    When a RequestScheduler is given, every API request first waits for
+    a token on behalf of the current `request_origin`. A 429 response
+    pauses the scheduler for the `Retry-After` period and the request is
+    queued again, up to `retries` times.
+
+    Concurrent identical API lookups share one in-flight request. With a
+    cache backend, successful and "not found" answers of the endpoints
+    named in `cache_ttls` are also stored there for that many seconds,
+    keyed by a SHA-256 of the request so accounts are not stored in the
+    clear.
+
+    If set, `on_response` is called with the endpoint name, HTTP status
+    (0 for a network failure) and latency of every upstream request.
+
+    Usage::
+
+        >>> async with HIBPClient("My_App", "My_API_Key") as hibp:
+        ...     data = await hibp.search_all_breaches("test@example.com")
+    """
+
+    def __init__(self,
+                 app_name: str,
+                 api_key: str,
+                 *,
+                 api_url: str = API_URL,
+                 range_url: str = RANGE_URL,
+                 timeout: float = 30.0,
+                 max_connections: int = 20,
+                 scheduler: RequestScheduler | None = None,
+                 retries: int = 3,
+                 backend: CacheBackend | None = None,
+                 cache_ttls: dict[str, float] | None = None) -> None:
+        self.api_url = api_url
+        self.range_url = range_url
+        self.headers: dict[str, str] = {
+            "User-Agent": app_name,
+            "hibp-api-key": api_key
+        }
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_connections = max_connections
+        self.scheduler = scheduler
+        self.retries = retries
+        self.backend = backend
+        self.cache_ttls = cache_ttls or {}
+        self.on_response: Callable[[str, int, float], None] | None = None
+        self._inflight: SingleFlight[ReturnAlias] = SingleFlight()
+        self._session: aiohttp.ClientSession | None = None
+
+    async def __aenter__(self) -> HIBPClient:
+        return self
+
+    async def __aexit__(self, exc_type: type[BaseException] | None,
+                        exc: BaseException | None,
+                        tb: TracebackType | None) -> None:
+        await self.close()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The shared keep-alive session, created on first use."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections,
+                                             ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  headers=self.headers,
+                                                  timeout=self.timeout)
+        return self._session
+
+    async def close(self) -> None:
+        """Closes the shared session, its connection pool and the
+        scheduler."""
+        if self.scheduler is not None:
+            await self.scheduler.close()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _fetch(self,
+                     url: str,
+                     params: dict[str, str] | None,
+                     headers: dict[str, str] | None) -> Response:
+        """Performs a single GET request on the shared session."""
+        started = time.perf_counter()
+        status = 0
+        try:
+            with tracer.span("fetch"):
+                async with self.session.get(url, params=params,
+                                            headers=headers) as resp:
+                    body = await resp.read()
+                    status = resp.status
+                    return Response(resp.status, resp.headers, body)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            raise RequestException(str(exc)) from exc
+        finally:
+            if self.on_response is not None:
+                self.on_response(self.endpoint(url), status,
+                                 time.perf_counter() - started)
+
+    def endpoint(self, url: str) -> str:
+        """
+        Returns a low-cardinality name for the endpoint a URL targets.
+
+        Args:
+            url (str): The requested URL.
+
+        Returns:
+            str: The API path's first segment (e.g. "breachedaccount"),
+                "range" for Pwned Passwords or "other".
+        """
+        if url.startswith(self.api_url):
+            return url[len(self.api_url):].split("/", 1)[0].split("?", 1)[0]
+        if url.startswith(self.range_url):
+            return "range"
+        return "other"
+
+    async def request(self,
+                      url: str,
+                      params: dict[str, str] | None = None,
+                      headers: dict[str, str] | None = None,
+                      limited: bool = True) -> Response:
+        """
+        Performs a GET request, honouring the rate limit scheduler.
+
+        Args:
+            url (str): The absolute URL to fetch.
+            params (dict[str, str] | None): Optional query parameters.
+            headers (dict[str, str] | None): Optional extra headers.
+            limited (bool): Whether the request counts against the API
+                key's rate limit.
+
+        Returns:
+            Response: The status, headers and body of the response. The
+                status is only 429 once every retry was rate limited.
+
+        Raises:
+            RequestException: If the request could not be completed.
+        """
+        for attempt in range(self.retries + 1):
+            if limited and self.scheduler is not None:
+                with tracer.span("ratelimit"):
+                    await self.scheduler.acquire(request_origin.get())
+            resp = await self._fetch(url, params, headers)
+            if resp.status != 429 or attempt == self.retries:
+                break
+            await self._back_off(resp.headers, limited)
+        return resp
+
+    async def _back_off(self, headers: Mapping[str, str],
+                        limited: bool) -> None:
+        """Waits out a 429's Retry-After before the request is retried."""
+        try:
+            delay = float(headers.get("Retry-After", "2"))
+        except ValueError:
+            delay = 2.0
+        if limited and self.scheduler is not None:
+            self.scheduler.defer(delay)
+        else:
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def stream(self,
+                     url: str,
+                     params: dict[str, str] | None = None,
+                     limited: bool = True
+                     ) -> AsyncIterator[StreamedResponse]:
+        """
+        Performs a GET request whose body is read in chunks.
+
+        Rate limiting and 429 retries work as in `request`, but the body
+        is never held in memory as a whole, which suits responses of
+        unbounded size. Responses are not cached or coalesced.
+
+        Usage::
+
+            >>> async with hibp.stream(url) as resp:
+            ...     async for chunk in resp.chunks:
+            ...         ...
+
+        Args:
+            url (str): The absolute URL to fetch.
+            params (dict[str, str] | None): Optional query parameters.
+            limited (bool): Whether the request counts against the API
+                key's rate limit.
+
+        Yields:
+            StreamedResponse: The status, headers and body chunks. The
+                status is only 429 once every retry was rate limited.
+
+        Raises:
+            RequestException: If the request could not be completed or
+                the body could not be read.
+        """
+        for attempt in range(self.retries + 1):
+            if limited and self.scheduler is not None:
+                with tracer.span("ratelimit"):
+                    await self.scheduler.acquire(request_origin.get())
+            started = time.perf_counter()
+            status = 0
+            try:
+                async with self.session.get(url, params=params) as resp:
+                    status = resp.status
+                    if resp.status != 429 or attempt == self.retries:
+                        yield StreamedResponse(
+                            resp.status, resp.headers,
+                            resp.content.iter_chunked(STREAM_CHUNK))
+                        return
+                    headers = resp.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                raise RequestException(str(exc)) from exc
+            finally:
+                if self.on_response is not None:
+                    self.on_response(self.endpoint(url), status,
+                                     time.perf_counter() - started)
+            await self._back_off(headers, limited)
+
+    async def _get_json(self,
+                        path: str,
+                        params: dict[str, str] | None = None,
+                        limited: bool = True) -> ReturnAlias:
+        """Fetches an API path, sharing identical in-flight requests;
+        `limited` is False for paths the API key's rate limit does not
+        cover."""
+        key = (path.lower(), tuple(sorted((params or {}).items())))
+        return await self._inflight.do(
+            key, lambda: self._fetch_json(path, params, limited))
+
+    async def _fetch_json(self,
+                          path: str,
+                          params: dict[str, str] | None,
+                          limited: bool = True) -> ReturnAlias:
+        """Fetches an API path, or reads it from the cache backend."""
+        cache = self.backend
+        ttl = self.cache_ttls.get(path.split("/", 1)[0])
+        if cache is None or ttl is None:
+            resp = await self.request(self.api_url + path, params=params,
+                                      limited=limited)
+            return self._decode(resp.status, resp.body)
+        query = urlencode(sorted((params or {}).items()))
+        key = hashlib.sha256(f"{path.lower()}?{query}".encode()).hexdigest()
+        saved = await cache.get("api", key)
+        if saved is not None:
+            try:
+                status, data = loads(saved)
+                return data if status == 200 else int(status)
+            except (TypeError, ValueError):
+                pass
+        resp = await self.request(self.api_url + path, params=params,
+                                  limited=limited)
+        result = self._decode(resp.status, resp.body)
+        if resp.status in (200, 404):
+            cache.put("api", key, dumps([resp.status, result]), ttl)
+        return result
+
+    @staticmethod
+    @traced("transform")
+    def _decode(status: int, body: bytes) -> ReturnAlias:
+        """Returns the decoded list of a 200 response, else the status."""
+        if status != 200:
+            return status
+        data = json.loads(body)
+        if not isinstance(data, list):
+            return [data]
+        return data
+
+    async def search_all_breaches(self,
+                                  account: str,
+                                  truncate: bool = False,
+                                  domain: str | None = None,
+                                  unverified: bool = False) -> ReturnAlias:
+        """
+        Returns all breaches an account has been involved in.
+
+        Args:
+            account (str): The username or email address to search.
+            truncate (bool): Return only breach names when True.
+            domain (str | None): Only return breaches against this domain.
+            unverified (bool): Include breaches flagged as unverified.
+
+        Returns:
+            ReturnAlias: The breach list or the HTTP status code.
+        """
+        params: dict[str, str] = {}
+        if not truncate:
+            params["truncateResponse"] = "false"
+        if domain:
+            params["domain"] = domain
+        if unverified:
+            params["includeUnverified"] = "true"
+        return await self._get_json("breachedaccount/" +
+                                    quote(account, safe=""), params)
+
+    async def all_breaches(self, domain: str | None = None) -> ReturnAlias:
+        """
+        Returns every breached site in the system.
+
+        The breach endpoints need no API key, so they do not use the
+        key's rate limit.
+
+        Args:
+            domain (str | None): Only return breaches against this domain.
+
+        Returns:
+            ReturnAlias: The breach list or the HTTP status code.
+        """
+        params = {"domain": domain} if domain else None
+        return await self._get_json("breaches", params, limited=False)
+
+    async def single_breach(self, name: str) -> ReturnAlias:
+        """
+        Returns a single breached site queried by its stable name.
+
+        Args:
+            name (str): The breach name.
+
+        Returns:
+            ReturnAlias: A one item breach list or the HTTP status code.
+        """
+        return await self._get_json("breach/" + quote(name, safe=""),
+                                    limited=False)
+
+    async def latest_breach(self) -> ReturnAlias:
+        """
+        Returns the most recently added breach.
+
+        Returns:
+            ReturnAlias: A one item breach list or the HTTP status code.
+        """
+        return await self._get_json("latestbreach", limited=False)
+
+    def breached_domain(self, domain: str
+                        ) -> AbstractAsyncContextManager[StreamedResponse]:
+        """
+        Streams every breached email alias of a domain.
+
+        The domain must be verified for the API key's subscription. The
+        body is a JSON object mapping each alias to its breach names and
+        can be very large, so it is streamed rather than decoded.
+
+        Args:
+            domain (str): The verified domain, e.g. "example.com".
+
+        Returns:
+            AbstractAsyncContextManager[StreamedResponse]: The streamed
+                response; see `stream`.
+        """
+        return self.stream(self.api_url + "breacheddomain/" +
+                           quote(domain, safe=""))
+
+    async def search_pastes(self, account: str) -> ReturnAlias:
+        """
+        Returns all pastes for an email address, newest first.
+
+        Args:
+            account (str): The email address to search.
+
+        Returns:
+            ReturnAlias: The paste list or the HTTP status code.
+        """
+        return await self._get_json("pasteaccount/" + quote(account, safe=""))
+
+    async def search_hashes(self, prefix: str) -> int | str:
+        """
+        Returns the Pwned Passwords range response for a hash prefix.
+
+        Args:
+            prefix (str): At least the first 5 characters of a SHA-1 hash.
+
+        Returns:
+            int | str: The plaintext "SUFFIX:COUNT" lines or the HTTP
+                status code.
+        """
+        resp = await self.request(self.range_url + prefix[:5].upper(),
+                                  limited=False)
+        if resp.status != 200:
+            return resp.status
+        return resp.body.decode("ascii", errors="replace")
+
+    async def search_password(self, password: str) -> int | str:
+        """
+        Returns how many times a password appears in Pwned Passwords.
+
+        Only the first 5 characters of the password's SHA-1 hash are sent
+        to the API (k-Anonymity); the suffix is matched locally.
+
+        Args:
+            password (str): The plaintext password.
+
+        Returns:
+            int | str: The breach count as a string or the HTTP status code.
+        """
+        hexdig = sha1_hex(password)
+        hashes = await self.search_hashes(hexdig)
+        if isinstance(hashes, int):
+            return hashes
+        pnum = "0"
+        for item in hashes.splitlines():
+            if item[0:35] == hexdig[5:]:
+                pnum = item[36:]
+        return pnum
@@ -0,0 +1,165 @@
+"""
+In-memory breach logo pipeline for pwnedBot.
+
+Logos are fetched on their own keep-alive session, which never carries
+the HIBP API key to the logo host, resized off the event loop in a
+worker pool and kept as PNG bytes in a bounded cache keyed by the
+breach's LogoPath, so repeat requests for a logo cost nothing and no
+temporary files are written.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import asyncio
+import io
+import os
+import time
+from concurrent.futures import Executor
+from types import TracebackType
+from urllib.parse import urlparse
+import aiohttp
+from PIL import Image
+from requests.exceptions import RequestException
+from caches import TTLCache
+from hibp_client import HIBPClient, SingleFlight
+from profiling import tracer
+
+
+def logo_filename(url: str) -> str:
+    """
+    Returns the attachment filename for a resized logo.
+
+    Args:
+        url (str): The breach's LogoPath.
+
+    Returns:
+        str: The logo's base name with a .png extension.
+    """
+    name = os.path.splitext(os.path.basename(urlparse(url).path))[0]
+    return f"{name or 'logo'}.png"
+
+
+def resize_logo(data: bytes, width: int) -> bytes | None:
+    """
+    Scales an image to `width` pixels wide and encodes it as PNG.
+
+    Args:
+        data (bytes): The original image file contents.
+        width (int): The target width; the aspect ratio is kept.
+
+    Returns:
+        bytes | None: The PNG bytes, or None if the image could not be
+            decoded (e.g. an SVG logo).
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            wpercent = width / float(img.size[0])
+            hsize = int((float(img.size[1]) * float(wpercent)))
+            resized = img.resize((width, hsize), Image.Resampling.LANCZOS)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    out = io.BytesIO()
+    resized.save(out, format="PNG")
+    return out.getvalue()
+
+
+class LogoCache:
+    """
+    Fetches, resizes and caches breach logos as PNG bytes.
+
+    Concurrent requests for the same logo share one fetch and resize.
+    Logos that cannot be fetched or decoded are not cached.
+    """
+
+    def __init__(self,
+                 client: HIBPClient,
+                 width: int = 200,
+                 ttl: float = 86400.0,
+                 max_bytes: int = 16 * 1024 * 1024,
+                 executor: Executor | None = None) -> None:
+        self.client = client
+        self.width = width
+        self.executor = executor
+        self.cache: TTLCache[str, bytes] = TTLCache(ttl, max_bytes, len)
+        self._inflight: SingleFlight[bytes | None] = SingleFlight()
+        self._session: aiohttp.ClientSession | None = None
+
+    async def __aenter__(self) -> LogoCache:
+        return self
+
+    async def __aexit__(self, exc_type: type[BaseException] | None,
+                        exc: BaseException | None,
+                        tb: TracebackType | None) -> None:
+        await self.close()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """
+        The logo session, created on first use.
+
+        Only the User-Agent of the HIBP client is sent, never its API key.
+        """
+        if self._session is None or self._session.closed:
+            headers = {"User-Agent": self.client.headers["User-Agent"]}
+            self._session = aiohttp.ClientSession(
+                headers=headers, timeout=self.client.timeout)
+        return self._session
+
+    async def close(self) -> None:
+        """Closes the logo session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def get(self, url: str) -> bytes | None:
+        """
+        Returns the resized logo for a LogoPath.
+
+        Args:
+            url (str): The breach's LogoPath.
+
+        Returns:
+            bytes | None: The PNG bytes, or None if the logo is not
+                available.
+
+        Raises:
+            RequestException: If the logo could not be fetched.
+        """
+        image = self.cache.get(url)
+        if image is None:
+            image = await self._inflight.do(url, lambda: self._load(url))
+        return image
+
+    async def _load(self, url: str) -> bytes | None:
+        """Fetches and resizes a logo, caching the result."""
+        body = await self._fetch(url)
+        if body is None:
+            return None
+        loop = asyncio.get_running_loop()
+        with tracer.span("resize"):
+            image = await loop.run_in_executor(self.executor, resize_logo,
+                                               body, self.width)
+        if image is not None:
+            self.cache.put(url, image)
+        return image
+
+    async def _fetch(self, url: str) -> bytes | None:
+        """Downloads a logo, returning None unless the status is 200."""
+        started = time.perf_counter()
+        status = 0
+        try:
+            with tracer.span("fetch"):
+                async with self.session.get(url) as resp:
+                    status = resp.status
+                    return await resp.read() if resp.status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            raise RequestException(str(exc)) from exc
+        finally:
+            if self.client.on_response is not None:
+                self.client.on_response(self.client.endpoint(url), status,
+                                        time.perf_counter() - started)
@@ -0,0 +1,272 @@
+"""
+Prometheus text-format metrics for pwnedBot.
+
+A small registry of counters, gauges and histograms, an optional local
+HTTP endpoint serving them at /metrics, and an event loop lag monitor.
+Metrics are plain in-process objects; recording one is a dictionary
+update, so instrumentation stays cheap when nothing scrapes it.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import asyncio
+import bisect
+import time
+from collections.abc import Callable, Sequence
+from typing import Protocol
+from aiohttp import web
+
+LabelValues = tuple[str, ...]
+
+# Latency buckets in seconds, from cache hits to slow HIBP round trips
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
+
+
+class CacheStats(Protocol):
+    """What the cache metrics read from a cache."""
+
+    @property
+    def hits(self) -> int:
+        ...
+
+    @property
+    def misses(self) -> int:
+        ...
+
+    def __len__(self) -> int:
+        ...
+
+
+def _escape(value: str) -> str:
+    """Escapes a label value for the text exposition format."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str],
+            extra: str = "") -> str:
+    """Formats a label set, e.g. {command="search",le="0.5"}."""
+    pairs = [f'{name}="{_escape(value)}"'
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Base class of a named metric family with fixed label names."""
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str,
+                 labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+
+    def samples(self) -> list[str]:
+        """Returns the sample lines of this metric."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """Returns the HELP, TYPE and sample lines of this metric."""
+        lines = [f"# HELP {self.name} {self.doc}",
+                 f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """A monotonically increasing value per label set."""
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str,
+                 labels: Sequence[str] = ()) -> None:
+        super().__init__(name, doc, labels)
+        self.values: dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        """Adds `amount` to the value of a label set."""
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_labels(self.label_names, labels)} {value}"
+                for labels, value in sorted(self.values.items())]
+
+
+class Gauge(Counter):
+    """A value per label set that may go up and down."""
+    kind = "gauge"
+
+    def set(self, *labels: str, value: float) -> None:
+        """Sets the value of a label set."""
+        self.values[labels] = value
+
+
+class CallbackMetric(Metric):
+    """A counter or gauge whose values are read when scraped."""
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str],
+                 kind: str,
+                 collect: Callable[[], dict[LabelValues, float]]) -> None:
+        super().__init__(name, doc, labels)
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_labels(self.label_names, labels)} {value}"
+                for labels, value in sorted(self.collect().items())]
+
+
+class Histogram(Metric):
+    """Cumulative bucket counts, sum and count of observations."""
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(buckets)
+        self.counts: dict[LabelValues, list[int]] = {}
+        self.sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Records one observation for a label set."""
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[labels] = self.sums.get(labels, 0.0) + value
+
+    def samples(self) -> list[str]:
+        lines = []
+        for labels, counts in sorted(self.counts.items()):
+            total = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                total += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket = _labels(self.label_names, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket} {total}")
+            lines.append(f"{self.name}_sum"
+                         f"{_labels(self.label_names, labels)} "
+                         f"{self.sums[labels]}")
+            lines.append(f"{self.name}_count"
+                         f"{_labels(self.label_names, labels)} {total}")
+        return lines
+
+
+class Registry:
+    """A collection of metrics rendered together."""
+
+    def __init__(self) -> None:
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> None:
+        """Adds a metric to the registry."""
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text format."""
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+class BotMetrics:
+    """The metrics pwnedBot records."""
+
+    def __init__(self) -> None:
+        self.registry = Registry()
+        self.commands = Counter("pwnedbot_commands_total",
+                                "Commands invoked, by outcome.",
+                                ("command", "outcome"))
+        self.command_seconds = Histogram("pwnedbot_command_seconds",
+                                         "Command handler latency.",
+                                         ("command",))
+        self.hibp_responses = Counter("pwnedbot_hibp_responses_total",
+                                      "Upstream HIBP responses by status.",
+                                      ("endpoint", "status"))
+        self.hibp_seconds = Histogram("pwnedbot_hibp_request_seconds",
+                                      "Upstream HIBP request latency.",
+                                      ("endpoint",))
+        self.discord_messages = Counter("pwnedbot_discord_messages_total",
+                                        "Messages sent to Discord.",
+                                        ("command",))
+        self.loop_lag = Gauge("pwnedbot_event_loop_lag_seconds",
+                              "How late the event loop last woke a timer.")
+        self.caches: dict[str, CacheStats] = {}
+        self.queues: dict[str, Callable[[], int]] = {}
+        for metric in (self.commands, self.command_seconds,
+                       self.hibp_responses, self.hibp_seconds,
+                       self.discord_messages, self.loop_lag):
+            self.registry.register(metric)
+        self.registry.register(CallbackMetric(
+            "pwnedbot_cache_hits_total", "Cache lookups that hit.",
+            ("cache",), "counter",
+            lambda: {(n,): c.hits for n, c in self.caches.items()}))
+        self.registry.register(CallbackMetric(
+            "pwnedbot_cache_misses_total", "Cache lookups that missed.",
+            ("cache",), "counter",
+            lambda: {(n,): c.misses for n, c in self.caches.items()}))
+        self.registry.register(CallbackMetric(
+            "pwnedbot_cache_entries", "Entries held by each cache.",
+            ("cache",), "gauge",
+            lambda: {(n,): len(c) for n, c in self.caches.items()}))
+        self.registry.register(CallbackMetric(
+            "pwnedbot_queue_depth", "Work waiting in each queue.",
+            ("queue",), "gauge",
+            lambda: {(n,): depth() for n, depth in self.queues.items()}))
+
+    def observe_hibp(self, endpoint: str, status: int,
+                     seconds: float) -> None:
+        """
+        Records one upstream request; used as HIBPClient.on_response.
+
+        Args:
+            endpoint (str): The endpoint name, e.g. "breachedaccount".
+            status (int): The HTTP status, 0 for a network failure.
+            seconds (float): The request latency.
+        """
+        self.hibp_responses.inc(endpoint, str(status))
+        self.hibp_seconds.observe(seconds, endpoint)
+
+    async def monitor_loop_lag(self, interval: float = 0.5) -> None:
+        """
+        Measures how late the event loop wakes a sleeping task.
+
+        Args:
+            interval (float): Seconds between measurements.
+        """
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = time.perf_counter() - started - interval
+            self.loop_lag.set(value=max(0.0, lag))
+
+
+async def start_server(registry: Registry, host: str,
+                       port: int) -> web.AppRunner:
+    """
+    Serves the registry at http://host:port/metrics.
+
+    Args:
+        registry (Registry): The metrics to serve.
+        host (str): The interface to listen on.
+        port (int): The TCP port to listen on.
+
+    Returns:
+        web.AppRunner: The running server; call cleanup() to stop it.
+    """
+    async def handle(_: web.Request) -> web.Response:
+        return web.Response(text=registry.render(),
+                            content_type="text/plain",
+                            charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
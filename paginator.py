@@ -0,0 +1,312 @@
+"""
+Paginated, interactive embed views for large pwnedBot result sets.
+
+Instead of sending a whole result set as a wall of embeds, the first
+page is sent in one message with previous/next/jump buttons. The result
+set stays on the bot, and each page's embeds are only rendered when
+someone asks for that page. Views expire after an idle timeout, and a
+shared PageStore caps how many result rows all open views may hold.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import asyncio
+from collections import OrderedDict
+from collections.abc import Callable, Sequence
+from typing import Any, Generic, TypeVar
+import discord
+from delivery import MAX_EMBED_CHARS, MAX_EMBEDS, send, send_batched
+from profiling import tracer
+
+T = TypeVar("T")
+
+# Renders the rows of one page into at most one message worth of embeds
+Renderer = Callable[[Sequence[T]], list[discord.Embed]]
+
+
+def fit_page(items: Sequence[T], start: int, per_page: int,
+             render: Renderer[T],
+             reserve: int = 0) -> tuple[int, list[discord.Embed]]:
+    """
+    Renders the page starting at row `start` so it fits in one message.
+
+    The page holds up to `per_page` rows, fewer when its embeds would
+    pass Discord's embed count or character limits; only this page's
+    rows are rendered.
+
+    Args:
+        items (Sequence[T]): The full result set.
+        start (int): The index of the page's first row.
+        per_page (int): The most rows per page.
+        render (Renderer[T]): Renders one page of rows into embeds.
+        reserve (int): Characters kept free, e.g. for the page footer.
+
+    Returns:
+        tuple[int, list[discord.Embed]]: The index after the page's last
+            row, and the page's embeds.
+    """
+    budget = MAX_EMBED_CHARS - reserve
+    rows = min(per_page, len(items) - start)
+    while True:
+        embeds = render(items[start:start + rows])
+        size = sum(len(embed) for embed in embeds)
+        if rows <= 1 or (size <= budget and len(embeds) <= MAX_EMBEDS):
+            return start + max(rows, 0), embeds
+        rows = max(1, min(rows - 1, rows * budget // max(size, 1)))
+
+
+class PageStore:
+    """
+    Tracks open paginated views and caps the rows they hold.
+
+    When the total number of rows held by open views exceeds `max_rows`,
+    the oldest views are closed to make room.
+    """
+
+    def __init__(self, max_rows: int = 50000) -> None:
+        self.max_rows = max_rows
+        self.rows = 0
+        self.views: OrderedDict[int, PagedView[Any]] = OrderedDict()
+
+    def add(self, view: PagedView[Any]) -> None:
+        """
+        Registers a view, closing the oldest views if over the cap.
+
+        Args:
+            view (PagedView[Any]): The newly sent view.
+        """
+        self.views[id(view)] = view
+        self.rows += len(view.items)
+        while self.rows > self.max_rows and len(self.views) > 1:
+            _, oldest = self.views.popitem(last=False)
+            self.rows -= len(oldest.items)
+            oldest.release()
+
+    def remove(self, view: PagedView[Any]) -> None:
+        """
+        Forgets a view that has expired.
+
+        Args:
+            view (PagedView[Any]): The expired view.
+        """
+        if self.views.pop(id(view), None) is not None:
+            self.rows -= len(view.items)
+
+
+class JumpModal(discord.ui.Modal, title="Jump to page"):
+    """Asks for a page number to jump to."""
+
+    page: discord.ui.TextInput[JumpModal] = discord.ui.TextInput(
+        label="Page", max_length=6)
+
+    def __init__(self, view: PagedView[Any]) -> None:
+        super().__init__()
+        self.view = view
+        self.page.placeholder = f"1-{view.pages}"
+
+    async def on_submit(self, interaction: discord.Interaction) -> None:
+        try:
+            page = int(self.page.value) - 1
+        except ValueError:
+            page = self.view.page
+        await self.view.show(interaction, page)
+
+
+class PagedView(discord.ui.View, Generic[T]):
+    """
+    Button-driven pager over a result set held on the bot.
+
+    Pages hold up to `per_page` rows, fewer where the rows would not fit
+    in one message. Where each page ends is worked out when it is first
+    shown, so until the last page has been reached the page count is
+    only a lower bound, shown as e.g. "Page 1/200+"; jumping ahead
+    measures the pages in between. Only the user who ran the command may
+    turn pages.
+    Buttons are disabled once the view has been idle for `timeout`
+    seconds or is evicted from its PageStore.
+    """
+
+    def __init__(self,
+                 items: Sequence[T],
+                 per_page: int,
+                 render: Renderer[T],
+                 *,
+                 footer: str | None = None,
+                 owner_id: int | None = None,
+                 store: PageStore | None = None,
+                 timeout: float = 300.0) -> None:
+        super().__init__(timeout=timeout)
+        self.items = items
+        self.per_page = per_page
+        self.render = render
+        self.footer = footer
+        self.owner_id = owner_id
+        self.store = store
+        self.page = 0
+        self.message: discord.Message | None = None
+        self.reserve = len(f"Page {len(items)}/{len(items)}+ · "
+                           f"{footer or ''}")
+        # The first row of every page measured so far, then the row after
+        # the last of them
+        self.starts = [0]
+        self._disabling: asyncio.Task[None] | None = None
+
+    @property
+    def complete(self) -> bool:
+        """Whether every page has been measured."""
+        return len(self.starts) > 1 and self.starts[-1] >= len(self.items)
+
+    @property
+    def pages(self) -> int:
+        """Number of pages in the result set, or a lower bound on it
+        until every page has been measured."""
+        rest = len(self.items) - self.starts[-1]
+        return max(1, len(self.starts) - 1 - (-rest // self.per_page))
+
+    def page_embeds(self) -> list[discord.Embed]:
+        """Renders the embeds of the current page, first measuring the
+        pages up to it."""
+        embeds = None
+        while len(self.starts) <= self.page + 1 and not self.complete:
+            end, embeds = fit_page(self.items, self.starts[-1],
+                                   self.per_page, self.render, self.reserve)
+            self.starts.append(end)
+        if self.page > len(self.starts) - 2:
+            # Past the last page, which was found on the way
+            self.page = len(self.starts) - 2
+        elif len(self.starts) != self.page + 2:
+            embeds = None
+        start, end = self.starts[self.page], self.starts[self.page + 1]
+        if embeds is None:
+            embeds = self.render(self.items[start:end])
+        text = (f"Page {self.page + 1}/{self.pages}"
+                f"{'' if self.complete else '+'}")
+        if self.footer:
+            text = f"{text} · {self.footer.strip('*')}"
+        if embeds:
+            embeds[-1].set_footer(text=text)
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = end >= len(self.items)
+        return embeds
+
+    async def show(self, interaction: discord.Interaction, page: int) -> None:
+        """
+        Renders `page` and edits it into the message.
+
+        Args:
+            interaction (discord.Interaction): The button or modal
+                interaction to respond to.
+            page (int): The zero-based page to show, clamped to range.
+        """
+        self.page = min(max(page, 0), self.pages - 1)
+        await interaction.response.edit_message(embeds=self.page_embeds(),
+                                                view=self)
+
+    async def interaction_check(self,
+                                interaction: discord.Interaction) -> bool:
+        if self.owner_id is None or interaction.user.id == self.owner_id:
+            return True
+        await interaction.response.send_message(
+            "Only the user who ran this command can turn its pages.",
+            ephemeral=True)
+        return False
+
+    def release(self) -> None:
+        """Stops the view and drops its result set."""
+        self.stop()
+        self.items = []
+        self.starts = [0, 0]
+        self.page = 0
+        for child in self.children:
+            if isinstance(child, discord.ui.Button):
+                child.disabled = True
+        if self.message is not None:
+            # Kept so the task is not garbage collected while it runs
+            self._disabling = asyncio.get_running_loop().create_task(
+                self._disable())
+
+    async def _disable(self) -> None:
+        """Edits the message so its buttons show as disabled."""
+        if self.message is not None:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+    async def on_timeout(self) -> None:
+        if self.store is not None:
+            self.store.remove(self)
+        self.release()
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction,
+                            _: discord.ui.Button[PagedView[T]]) -> None:
+        """Shows the previous page."""
+        await self.show(interaction, self.page - 1)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction,
+                        _: discord.ui.Button[PagedView[T]]) -> None:
+        """Shows the next page."""
+        await self.show(interaction, self.page + 1)
+
+    @discord.ui.button(label="Jump", style=discord.ButtonStyle.primary)
+    async def jump(self, interaction: discord.Interaction,
+                   _: discord.ui.Button[PagedView[T]]) -> None:
+        """Asks for a page number to show."""
+        await interaction.response.send_modal(JumpModal(self))
+
+
+async def send_paginated(destination: discord.abc.Messageable,
+                         content: str,
+                         items: Sequence[T],
+                         per_page: int,
+                         render: Renderer[T],
+                         *,
+                         files: Sequence[discord.File] = (),
+                         footer: str | None = None,
+                         owner_id: int | None = None,
+                         store: PageStore | None = None,
+                         timeout: float = 300.0,
+                         ephemeral: bool = False) -> int:
+    """
+    Sends a result set as one page with navigation buttons.
+
+    Result sets that fit on a single page are sent without buttons.
+
+    Args:
+        destination (discord.abc.Messageable): Where to send.
+        content (str): Text sent with the first page.
+        items (Sequence[T]): The full result set.
+        per_page (int): Rows per page.
+        render (Renderer[T]): Renders one page of rows into embeds.
+        files (Sequence[discord.File]): Files to attach to the message.
+        footer (str | None): Attribution shown on every page.
+        owner_id (int | None): The only user allowed to turn pages.
+        store (PageStore | None): Caps the rows held by open views.
+        timeout (float): Idle seconds before the buttons are disabled.
+        ephemeral (bool): Show the result only to the invoking user; the
+            destination must then be a command context.
+
+    Returns:
+        int: The number of messages sent.
+    """
+    if len(items) <= per_page:
+        return await send_batched(destination, content, render(items),
+                                  files, footer, ephemeral)
+    options: dict[str, Any] = {"ephemeral": True} if ephemeral else {}
+    view = PagedView(items, per_page, render, footer=footer,
+                     owner_id=owner_id, store=store, timeout=timeout)
+    embeds = view.page_embeds()
+    with tracer.span("send"):
+        view.message = await send(destination, content=content,
+                                  embeds=embeds, files=list(files),
+                                  view=view, **options)
+    if store is not None:
+        store.add(view)
+    return 1
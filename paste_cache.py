@@ -0,0 +1,90 @@
+"""
+Per-account paste result cache for pwnedBot.
+
+`pastes` results are kept for a short time together with an index by
+paste Id, so a following `paste_id` on the same account is an in-memory
+lookup instead of another HIBP request and a scan of every paste.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+from typing import Any, NamedTuple
+from caches import TTLCache
+from hibp_client import HIBPClient, ReturnAlias
+
+
+class AccountPastes(NamedTuple):
+    """The pastes of one account and an index of them by paste Id."""
+    status: int
+    pastes: list[dict[str, Any]]
+    by_id: dict[str, dict[str, Any]]
+
+
+class PasteCache:
+    """
+    Short-lived cache of paste search results keyed by account.
+
+    Successful results and "not found" (404) answers are cached for `ttl`
+    seconds; other failures, such as rate limits, are not cached.
+    """
+
+    def __init__(self,
+                 client: HIBPClient,
+                 ttl: float = 300.0,
+                 max_accounts: int = 1000) -> None:
+        self.client = client
+        self.cache: TTLCache[str, AccountPastes] = TTLCache(ttl, max_accounts)
+
+    async def _lookup(self, account: str) -> AccountPastes:
+        """Returns the cached or freshly fetched pastes of an account."""
+        key = account.lower()
+        entry = self.cache.get(key)
+        if entry is None:
+            result = await self.client.search_pastes(account)
+            if isinstance(result, int):
+                entry = AccountPastes(result, [], {})
+            else:
+                entry = AccountPastes(200, result, {
+                    str(paste.get("Id")): paste
+                    for paste in result
+                })
+            if entry.status in (200, 404):
+                self.cache.put(key, entry)
+        return entry
+
+    async def search_pastes(self, account: str) -> ReturnAlias:
+        """
+        Returns all pastes for an email address, newest first.
+
+        Args:
+            account (str): The email address to search.
+
+        Returns:
+            ReturnAlias: The paste list or the HTTP status code.
+        """
+        entry = await self._lookup(account)
+        return entry.pastes if entry.status == 200 else entry.status
+
+    async def find_paste(self, account: str,
+                         paste_id: str) -> int | dict[str, Any] | None:
+        """
+        Returns a single paste of an account by its Id.
+
+        Args:
+            account (str): The email address to search.
+            paste_id (str): The Id of the paste.
+
+        Returns:
+            int | dict[str, Any] | None: The paste, None if the account has
+                no paste with that Id, or the HTTP status code of a failed
+                search.
+        """
+        entry = await self._lookup(account)
+        if entry.status != 200:
+            return entry.status
+        return entry.by_id.get(paste_id)
@@ -0,0 +1,322 @@
+"""
+On-demand profiling and per-command tracing for pwnedBot.
+
+`Profiler` captures what the live event loop thread spends its time on
+for a number of seconds, either with cProfile, as pstats data and a
+text report, or by sampling its stack, as collapsed stacks ready for
+flamegraph.pl or speedscope. Nothing is recorded outside a capture.
+
+`tracer` breaks each command down into phases such as fetch, transform,
+render and send. Hot paths mark their phase with `tracer.span` or the
+`traced` decorator; while tracing is off no trace is started, and a span
+costs one context variable lookup. Phases record self time, so a send
+that renders pages counts the rendering under render only. An HIBP
+request shared by several commands is traced under the one that made it.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import asyncio
+import cProfile
+import functools
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from collections.abc import Awaitable, Callable
+from contextlib import AbstractContextManager, nullcontext
+from contextvars import ContextVar
+from types import FrameType, TracebackType
+from typing import Any, ParamSpec, TypeVar
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+# Entered by spans while no trace is running
+NO_SPAN: AbstractContextManager[None] = nullcontext()
+
+
+class Trace:
+    """The phase timings of one command invocation."""
+    __slots__ = ("command", "started", "phases")
+
+    def __init__(self, command: str) -> None:
+        self.command = command
+        self.started = time.perf_counter()
+        # Phase -> [seconds, spans]
+        self.phases: dict[str, list[float]] = {}
+
+    def add(self, phase: str, seconds: float, spans: int = 1) -> None:
+        """Adds time to a phase."""
+        entry = self.phases.setdefault(phase, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += spans
+
+    def summary(self) -> str:
+        """
+        Formats the trace as one log line.
+
+        Time not spent in any span is reported as "other".
+
+        Returns:
+            str: e.g. "breach_name 12.1ms: fetch 9.0ms, render 1.2ms x2,
+                other 1.9ms".
+        """
+        total = time.perf_counter() - self.started
+        spans = sorted(self.phases.items(), key=lambda item: -item[1][0])
+        parts = [f"{phase} {seconds * 1000:.1f}ms" +
+                 (f" x{count:.0f}" if count > 1 else "")
+                 for phase, (seconds, count) in spans]
+        other = total - sum(seconds for seconds, _ in self.phases.values())
+        parts.append(f"other {max(0.0, other) * 1000:.1f}ms")
+        return f"{self.command} {total * 1000:.1f}ms: {', '.join(parts)}"
+
+
+current_trace: ContextVar[Trace | None] = ContextVar("current_trace",
+                                                     default=None)
+_active_span: ContextVar[Span | None] = ContextVar("active_span",
+                                                   default=None)
+
+
+class Span:
+    """
+    Times one phase of a traced command.
+
+    The enclosing span is paused while this one runs, so each phase
+    only records its own time.
+    """
+    __slots__ = ("trace", "phase", "parent", "resumed", "token")
+
+    def __init__(self, trace: Trace, phase: str) -> None:
+        self.trace = trace
+        self.phase = phase
+        self.parent: Span | None = None
+        self.resumed = 0.0
+        self.token: Any = None
+
+    def __enter__(self) -> None:
+        now = time.perf_counter()
+        self.parent = _active_span.get()
+        if self.parent is not None:
+            self.parent.trace.add(self.parent.phase,
+                                  now - self.parent.resumed, 0)
+        self.resumed = now
+        self.token = _active_span.set(self)
+
+    def __exit__(self, exc_type: type[BaseException] | None,
+                 exc: BaseException | None,
+                 tb: TracebackType | None) -> None:
+        now = time.perf_counter()
+        self.trace.add(self.phase, now - self.resumed)
+        _active_span.reset(self.token)
+        if self.parent is not None:
+            self.parent.resumed = now
+
+
+class Tracer:
+    """
+    Per-command phase tracer, off until `enabled` is set.
+
+    Finished traces are printed and the last `keep` are kept in
+    `recent`.
+    """
+
+    def __init__(self, keep: int = 50) -> None:
+        self.enabled = False
+        self.recent: deque[str] = deque(maxlen=keep)
+
+    def begin(self, command: str) -> None:
+        """
+        Starts tracing a command in the current context, if enabled.
+
+        Args:
+            command (str): The command name.
+        """
+        if self.enabled:
+            current_trace.set(Trace(command))
+
+    def finish(self) -> str | None:
+        """
+        Ends the current context's trace and logs it.
+
+        Returns:
+            str | None: The trace's summary, or None if none was running.
+        """
+        trace = current_trace.get()
+        if trace is None:
+            return None
+        current_trace.set(None)
+        line = trace.summary()
+        self.recent.append(line)
+        print(f"Trace {line}")
+        return line
+
+    def span(self, phase: str) -> AbstractContextManager[None]:
+        """
+        Returns a context manager timing a phase of the current trace.
+
+        Args:
+            phase (str): e.g. "fetch", "transform", "render" or "send".
+
+        Returns:
+            AbstractContextManager[None]: The span, or a shared no-op
+                when no trace is running.
+        """
+        trace = current_trace.get()
+        if trace is None:
+            return NO_SPAN
+        return Span(trace, phase)
+
+
+tracer = Tracer()
+
+
+def traced(phase: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """
+    Decorates a function so its calls are spans of `phase`.
+
+    Args:
+        phase (str): The phase the function's time counts towards.
+
+    Returns:
+        Callable[[Callable[P, R]], Callable[P, R]]: The decorator.
+    """
+    def decorate(func: Callable[P, R]) -> Callable[P, R]:
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            trace = current_trace.get()
+            if trace is None:
+                return func(*args, **kwargs)
+            with Span(trace, phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def traced_async(phase: str) -> Callable[[Callable[P, Awaitable[R]]],
+                                         Callable[P, Awaitable[R]]]:
+    """
+    Decorates a coroutine function so its calls are spans of `phase`.
+
+    Args:
+        phase (str): The phase the coroutine's time counts towards.
+
+    Returns:
+        Callable[[Callable[P, Awaitable[R]]], Callable[P, Awaitable[R]]]:
+            The decorator.
+    """
+    def decorate(func: Callable[P, Awaitable[R]]
+                 ) -> Callable[P, Awaitable[R]]:
+        @functools.wraps(func)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            trace = current_trace.get()
+            if trace is None:
+                return await func(*args, **kwargs)
+            with Span(trace, phase):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def frame_name(frame: FrameType) -> str:
+    """Returns a collapsed-stack label for a frame."""
+    code = frame.f_code
+    return (f"{code.co_name} "
+            f"({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+
+
+def sample_stacks(thread_id: int, seconds: float,
+                  interval: float) -> Counter[str]:
+    """
+    Samples a thread's stack every `interval` seconds.
+
+    Runs on its own thread.
+
+    Args:
+        thread_id (int): The thread to sample.
+        seconds (float): How long to sample for.
+        interval (float): Seconds between samples.
+
+    Returns:
+        Counter[str]: Samples per ";"-joined stack, outermost first.
+    """
+    stacks: Counter[str] = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        # pylint: disable-msg=protected-access
+        frame = sys._current_frames().get(thread_id)
+        names = []
+        while frame is not None:
+            names.append(frame_name(frame))
+            frame = frame.f_back
+        if names:
+            stacks[";".join(reversed(names))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+class Profiler:
+    """Runs one profile capture of the event loop thread at a time."""
+
+    def __init__(self) -> None:
+        self._lock = asyncio.Lock()
+
+    @property
+    def busy(self) -> bool:
+        """Whether a capture is running."""
+        return self._lock.locked()
+
+    async def cprofile(self, seconds: float,
+                       lines: int = 40) -> tuple[bytes, str]:
+        """
+        Profiles the event loop thread with cProfile.
+
+        Args:
+            seconds (float): How long to profile for.
+            lines (int): Functions listed in the text report.
+
+        Returns:
+            tuple[bytes, str]: The stats in the format pstats.Stats and
+                snakeviz load, and a report sorted by cumulative time.
+        """
+        async with self._lock:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+        profiler.create_stats()
+        # pstats.Stats takes the stats over from the profiler
+        data = marshal.dumps(profiler.stats)
+        report = io.StringIO()
+        stats = pstats.Stats(profiler, stream=report)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(lines)
+        return data, report.getvalue()
+
+    async def sample(self, seconds: float, interval: float = 0.005) -> str:
+        """
+        Samples the event loop thread's stack.
+
+        Args:
+            seconds (float): How long to sample for.
+            interval (float): Seconds between samples.
+
+        Returns:
+            str: Collapsed stacks, one "frame;frame;... count" per line.
+        """
+        async with self._lock:
+            stacks = await asyncio.to_thread(sample_stacks,
+                                             threading.get_ident(), seconds,
+                                             interval)
+        return "".join(f"{stack} {count}\n"
+                       for stack, count in stacks.most_common())
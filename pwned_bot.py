@@ -17,15 +17,40 @@ http://creativecommons.org/licenses/by/4.0/ or send a letter to
 Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
 """
 from __future__ import annotations
-import re
+import asyncio
+import gzip
+import io
+import multiprocessing
 import os
-import subprocess
+import time
+from collections.abc import AsyncIterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from contextvars import ContextVar
+from typing import Literal
 from requests.exceptions import RequestException
+from discord import app_commands
 from discord.ext import commands
-from PIL import Image
-import hibpwned
 import discord
 from dotenv import load_dotenv
+from admission import AdmissionController, Overloaded
+from audit import (audit_accounts, audit_passwords, export_rows,
+                   iter_url_lines, parse_accounts)
+from breach_catalog import BreachCatalog
+from breach_feed import BreachFeed, Subscriptions
+from breach_render import BreachRenderer
+from cache_backend import open_backend
+from delivery import SOURCE_FOOTER, on_send, send, send_batched
+from domain_search import export_domain
+from hibp_client import API_URL, RANGE_URL, HIBPClient, RateLimitError
+from logos import LogoCache, logo_filename
+from metrics import BotMetrics, start_server
+from paginator import PageStore, send_paginated
+from paste_cache import PasteCache
+from profiling import Profiler, traced, tracer
+from pwned_passwords import PasswordEngine
+from rate_limit import RequestScheduler, parse_priorities, request_origin
+from sharding import (create_bot, member_cache_flags, parse_intents,
+                      parse_shard_ids)
 
 load_dotenv()  # take environment variables from .env.
 
@@ -37,10 +62,6 @@ api_key = os.environ["HIBP_API_KEY"]
 # insert a unique identifier name here
 app_name = os.environ["APP_NAME"]
 
-# Pwned requires an account argument but the API doesn"t need one for
-# certain functions. This is a placeholder account to send to the API
-default_account = os.environ["DEFAULT_ACCOUNT"]
-
 # Discord Bot Token variable
 token = os.environ["DISCORD_TOKEN"]
 
@@ -50,15 +71,184 @@ client_id = os.environ["DISCORD_CLIENT_ID"]
 # Bot command prefix
 prefix = os.environ["BOT_PREFIX"]
 
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
+# HIBP API and Pwned Passwords base URLs, overridable for testing against a
+# local stand-in server
+api_url = os.environ.get("HIBP_API_URL", API_URL)
+range_url = os.environ.get("HIBP_RANGE_URL", RANGE_URL)
+
+# Requests per minute and burst size allowed by your HIBP API key tier
+rate_limit = float(os.environ.get("HIBP_RATE_LIMIT", "10"))
+rate_burst = int(os.environ.get("HIBP_RATE_BURST", "1"))
+
+# Optional "guild_id:priority,..." list; higher priority guilds are served
+# first when requests are queued for the rate limit
+guild_priorities = parse_priorities(os.environ.get("GUILD_PRIORITIES", ""))
+
+# Where password checks are answered: "remote" (HIBP API), "local" (a
+# Pwned Passwords index built with pwned_passwords.py) or "fallback"
+# (local index, asking the API for hashes the index does not contain)
+password_mode = os.environ.get("PASSWORD_MODE", "remote")
+password_index = os.environ.get("PASSWORD_INDEX")
+
+# Lifetime in seconds and memory ceiling in bytes of cached password
+# range responses
+range_cache_ttl = float(os.environ.get("RANGE_CACHE_TTL", "21600"))
+range_cache_bytes = int(os.environ.get("RANGE_CACHE_BYTES", "67108864"))
+
+# Seconds between conditional refreshes of the cached breach catalog
+catalog_ttl = float(os.environ.get("CATALOG_TTL", "3600"))
+
+# Persist the breach catalog, account breach and paste results and
+# password ranges in this SQLite file so they survive restarts, holding at
+# most CACHE_DB_BYTES of compressed data; leave CACHE_DB unset to disable
+cache_db = os.environ.get("CACHE_DB")
+cache_db_bytes = int(os.environ.get("CACHE_DB_BYTES", "268435456"))
+
+# Where to keep those results instead: "memory://", "sqlite:///<path>" or
+# "redis://[:password@]host[:port][/db]" to share them between processes
+cache_url = os.environ.get("CACHE_URL") or (f"sqlite:///{cache_db}"
+                                            if cache_db else None)
+
+# Seconds a Redis cache request may take before its lookups go to HIBP
+cache_timeout = float(os.environ.get("CACHE_TIMEOUT", "2"))
+
+# Seconds an account's breach results are reused from the cache
+account_cache_ttl = float(os.environ.get("ACCOUNT_CACHE_TTL", "3600"))
+
+# Seconds between checks for new breaches to post to subscribed
+# channels (0 disables the check), and where subscriptions are stored
+feed_interval = float(os.environ.get("FEED_INTERVAL", "300"))
+subscriptions_db = os.environ.get("SUBSCRIPTIONS_DB", "subscriptions.sqlite3")
+
+# Memory ceiling in bytes of cached, resized breach logos
+logo_cache_bytes = int(os.environ.get("LOGO_CACHE_BYTES", "16777216"))
+
+# Seconds a `pastes` result is reused, e.g. by a following `paste_id`
+paste_cache_ttl = float(os.environ.get("PASTE_CACHE_TTL", "300"))
+
+# Largest number of accounts one `audit` may check, and how many of its
+# lookups may wait on the rate limit scheduler at once
+audit_max_accounts = int(os.environ.get("AUDIT_MAX_ACCOUNTS", "5000"))
+audit_concurrency = int(os.environ.get("AUDIT_CONCURRENCY", "4"))
+
+# Worker processes used to hash `password_audit` files
+hash_workers = int(os.environ.get("HASH_WORKERS", "2"))
+
+# Serve Prometheus metrics at http://METRICS_HOST:METRICS_PORT/metrics;
+# leave METRICS_PORT unset to disable the endpoint
+metrics_port = os.environ.get("METRICS_PORT")
+metrics_host = os.environ.get("METRICS_HOST", "127.0.0.1")
+
+# Idle seconds before a paginated result stops responding, and the total
+# result rows all open paginated results may hold
+page_timeout = float(os.environ.get("PAGE_TIMEOUT", "300"))
+page_store_rows = int(os.environ.get("PAGE_STORE_ROWS", "50000"))
+
+# Commands one user may run at once, and how many more may wait
+user_concurrency = int(os.environ.get("USER_CONCURRENCY", "2"))
+user_queue = int(os.environ.get("USER_QUEUE", "2"))
+
+# Commands one server may run at once, and how many more may wait
+guild_concurrency = int(os.environ.get("GUILD_CONCURRENCY", "10"))
+guild_queue = int(os.environ.get("GUILD_QUEUE", "20"))
+
+# Seconds a command may wait for a slot before it is rejected
+admission_timeout = float(os.environ.get("ADMISSION_TIMEOUT", "30"))
+
+# Publish the slash command versions of the commands on startup
+sync_commands = os.environ.get("SYNC_COMMANDS",
+                               "1").lower() in ("1", "true", "yes")
+
+# Log each command's time spent fetching, rendering, sending etc.; the
+# owner's trace command switches this at runtime
+trace_commands = os.environ.get("TRACE_COMMANDS",
+                                "").lower() in ("1", "true", "yes")
+
+# Longest capture the owner's profile command may take, in seconds
+profile_max_seconds = float(os.environ.get("PROFILE_MAX_SECONDS", "300"))
+
+# Gateway intents as comma separated discord.Intents flag names, e.g.
+# "default,-typing"; the default intents plus message content when unset
+intents = parse_intents(os.environ.get("BOT_INTENTS"))
+
+# Which guild members are kept in memory: "none", "intents" or "all"
+member_cache = os.environ.get("MEMBER_CACHE", "none")
+
+# Sharding: SHARD_COUNT total shards and the SHARD_IDS run by this
+# process (set by the sharding.py launcher), or AUTO_SHARD=1 to run every
+# shard Discord recommends in this process
+shard_count = int(os.environ["SHARD_COUNT"]) if os.environ.get(
+    "SHARD_COUNT") else None
+shard_ids = parse_shard_ids(os.environ.get("SHARD_IDS"))
+auto_shard = os.environ.get("AUTO_SHARD", "").lower() in ("1", "true", "yes")
+
+# One shared, non-blocking HIBP client whose keep-alive connection pool
+# is reused by every command
+scheduler = RequestScheduler(rate_limit, rate_burst, guild_priorities)
+backend = (open_backend(cache_url, cache_db_bytes, cache_timeout)
+           if cache_url else None)
+hibp = HIBPClient(app_name, api_key, api_url=api_url, range_url=range_url,
+                  scheduler=scheduler, backend=backend,
+                  cache_ttls={"breachedaccount": account_cache_ttl,
+                              "pasteaccount": paste_cache_ttl})
+passwords = PasswordEngine(hibp, password_mode, password_index,
+                           range_cache_ttl, range_cache_bytes, backend)
+catalog = BreachCatalog(hibp, catalog_ttl, backend)
+renderer = BreachRenderer()
+catalog.listeners.append(renderer.sync)
+logos = LogoCache(hibp, max_bytes=logo_cache_bytes)
+pages = PageStore(page_store_rows)
+paste_cache = PasteCache(hibp, paste_cache_ttl)
+# Started by the first `password_audit`; see hash_executor
+hash_pool: ProcessPoolExecutor | None = None
+
+metrics = BotMetrics()
+hibp.on_response = metrics.observe_hibp
+metrics.caches.update({"password_ranges": passwords.ranges,
+                       "logos": logos.cache,
+                       "pastes": paste_cache.cache})
+if backend is not None:
+    metrics.caches["backend"] = backend
+metrics.queues["hibp_scheduler"] = lambda: scheduler.queued
+admission = AdmissionController(user_concurrency, guild_concurrency,
+                                user_queue, guild_queue, admission_timeout)
+metrics.queues["admission"] = lambda: admission.queued
+tracer.enabled = trace_commands
+profiler = Profiler()
+
+# When the running command started, for the command latency metric
+command_started: ContextVar[float] = ContextVar("command_started")
+# Admitted commands whose slots are still held
+running: set[commands.Context[commands.Bot]] = set()
+bot = create_bot(prefix, intents, member_cache_flags(member_cache, intents),
+                 shard_count, shard_ids, auto_shard)
+
+feed = BreachFeed(bot, hibp, catalog, Subscriptions(subscriptions_db),
+                  feed_interval)
+catalog.listeners.append(feed.on_catalog_change)
+
+
+def hash_executor() -> ProcessPoolExecutor:
+    """
+    Returns the process pool hashing `password_audit` files, starting it
+    on first use.
 
-pwned = hibpwned.Pwned
-bot = commands.Bot(command_prefix=prefix, intents=intents)
+    Its workers are spawned rather than forked: by then the bot has
+    threads, sockets and a running event loop, which a forked worker
+    would inherit in whatever state they happened to be in.
 
+    Returns:
+        ProcessPoolExecutor: The pool.
+    """
+    global hash_pool  # pylint: disable=global-statement
+    if hash_pool is None:
+        hash_pool = ProcessPoolExecutor(
+            max_workers=hash_workers,
+            mp_context=multiprocessing.get_context("spawn"))
+    return hash_pool
 
-def split_search(embed: discord.Embed, domain_list: list[dict[str, str]],
+
+def split_search(embed: discord.Embed, domain_list: Sequence[dict[str, str]],
                  min_num: int, max_num: int) -> None:
     """
     Splits a list of domain information and adds it to an embed.
@@ -69,9 +259,9 @@ def split_search(embed: discord.Embed, domain_list: list[dict[str, str]],
 
     Args:
         embed (discord.Embed): The embed to which fields will be added.
-        domain_list (list[dict[str, str]]): A list of dictionaries containing
-            domain information, where each dictionary represents a single
-            domain with keys as field names and values as field values.
+        domain_list (Sequence[dict[str, str]]): A list of dictionaries
+            containing domain information, where each dictionary represents a
+            single domain with keys as field names and values as field values.
         min_num (int): The starting index (inclusive) of the subset to add to
             the embed.
         max_num (int): The ending index (exclusive) of the subset to add to
@@ -90,22 +280,221 @@ def split_search(embed: discord.Embed, domain_list: list[dict[str, str]],
         embed.add_field(name="\u200b", value="\u200b", inline=True)
 
 
-def cleanhtml(raw_html: str) -> str:
+@traced("render")
+def split_embeds(domain_list: Sequence[dict[str, str]],
+                 size: int = 5) -> list[discord.Embed]:
+    """
+    Splits a list of domain information into embeds of `size` entries.
+
+    Args:
+        domain_list (Sequence[dict[str, str]]): A list of dictionaries
+            containing domain information, as accepted by `split_search`.
+        size (int): The number of entries per embed.
+
+    Returns:
+        list[discord.Embed]: One embed per `size` entries.
+    """
+    embeds = []
+    for i in range(0, len(domain_list), size):
+        embed = discord.Embed()
+        split_search(embed, domain_list, i, min(i + size, len(domain_list)))
+        embeds.append(embed)
+    return embeds
+
+
+@traced("render")
+def name_embeds(names: Sequence[str]) -> list[discord.Embed]:
+    """
+    Lists breach names as fields of embeds holding 25 names each.
+
+    Args:
+        names (Sequence[str]): The breach names.
+
+    Returns:
+        list[discord.Embed]: One embed per 25 names.
     """
-    Removes HTML tags from a raw HTML string.
+    embeds = []
+    for i in range(0, len(names), 25):
+        embed = discord.Embed()
+        for name in names[i:i + 25]:
+            embed.add_field(name=name, value="pwned")
+        embeds.append(embed)
+    return embeds
 
-    This function uses a regular expression to identify and remove all HTML
-    tags from the input string, leaving only the plain text content.
+
+async def defer(ctx: commands.Context[commands.Bot],
+                ephemeral: bool = False) -> None:
+    """
+    Acknowledges a slash command that may take a while to answer.
+
+    Does nothing for prefix commands, or when the interaction was already
+    acknowledged, e.g. by `before_command` while the command queued.
 
     Args:
-        raw_html (str): The raw HTML string to be cleaned.
+        ctx (commands.Context[commands.Bot]): The command's context.
+        ephemeral (bool): Whether the reply will only be shown to the
+            invoking user.
 
     Returns:
-        str: The cleaned string with HTML tags removed.
+        None
     """
-    cleanr = re.compile('<.*?>')
-    cleantext = re.sub(cleanr, '', raw_html)
-    return cleantext
+    if ctx.interaction is None or not ctx.interaction.response.is_done():
+        await ctx.defer(ephemeral=ephemeral)
+
+
+@bot.before_invoke
+async def before_command(ctx: commands.Context[commands.Bot]) -> None:
+    """
+    Prepares the context a command runs in.
+
+    Records the guild the command runs in for fair HIBP request scheduling
+    (direct messages are scheduled under the invoking user's ID instead)
+    and when it started, for the command latency metric and its trace, then
+    waits for admission control to let the command run.
+
+    Args:
+        ctx (commands.Context[commands.Bot]): The context in which the command
+            was called, providing access to the message, user, and other data.
+
+    Returns:
+        None
+
+    Raises:
+        Overloaded: If the user or server already has too many commands
+            running and waiting.
+    """
+    request_origin.set(ctx.guild.id if ctx.guild else ctx.author.id)
+    command_started.set(time.perf_counter())
+    tracer.begin(ctx.command.name if ctx.command else "unknown")
+    guild_id = ctx.guild.id if ctx.guild else None
+    if ctx.interaction is not None and admission.must_wait(ctx.author.id,
+                                                           guild_id):
+        # Interactions must be acknowledged within three seconds. The
+        # command's reply may be private, so the deferral has to be too.
+        await defer(ctx, ephemeral=True)
+    with tracer.span("queue"):
+        await admission.acquire(ctx.author.id, guild_id)
+    running.add(ctx)
+
+
+@bot.after_invoke
+async def after_command(ctx: commands.Context[commands.Bot]) -> None:
+    """
+    Finishes the command, see `finish_command`.
+
+    Slash commands skip this hook when they fail, so `on_command_error`
+    finishes those.
+
+    Args:
+        ctx (commands.Context[commands.Bot]): The context in which the command
+            was called, providing access to the message, user, and other data.
+
+    Returns:
+        None
+    """
+    finish_command(ctx)
+
+
+def finish_command(ctx: commands.Context[commands.Bot]) -> None:
+    """
+    Releases an admitted command's admission slots and records its
+    outcome, latency and trace, once.
+
+    Args:
+        ctx (commands.Context[commands.Bot]): The finished command's context.
+
+    Returns:
+        None
+    """
+    if ctx not in running:
+        return
+    running.discard(ctx)
+    admission.release(ctx.author.id, ctx.guild.id if ctx.guild else None)
+    name = ctx.command.name if ctx.command else "unknown"
+    outcome = "error" if ctx.command_failed else "ok"
+    metrics.commands.inc(name, outcome)
+    started = command_started.get(None)
+    if started is not None:
+        metrics.command_seconds.observe(time.perf_counter() - started, name)
+    tracer.finish()
+
+
+def count_sent_message(destination: discord.abc.Messageable) -> None:
+    """
+    Counts a message the bot sent, for the Discord send metric.
+
+    Messages sent for a command are counted under its name, and others,
+    such as breach alerts, under "none".
+
+    Args:
+        destination (discord.abc.Messageable): Where it was sent.
+
+    Returns:
+        None
+    """
+    command = (destination.command
+               if isinstance(destination, commands.Context) else None)
+    metrics.discord_messages.inc(command.name if command else "none")
+
+
+on_send.append(count_sent_message)
+
+
+@bot.event
+async def setup_hook() -> None:
+    """
+    Publishes the slash command versions of the commands to Discord.
+
+    Skipped when SYNC_COMMANDS is off, and in every sharded process but
+    the one running shard 0, as Discord rate limits command updates.
+
+    Returns:
+        None
+    """
+    if sync_commands and (shard_ids is None or 0 in shard_ids):
+        synced = await bot.tree.sync()
+        print(f"Synced {len(synced)} slash commands")
+
+
+@bot.event
+async def on_command_error(ctx: commands.Context[commands.Bot],
+                           error: commands.CommandError) -> None:
+    """
+    Replies with the command's usage when an argument is missing, and
+    explains commands shed by admission control or restricted to the bot
+    owner.
+
+    A user flooding commands is only told once until one of their
+    commands is admitted again. Other errors are handled by
+    discord.py's default handler. A failed command that was admitted is
+    finished here, as slash commands skip the after-invoke hook when
+    they fail.
+
+    Args:
+        ctx (commands.Context[commands.Bot]): The failed command's context.
+        error (commands.CommandError): The error it raised.
+
+    Returns:
+        None
+    """
+    finish_command(ctx)
+    if isinstance(error, Overloaded):
+        name = ctx.command.name if ctx.command else "unknown"
+        metrics.commands.inc(name, "rejected")
+        if error.notify or ctx.interaction is not None:
+            await send(ctx, f"{error}, please try again shortly.",
+                       ephemeral=True)
+        return
+    if isinstance(error, commands.NotOwner):
+        await send(ctx, "Only the bot owner can use this command.",
+                   ephemeral=True)
+        return
+    if isinstance(error, commands.MissingRequiredArgument) and ctx.command:
+        await send(ctx, f"Missing {error.param.name}. Usage: "
+                   f"{prefix}{ctx.command.name} {ctx.command.signature}",
+                   ephemeral=True)
+        return
+    await commands.Bot.on_command_error(bot, ctx, error)
 
 
 @bot.event
@@ -129,91 +518,89 @@ async def on_ready() -> None:
     print("------")
 
 
-@bot.command()
-async def password(ctx: commands.Context[commands.Bot], *args: str) -> None:
+@bot.hybrid_command()
+@app_commands.describe(password="The password to check.")
+async def password(ctx: commands.Context[commands.Bot], *,
+                   password: str) -> None:
     """
     Checks if a password has been compromised in data breaches.
 
     This command uses the provided password to search the Have I Been Pwned
     database to determine if the password has been compromised in any known
-    data breaches. The result is sent to the Discord channel.
+    data breaches. The result is sent to the Discord channel, or only to
+    the user when run as a slash command.
 
     Args:
         ctx (commands.Context[commands.Bot]): The context in which the command
             was called, providing access to the message, user, and other data.
-        *args (str): The password components entered by the user. The
-            components are joined together to form the full password.
+        password (str): The password entered by the user.
 
     Returns:
         None
     """
+    await defer(ctx, ephemeral=True)
     try:
-        paswd = " ".join(args)
-        breach_num = pwned(default_account, app_name,
-                           api_key).search_password(paswd)
-
-        if int(breach_num) == 429:
-            result = ("Your password has either been compromised and "
-                      "found 429 time in the database, or "
-                      "this request is rate limited. I am too lazy "
-                      "to fix this to tell the difference.")
-        if int(breach_num) > 0 and int(breach_num) != 429:
+        breach_num = await passwords.search_password(password)
+
+        files = []
+        if breach_num > 0:
             result = ("Your password has been compromised. "
                       f"It was found {breach_num} times in the database.")
-            await ctx.send(file=discord.File("images/warning-sign.png"))
-        elif int(breach_num) == 0:
-            result = "Your password has not been compromised."
+            files.append(discord.File("images/warning-sign.png"))
         else:
-            result = "ERROR: Something went wrong."
+            result = "Your password has not been compromised."
+
+        await send_batched(ctx, result, files=files, footer=SOURCE_FOOTER,
+                           ephemeral=True)
 
-        await ctx.send(result)
-        await ctx.send("*All data sourced from https://haveibeenpwned.com*")
+    except RateLimitError:
+        await send(ctx, "Rate limit exceeded. Wait a few minutes.",
+                   ephemeral=True)
 
     except RequestException:
         embed = discord.Embed(title="ERROR: Network Failure.", color=0xFF0000)
-        await ctx.send(embed=embed)
+        await send(ctx, embed=embed, ephemeral=True)
 
 
-@bot.command()
-async def search(ctx: commands.Context[commands.Bot], *args: str) -> None:
+# discord.py's hybrid_command typing rejects positional parameters
+@bot.hybrid_command()  # type: ignore[arg-type]
+@app_commands.describe(account="The username or email address to search.")
+async def search(ctx: commands.Context[commands.Bot], account: str) -> None:
     """
     Searches for breaches associated with an email address.
 
     This command checks the Have I Been Pwned database to determine if the
     provided email address has been involved in any data breaches. The results
-    are sent to the Discord channel in batches of 20, with the breach details
+    are sent to the Discord channel as embeds of 5 breaches, with up to 50
+    breaches per page and buttons to turn pages, with the breach details
     including the domain and breach name.
 
     Args:
         ctx (commands.Context[commands.Bot]): The context in which the command
             was called, providing access to the message, user, and other data.
-        *args (str): The email address to be searched.
+        account (str): The username or email address to be searched.
 
     Returns:
         None
     """
     # pylint: disable-msg=too-many-locals
 
+    await defer(ctx, ephemeral=True)
     try:
-        email = args[0]
         domain_list: list[dict[str, str]] = []
-        result = pwned(email, app_name, api_key).search_all_breaches()
+        result = await hibp.search_all_breaches(account)
 
         if isinstance(result, list) and result:
             breach_num = len(result)
         elif isinstance(result, int) and result == 429:
             error = "Rate limit exceeded. Wait a few minutes."
-            await ctx.send(error)
+            await send(ctx, error, ephemeral=True)
             raise RequestException
         else:
             raise TypeError
 
-        mod = breach_num % 5
         num_txt = (f"Your account was found in {breach_num} "
                    "database breaches.\nThose breaches are:")
-        await ctx.send(file=discord.File("images/warning-sign.png"))
-        await ctx.send(num_txt)
-        embed = discord.Embed()
 
         for data in result:
             if isinstance(data, dict):
@@ -225,38 +612,30 @@ async def search(ctx: commands.Context[commands.Bot], *args: str) -> None:
                     name_value, (str, int)) else "Unknown"
                 domain_list.append({"Name": name, "Domain": domain})
 
-        for i in range(breach_num // 5):
-            if i * 5 < breach_num:
-                embed = discord.Embed()
-                split_search(embed, domain_list, i * 5, (i * 5) + 5)
-                await ctx.send(embed=embed)
-
-        if mod > 0:
-            embed = discord.Embed()
-            split_search(embed, domain_list,
-                         len(domain_list) - mod, len(domain_list))
-            await ctx.send(embed=embed)
-
-        await ctx.send("*All data sourced from https://haveibeenpwned.com*")
+        await send_paginated(ctx, num_txt, domain_list, 50, split_embeds,
+                             files=[discord.File("images/warning-sign.png")],
+                             footer=SOURCE_FOOTER, owner_id=ctx.author.id,
+                             store=pages, timeout=page_timeout,
+                             ephemeral=True)
 
     except TypeError:
         error = "The account could not be found and was therefore not pwned."
-        await ctx.send(error)
+        await send(ctx, error, ephemeral=True)
 
     except RequestException:
         embed = discord.Embed(title="ERROR: Network Failure.", color=0xFF0000)
-        await ctx.send(embed=embed)
+        await send(ctx, embed=embed, ephemeral=True)
 
 
-@bot.command()
+@bot.hybrid_command()
 async def breaches(ctx: commands.Context[commands.Bot]) -> None:
     """
     Retrieves and displays a list of all known breached sites.
 
     This command queries the Have I Been Pwned database to retrieve a list of
     all known breached sites. The results are sent to the Discord channel in
-    chunks of 25 sites per message. Each site name is listed as a field in a
-    Discord embed.
+    embeds of 25 sites, 150 sites per page with buttons to turn pages. Each
+    site name is listed as a field in a Discord embed.
 
     Args:
         ctx (commands.Context[commands.Bot]): The context in which the command
@@ -265,55 +644,52 @@ async def breaches(ctx: commands.Context[commands.Bot]) -> None:
     Returns:
         None
     """
+    await defer(ctx)
     try:
-        result = pwned(default_account, app_name, api_key).all_breaches()
+        result = await catalog.all_breaches()
 
         if isinstance(result, list):
             breach_num = len(result)
         elif isinstance(result, int) and result == 429:
             error = "Rate limit exceeded. Wait a few minutes."
-            await ctx.send(error)
+            await send(ctx, error)
             raise RequestException
         else:
             raise RequestException
 
         num_txt = f"There are {breach_num} breached sites in the database."
-        await ctx.send(num_txt)
-        embed = discord.Embed()
         names = []
 
         for data in result:
             names.append(data["Name"])
 
-        for i in range(0, len(names), 25):
-            chunk = names[i:i + 25]
-            embed.clear_fields()
-
-            for j in chunk:
-                embed.add_field(name=j, value="pwned")
-            await ctx.send(embed=embed)
-
-        await ctx.send("*All data sourced from https://haveibeenpwned.com*")
+        await send_paginated(ctx, num_txt, names, 150, name_embeds,
+                             footer=SOURCE_FOOTER, owner_id=ctx.author.id,
+                             store=pages, timeout=page_timeout)
 
     except RequestException:
         embed = discord.Embed(title="ERROR: Network Failure.", color=0xFF0000)
-        await ctx.send(embed=embed)
+        await send(ctx, embed=embed)
 
 
-@bot.command()
-async def breach_name(ctx: commands.Context[commands.Bot], *args: str) -> None:
+@bot.hybrid_command()
+@app_commands.describe(name="The breach name, title or domain.")
+async def breach_name(ctx: commands.Context[commands.Bot], *,
+                      name: str) -> None:
     """
     Retrieves and displays detailed information about a specific breach.
 
     This command queries the Have I Been Pwned database to retrieve detailed
-    information about a specific breach identified by its name. The results
-    are formatted and sent to the Discord channel, including a description,
-    associated links, and the breach's logo image if available.
+    information about a specific breach identified by its name, title or
+    domain, ignoring case and spacing, and suggests similar names when
+    nothing matches. The results are formatted and sent to the Discord
+    channel, including a description, associated links, and the breach's
+    logo image if available.
 
     Args:
         ctx (commands.Context[commands.Bot]): The context in which the command
             was called, providing access to the message, user, and other data.
-        *args (str): The name of the breach site, which may consist of multiple
+        name (str): The name of the breach site, which may consist of multiple
             words, to search in the Have I Been Pwned database.
 
     Returns:
@@ -323,114 +699,108 @@ async def breach_name(ctx: commands.Context[commands.Bot], *args: str) -> None:
     # pylint: disable-msg=too-many-statements
     # pylint: disable-msg=too-many-branches
 
+    await defer(ctx)
     try:
-        site_name = " ".join(args)
-        result_list = pwned(default_account, app_name,
-                            api_key).single_breach(name=site_name)
+        result_list = await catalog.single_breach(name)
 
         if isinstance(result_list, list) and result_list:
             result = result_list[0]
         elif isinstance(result_list, int) and result_list == 429:
             error = "Rate limit exceeded. Wait a few minutes."
-            await ctx.send(error)
+            await send(ctx, error)
             raise RequestException
         else:
             raise TypeError
 
-        embed = discord.Embed()
-        link = []
-        img_name = ""
-        logo = result["LogoPath"] if isinstance(result["LogoPath"],
-                                                str) else ""
-        desc = result["Description"] if isinstance(result["Description"],
-                                                   str) else ""
-
-        if logo is not None or logo != "":
-            basewidth = 200
-            img_name_list = re.findall(r"[^/\&\?]+\.\w{3,4}", logo)
-            img_name = img_name_list[1]
-            subprocess.run(["curl", "-s", "-O", logo], check=True)
-            img: Image.Image = Image.open(img_name)
-            wpercent = basewidth / float(img.size[0])
-            hsize = int((float(img.size[1]) * float(wpercent)))
-            img = img.resize((basewidth, hsize), Image.Resampling.LANCZOS)
-            img.save(img_name)
-            await ctx.send(file=discord.File(img_name))
-            os.remove(img_name)
-
-        try:
-            link = re.findall('(https?.*?)"', desc)
-        except (KeyError, NameError, TypeError):
-            pass
-
-        result["Description"] = cleanhtml(desc).replace('&quot;', '"')
-
-        for key, value in result.items():
-            value = "None" if value is None or value == "" else value
-
-            if key != "LogoPath":
-                embed.add_field(name=f"{key}", value=f"{value}")
-
-        await ctx.send(embed=embed)
+        rendered = renderer.get(result)
+        files = []
+        if rendered.logo:
+            try:
+                image = await logos.get(rendered.logo)
+            except RequestException as exc:
+                # The logo is optional; send the breach without it
+                print(f"Logo download failed: {exc}")
+                image = None
+            if image is not None:
+                files.append(discord.File(io.BytesIO(image),
+                                          filename=logo_filename(
+                                              rendered.logo)))
+
+        await send_batched(ctx, embeds=[discord.Embed.from_dict(
+            rendered.embed)], files=files)
+
+        lines = []
+        if rendered.links:
+            lines.append("Breach Related Articles and Links:")
+            lines.extend(f"<{link}>" for link in rendered.links)
+
+        await send_batched(ctx, lines, footer=SOURCE_FOOTER)
+
+    except (AttributeError, TypeError):
+        error = f"Could not find {name} in the database."
+        suggestions = catalog.suggest(name)
+        if suggestions:
+            error += f"\nDid you mean: {', '.join(suggestions)}?"
+        await send(ctx, error)
 
-        if len(link) > 0:
-            await ctx.send("Breach Related Articles and Links:")
-            for i in link:
-                await ctx.send("<" + i + ">")
+    except RequestException:
+        embed = discord.Embed(title="ERROR: Network Failure.", color=0xFF0000)
+        await send(ctx, embed=embed)
 
-        await ctx.send("*All data sourced from https://haveibeenpwned.com*")
 
-    except (AttributeError, TypeError) as exc:
-        if isinstance(site_name, str):
-            error = f"Could not find {site_name} in the database."
-        else:
-            raise RequestException from exc
+@breach_name.autocomplete("name")
+async def complete_breach_name(_: discord.Interaction,
+                               current: str) -> list[app_commands.Choice[str]]:
+    """
+    Suggests breach names while the slash command is being typed.
 
-        await ctx.send(error)
+    Args:
+        _ (discord.Interaction): The autocomplete interaction.
+        current (str): What has been typed so far.
 
-    except RequestException:
-        embed = discord.Embed(title="ERROR: Network Failure.", color=0xFF0000)
-        await ctx.send(embed=embed)
+    Returns:
+        list[app_commands.Choice[str]]: Up to 25 matching breach names.
+    """
+    return [app_commands.Choice(name=name, value=name)
+            for name in catalog.complete(current, 25)]
 
 
-@bot.command()
-async def pastes(ctx: commands.Context[commands.Bot], *args: str) -> None:
+@bot.hybrid_command()  # type: ignore[arg-type]
+@app_commands.describe(email="The email address to search.")
+async def pastes(ctx: commands.Context[commands.Bot], email: str) -> None:
     """
     Searches for and displays information about pastes containing the
     given email.
 
     This command checks the Have I Been Pwned database for pastes that include
-    the provided email address. The results are sent to the Discord channel in
-    batches of 20, with details such as the title and paste ID of each result.
+    the provided email address. The results are sent to the Discord channel as
+    embeds of 5 pastes, up to 50 pastes per page with buttons to turn pages,
+    with details such as the title and paste ID of each result.
 
     Args:
         ctx (commands.Context[commands.Bot]): The context in which the command
             was called, providing access to the message, user, and other data.
-        *args (str): The email address to be searched.
+        email (str): The email address to be searched.
 
     Returns:
         None
     """
     # pylint: disable-msg=too-many-locals
 
+    await defer(ctx, ephemeral=True)
     try:
-        email = args[0]
-        result = pwned(email, app_name, api_key).search_pastes()
+        result = await paste_cache.search_pastes(email)
 
         if isinstance(result, list) and result:
             breach_num = len(result)
         elif isinstance(result, int) and result == 429:
             error = "Rate limit exceeded. Wait a few minutes."
-            await ctx.send(error)
+            await send(ctx, error, ephemeral=True)
             raise RequestException
         else:
             raise TypeError
 
-        mod = breach_num % 5
         num_txt = f"Your account was found in {breach_num} pastes."
-        await ctx.send(file=discord.File("images/warning-sign.png"))
-        await ctx.send(num_txt)
-        embed = discord.Embed()
         names: list[dict[str, str]] = []
 
         for data in result:
@@ -443,78 +813,426 @@ async def pastes(ctx: commands.Context[commands.Bot], *args: str) -> None:
             title_str = str(title)
             names.append({"Title": title_str, "Id": paste_id_str})
 
-        for i in range(breach_num // 5):
-            if i * 5 < breach_num:
-                split_search(embed, names, i * 5, (i * 5) + 5)
-                await ctx.send(embed=embed)
-
-        if mod > 0:
-            split_search(embed, names, (len(names) - mod), len(names))
-            await ctx.send(embed=embed)
-
-        await ctx.send("*All data sourced from https://haveibeenpwned.com*")
+        await send_paginated(ctx, num_txt, names, 50, split_embeds,
+                             files=[discord.File("images/warning-sign.png")],
+                             footer=SOURCE_FOOTER, owner_id=ctx.author.id,
+                             store=pages, timeout=page_timeout,
+                             ephemeral=True)
 
     except TypeError:
         error = (
             "The account could not be found and has therefore not been pwned.")
-        await ctx.send(error)
+        await send(ctx, error, ephemeral=True)
 
     except RequestException:
         embed = discord.Embed(title="ERROR: Network Failure.", color=0xFF0000)
-        await ctx.send(embed=embed)
+        await send(ctx, embed=embed, ephemeral=True)
 
 
-@bot.command()
-async def paste_id(ctx: commands.Context[commands.Bot], *args: str) -> None:
+@bot.hybrid_command()  # type: ignore[arg-type]
+@app_commands.describe(email="The email address the paste contains.",
+                       paste="The paste's ID.")
+async def paste_id(ctx: commands.Context[commands.Bot], email: str,
+                   paste: str) -> None:
     """
     Retrieves and displays information about a specific paste by ID.
 
     This command searches the Have I Been Pwned database for pastes that
     include the provided email address and retrieves details for the specified
-    paste ID. The results are formatted and sent to the Discord channel.
+    paste ID, reusing a recent `pastes` result for the same address when one
+    is cached. The results are formatted and sent to the Discord channel.
 
     Args:
         ctx (commands.Context[commands.Bot]): The context in which the command
             was called, providing access to the message, user, and other data.
-        *args (str): The email address and paste ID to search for in the
-            Have I Been Pwned database.
+        email (str): The email address to search for in the Have I Been
+            Pwned database.
+        paste (str): The ID of the paste.
 
     Returns:
         None
     """
+    await defer(ctx, ephemeral=True)
     try:
-        email = args[0]
-        i_d = args[1]
-    except IndexError:
-        error = "Please supply and email address and a paste id"
-        await ctx.send(error)
-
-    try:
-        result = pwned(email, app_name, api_key).search_pastes()
-        embed = discord.Embed(title=i_d)
+        result = await paste_cache.find_paste(email, paste)
+        embed = discord.Embed(title=paste)
 
-        if isinstance(result, list) and result:
-            for data in result:
-                if data["Id"] == i_d:
-                    for key, value in data.items():
-                        embed.add_field(name=key, value=value, inline=False)
+        if isinstance(result, dict):
+            for key, value in result.items():
+                embed.add_field(name=key, value=value, inline=False)
         elif isinstance(result, int) and result == 429:
             error = "Rate limit exceeded. Wait a few minutes."
-            await ctx.send(error)
+            await send(ctx, error, ephemeral=True)
             raise RequestException
         else:
             raise TypeError
 
-        await ctx.send(embed=embed)
-        await ctx.send("*All data sourced from https://haveibeenpwned.com*")
+        await send_batched(ctx, embeds=[embed], footer=SOURCE_FOOTER,
+                           ephemeral=True)
 
     except TypeError:
-        error = f"Could not find {i_d} in database."
-        await ctx.send(error)
+        error = f"Could not find {paste} in database."
+        await send(ctx, error, ephemeral=True)
 
     except RequestException:
         embed = discord.Embed(title="ERROR: Network Failure.", color=0xFF0000)
-        await ctx.send(embed=embed)
+        await send(ctx, embed=embed, ephemeral=True)
+
+
+@bot.command()
+async def audit(ctx: commands.Context[commands.Bot], *args: str) -> None:
+    """
+    Checks a list of accounts for breaches and returns a results file.
+
+    Accounts may be given inline or in attached text/CSV files. They are
+    checked concurrently, paced by the HIBP rate limit, while a single
+    progress message is kept up to date. The results are sent as one
+    gzip-compressed CSV file, or JSON when the first argument is "json".
+
+    Args:
+        ctx (commands.Context[commands.Bot]): The context in which the command
+            was called, providing access to the message, user, and other data.
+        *args (str): An optional output format followed by the accounts to
+            check.
+
+    Returns:
+        None
+    """
+    fmt = "csv"
+    if args and args[0].lower() in ("csv", "json"):
+        fmt = args[0].lower()
+        args = args[1:]
+
+    text = "\n".join(args)
+    for attachment in ctx.message.attachments:
+        data = await attachment.read()
+        text += "\n" + data.decode("utf-8", errors="replace")
+    accounts = parse_accounts(text)
+
+    if not accounts:
+        error = "Please supply accounts inline or as an attached text file."
+        await send(ctx, error)
+        return
+    if len(accounts) > audit_max_accounts:
+        error = (f"Too many accounts; an audit may check at most "
+                 f"{audit_max_accounts}.")
+        await send(ctx, error)
+        return
+
+    status = await send(ctx, f"Auditing {len(accounts)} accounts...")
+
+    async def report(done: int, total: int) -> None:
+        try:
+            await status.edit(content=f"Audited {done}/{total} accounts...")
+        except discord.HTTPException:
+            pass
+
+    # Queue audit lookups separately from the guild's interactive commands
+    request_origin.set(("audit", request_origin.get()))
+    rows = await audit_accounts(hibp, accounts, audit_concurrency, report)
+
+    pwned_num = sum(1 for row in rows if row.status == "pwned")
+    clean_num = sum(1 for row in rows if row.status == "clean")
+    embed = discord.Embed(title="Audit complete", color=0xEEE657)
+    embed.add_field(name="Accounts", value=f"{len(rows)}")
+    embed.add_field(name="Pwned", value=f"{pwned_num}")
+    embed.add_field(name="Not pwned", value=f"{clean_num}")
+    embed.add_field(name="Errors", value=f"{len(rows) - pwned_num - clean_num}")
+    data = export_rows(rows, fmt)
+    attachment_file = discord.File(io.BytesIO(data),
+                                   filename=f"audit.{fmt}.gz")
+    await status.edit(content=f"Audited {len(rows)}/{len(rows)} accounts.")
+    await send_batched(ctx, embeds=[embed], files=[attachment_file],
+                       footer=SOURCE_FOOTER)
+
+
+@bot.command()
+async def password_audit(ctx: commands.Context[commands.Bot]) -> None:
+    """
+    Checks attached password or SHA-1 hash lists against Pwned Passwords.
+
+    Attached files are streamed line by line in chunks, hashed in worker
+    processes and looked up partitioned by hash prefix. A summary is sent with
+    a gzip-compressed CSV giving the compromised count of every line; the
+    passwords themselves are never echoed back.
+
+    Args:
+        ctx (commands.Context[commands.Bot]): The context in which the command
+            was called, providing access to the message, user, and other data.
+
+    Returns:
+        None
+    """
+    attachments = list(ctx.message.attachments)
+    if not attachments:
+        error = "Please attach a file with one password or SHA-1 hash per line."
+        await send(ctx, error)
+        return
+
+    async def lines() -> AsyncIterator[str]:
+        for attachment in attachments:
+            async for line in iter_url_lines(attachment.url):
+                yield line
+
+    status = await send(ctx, "Auditing passwords...")
+
+    async def report(done: int, total: int) -> None:
+        text = (f"Audited {done}/{total} lines..." if total else
+                f"Read {done} lines...")
+        try:
+            await status.edit(content=text)
+        except discord.HTTPException:
+            pass
+
+    try:
+        data, summary = await audit_passwords(passwords, lines(),
+                                              hash_executor(),
+                                              progress=report)
+    except RateLimitError:
+        await send(ctx, "Rate limit exceeded. Wait a few minutes.")
+        return
+    except ValueError as exc:
+        await send(ctx, f"Could not read the file: {exc}.")
+        return
+    except RequestException:
+        embed = discord.Embed(title="ERROR: Network Failure.", color=0xFF0000)
+        await send(ctx, embed=embed)
+        return
+
+    embed = discord.Embed(title="Password audit complete", color=0xEEE657)
+    embed.add_field(name="Lines", value=f"{summary.lines}")
+    embed.add_field(name="Compromised", value=f"{summary.compromised}")
+    embed.add_field(name="Highest count", value=f"{summary.max_count}")
+    files = []
+    limit = ctx.guild.filesize_limit if ctx.guild else 8 * 1024 * 1024
+    if len(data) <= limit:
+        files.append(discord.File(io.BytesIO(data),
+                                  filename="password_audit.csv.gz"))
+    else:
+        embed.description = "The results file is too large to upload here."
+    await status.edit(content=f"Audited {summary.lines} lines.")
+    await send_batched(ctx, embeds=[embed], files=files, footer=SOURCE_FOOTER)
+
+
+async def server_count() -> int:
+    """
+    Returns the number of servers the bot is in.
+
+    A process that runs only some of the shards sees only their servers,
+    so Discord's approximate count for the whole application is used.
+
+    Returns:
+        int: The server count.
+    """
+    if shard_ids is None:
+        return len(bot.guilds)
+    app_info = await bot.application_info()
+    return app_info.approximate_guild_count
+
+
+# Replies to failed domain searches, by HTTP status
+DOMAIN_ERRORS = {
+    403: "That domain is not verified for this bot's HIBP API key.",
+    404: "No breached email addresses were found on that domain.",
+    429: "Rate limit exceeded. Wait a few minutes.",
+}
+
+
+@bot.hybrid_command()  # type: ignore[arg-type]
+@commands.is_owner()
+@app_commands.describe(domain="A domain verified for the bot's API key.",
+                       output="The format of the results file.")
+async def domain_search(ctx: commands.Context[commands.Bot], domain: str,
+                        output: Literal["csv", "json"] = "csv") -> None:
+    """
+    Lists every breached email address of a verified domain.
+
+    Only the bot owner may search domains, as the results name everyone
+    at the domain. However many addresses there are, the response is
+    streamed into one gzip-compressed CSV or JSON attachment, which is
+    sent with a short summary.
+
+    Args:
+        ctx (commands.Context[commands.Bot]): The context in which the command
+            was called, providing access to the message, user, and other data.
+        domain (str): The domain to search.
+        output (Literal["csv", "json"]): The format of the results file.
+
+    Returns:
+        None
+    """
+    await defer(ctx, ephemeral=True)
+    limit = ctx.guild.filesize_limit if ctx.guild else 8 * 1024 * 1024
+    try:
+        status, data, summary = await export_domain(hibp, domain, output,
+                                                    limit)
+    except RequestException:
+        embed = discord.Embed(title="ERROR: Network Failure.", color=0xFF0000)
+        await send(ctx, embed=embed, ephemeral=True)
+        return
+    except ValueError:
+        embed = discord.Embed(title="ERROR: HIBP returned an unreadable "
+                              "domain search.", color=0xFF0000)
+        await send(ctx, embed=embed, ephemeral=True)
+        return
+    if status != 200:
+        error = DOMAIN_ERRORS.get(status, f"Domain search failed ({status}).")
+        await send(ctx, error, ephemeral=True)
+        return
+
+    embed = discord.Embed(title=f"Domain search: {domain}", color=0xEEE657)
+    embed.add_field(name="Breached addresses", value=f"{summary.aliases:,}")
+    embed.add_field(name="Breaches", value=f"{summary.breaches:,}")
+    if summary.top:
+        embed.add_field(name="Most common",
+                        value="\n".join(f"{name} ({count:,})"
+                                        for name, count in summary.top),
+                        inline=False)
+    if summary.truncated:
+        embed.description = ("The results were cut short to fit the upload "
+                             "limit.")
+    attachment_file = discord.File(io.BytesIO(data),
+                                   filename=f"{domain}.{output}.gz")
+    await send_batched(ctx, embeds=[embed], files=[attachment_file],
+                       footer=SOURCE_FOOTER, ephemeral=True)
+
+
+@bot.command()
+@commands.is_owner()
+async def profile(ctx: commands.Context[commands.Bot], seconds: float = 10.0,
+                  mode: Literal["cprofile", "sample"] = "cprofile") -> None:
+    """
+    Profiles the running bot and uploads the results.
+
+    Only the bot owner may profile the bot. Everything the bot does for
+    the given number of seconds is recorded, either with cProfile, as a
+    .prof file for pstats or snakeviz plus a text report, or by sampling
+    the stack, as collapsed stacks for flamegraph.pl or speedscope.
+
+    Args:
+        ctx (commands.Context[commands.Bot]): The context in which the command
+            was called, providing access to the message, user, and other data.
+        seconds (float): How long to profile for.
+        mode (Literal["cprofile", "sample"]): The profiler to use.
+
+    Returns:
+        None
+    """
+    if profiler.busy:
+        await send(ctx, "A profile is already being captured.")
+        return
+    seconds = min(max(seconds, 1.0), profile_max_seconds)
+    await send(ctx, f"Profiling the bot for {seconds:g} seconds.")
+    name = f"pwnedbot-{time.strftime('%Y%m%d-%H%M%S')}"
+    if mode == "sample":
+        stacks = (await profiler.sample(seconds)).encode()
+        limit = ctx.guild.filesize_limit if ctx.guild else 8 * 1024 * 1024
+        if len(stacks) > limit:
+            files = [discord.File(io.BytesIO(gzip.compress(stacks)),
+                                  filename=f"{name}.collapsed.gz")]
+        else:
+            files = [discord.File(io.BytesIO(stacks),
+                                  filename=f"{name}.collapsed")]
+    else:
+        stats, report = await profiler.cprofile(seconds)
+        files = [discord.File(io.BytesIO(stats), filename=f"{name}.prof"),
+                 discord.File(io.BytesIO(report.encode()),
+                              filename=f"{name}.txt")]
+    await send_batched(ctx, f"Profile of {seconds:g} seconds ({mode}).",
+                       files=files)
+
+
+@bot.command()
+@commands.is_owner()
+async def trace(ctx: commands.Context[commands.Bot],
+                state: Literal["on", "off"] | None = None) -> None:
+    """
+    Switches command tracing on or off, or shows the latest traces.
+
+    Only the bot owner may trace commands. While tracing is on, the
+    time every command spends queueing, fetching, transforming,
+    rendering and sending is logged as one line per command.
+
+    Args:
+        ctx (commands.Context[commands.Bot]): The context in which the command
+            was called, providing access to the message, user, and other data.
+        state (Literal["on", "off"] | None): The new state, or None to
+            show the latest traces.
+
+    Returns:
+        None
+    """
+    if state is not None:
+        tracer.enabled = state == "on"
+    lines = [f"Command tracing is {'on' if tracer.enabled else 'off'}."]
+    if state is None and tracer.recent:
+        lines.append("Latest traces:")
+        lines.extend(f"`{line}`" for line in list(tracer.recent)[-10:])
+    await send_batched(ctx, lines)
+
+
+@bot.command()
+async def subscribe(ctx: commands.Context[commands.Bot]) -> None:
+    """
+    Subscribes the channel to new and updated breach alerts.
+
+    Only members who can manage the channel may subscribe it.
+
+    Args:
+        ctx (commands.Context[commands.Bot]): The context in which the command
+            was called, providing access to the message, user, and other data.
+
+    Returns:
+        None
+    """
+    if not await can_manage_feed(ctx) or ctx.guild is None:
+        return
+    if await feed.subscriptions.add(ctx.channel.id, ctx.guild.id):
+        await send(ctx, "This channel will now be alerted to new and updated "
+                   "breaches.")
+    else:
+        await send(ctx, "This channel is already subscribed.")
+
+
+@bot.command()
+async def unsubscribe(ctx: commands.Context[commands.Bot]) -> None:
+    """
+    Stops breach alerts in the channel.
+
+    Args:
+        ctx (commands.Context[commands.Bot]): The context in which the command
+            was called, providing access to the message, user, and other data.
+
+    Returns:
+        None
+    """
+    if not await can_manage_feed(ctx):
+        return
+    if await feed.subscriptions.remove(ctx.channel.id):
+        await send(ctx, "This channel will no longer receive breach alerts.")
+    else:
+        await send(ctx, "This channel is not subscribed.")
+
+
+async def can_manage_feed(ctx: commands.Context[commands.Bot]) -> bool:
+    """
+    Checks that the invoker may change the channel's breach alerts,
+    replying with the reason if not.
+
+    Args:
+        ctx (commands.Context[commands.Bot]): The command context.
+
+    Returns:
+        bool: Whether the invoker can manage the channel.
+    """
+    if ctx.guild is None or not isinstance(ctx.author, discord.Member):
+        await send(ctx, "Breach alerts are only available in servers.")
+        return False
+    if not ctx.channel.permissions_for(ctx.author).manage_channels:
+        await send(ctx, "You need the Manage Channels permission to change "
+                   "breach alerts.")
+        return False
+    return True
 
 
 @bot.command()
@@ -540,11 +1258,12 @@ async def info(ctx: commands.Context[commands.Bot]) -> None:
             "having been compromised or 'pwned' in a data breach.")
     embed = discord.Embed(title="Hibpwned", description=desc, color=0xEEE657)
     embed.add_field(name="Author", value="plasticuproject")
-    embed.add_field(name="Server count", value=f"{len(bot.guilds)}")
+    embed.add_field(name="Server count", value=f"{await server_count()}")
     embed.add_field(name="Invite",
                     value=("https://discordapp.com/oauth2/authorize?"
-                           f"client_id={client_id}&scope=bot"))
-    await ctx.send(embed=embed)
+                           f"client_id={client_id}"
+                           "&scope=bot+applications.commands"))
+    await send(ctx, embed=embed)
 
 
 bot.remove_command("help")
@@ -571,6 +1290,8 @@ async def help(ctx: commands.Context[commands.Bot]) -> None:
             "service, a free resource for anyone to quickly assess if they "
             "may have been put at risk due to an online account of theirs "
             "having been compromised or 'pwned' in a data breach. "
+            "The lookup commands are also available as slash commands, "
+            "which reply privately for passwords, accounts and pastes. "
             "List of commands are:")
     embed = discord.Embed(title="Hibpwned", description=desc, color=0xEEE657)
     embed.add_field(
@@ -601,13 +1322,86 @@ async def help(ctx: commands.Context[commands.Bot]) -> None:
         value=("(*email_address paste_id*) Will return details of a paste "
                "containing your email address. "),
         inline=False)
+    embed.add_field(
+        name=f"{prefix}audit",
+        value=("([*json*] *accounts* or attached file) Checks many accounts "
+               "at once and returns the results as a compressed CSV or JSON "
+               "file."),
+        inline=False)
+    embed.add_field(
+        name=f"{prefix}password_audit",
+        value=("(attached file) Checks a list of passwords or SHA-1 hashes "
+               "and returns the compromised count of every line."),
+        inline=False)
+    embed.add_field(
+        name=f"{prefix}domain_search",
+        value=("(*domain* [*csv*/*json*]) Bot owner only. Lists every "
+               "breached address of a domain verified for the bot's API "
+               "key as a compressed file."),
+        inline=False)
+    embed.add_field(
+        name=f"{prefix}profile",
+        value=("([*seconds*] [*cprofile*/*sample*]) Bot owner only. "
+               "Profiles the bot and uploads the results."),
+        inline=False)
+    embed.add_field(
+        name=f"{prefix}trace",
+        value=("([*on*/*off*]) Bot owner only. Switches logging of each "
+               "command's time per phase, or shows the latest traces."),
+        inline=False)
+    embed.add_field(
+        name=f"{prefix}subscribe",
+        value="Posts new and updated breaches in this channel.",
+        inline=False)
+    embed.add_field(name=f"{prefix}unsubscribe",
+                    value="Stops breach alerts in this channel.",
+                    inline=False)
     embed.add_field(name=f"{prefix}info",
                     value="Gives a info about this bot.",
                     inline=False)
     embed.add_field(name=f"{prefix}help",
                     value="Gives this message.",
                     inline=False)
-    await ctx.send(embed=embed)
+    await send(ctx, embed=embed)
+
+
+async def main() -> None:
+    """
+    Runs the bot until it is closed.
 
+    The breach catalog starts loading and the breach feed starts watching
+    in the background and, if enabled, the metrics endpoint is served.
+    The shared HIBP client and logo sessions and hashing processes are shut
+    down, and pending cache backend writes are committed, after the bot
+    disconnects.
 
-bot.run(token)
+    Returns:
+        None
+    """
+    discord.utils.setup_logging()
+    async with hibp, bot:
+        catalog.start()
+        feed.start()
+        lag_monitor = asyncio.create_task(metrics.monitor_loop_lag())
+        metrics_server = None
+        if metrics_port:
+            metrics_server = await start_server(metrics.registry,
+                                                metrics_host,
+                                                int(metrics_port))
+        try:
+            await bot.start(token)
+        finally:
+            lag_monitor.cancel()
+            if metrics_server is not None:
+                await metrics_server.cleanup()
+            await feed.stop()
+            await catalog.stop()
+            await logos.close()
+            if backend is not None:
+                await backend.close()
+            if hash_pool is not None:
+                hash_pool.shutdown(cancel_futures=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
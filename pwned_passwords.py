@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+"""
+Offline Pwned Passwords engine for pwnedBot.
+
+A downloaded Pwned Passwords SHA-1 dump is converted into a compact,
+sorted binary index which is memory-mapped and searched with a
+prefix-bucketed binary search. Several bot processes mapping the same
+file share its pages through the OS page cache.
+
+Index layout (all integers little-endian):
+
+    header   8s magic, uint64 record count
+    buckets  (2 ** 20 + 1) uint32 record offsets, one per 5 hex
+             character hash prefix plus an end marker
+    records  18 byte hash remainder (bytes 2-19 of the digest) followed
+             by a uint32 breach count, sorted by hash
+
+Build or refresh an index with:
+
+    python pwned_passwords.py build pwnedpasswords.txt pwned.idx
+
+where the source is either a file of "HASH:COUNT" lines ordered by hash
+or a directory of per-prefix range files ("21BD1.txt" holding
+"SUFFIX:COUNT" lines) as written by the official downloader. The new
+index replaces the old one atomically, and running bots pick it up on
+their next lookup.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from collections.abc import Iterator, Sequence
+from requests.exceptions import RequestException
+from caches import TTLCache
+from cache_backend import CacheBackend
+from hibp_client import HIBPClient, RateLimitError, SingleFlight, sha1_hex
+
+MAGIC = b"PWNDIDX1"
+HEADER = struct.Struct("<8sQ")
+BUCKET_BITS = 20
+BUCKETS = 1 << BUCKET_BITS
+OFFSET = struct.Struct("<I")
+KEY_SIZE = 18
+COUNT = struct.Struct("<I")
+RECORD_SIZE = KEY_SIZE + COUNT.size
+TABLE_START = HEADER.size
+RECORDS_START = TABLE_START + (BUCKETS + 1) * OFFSET.size
+# Ranges count_hashes reads from the cache backend in one request
+PREFETCH_RANGES = 64
+
+# Password lookup modes selectable with the PASSWORD_MODE setting
+MODES = ("remote", "local", "fallback")
+
+
+def _bucket(digest: bytes) -> int:
+    """Returns the 20 bit k-anonymity prefix of a raw SHA-1 digest."""
+    return (digest[0] << 12) | (digest[1] << 4) | (digest[2] >> 4)
+
+
+class LocalPasswordIndex:
+    """
+    Read-only, memory-mapped Pwned Passwords index.
+
+    The index file is re-mapped automatically when it is replaced by a
+    rebuild, checked at most once every `reload_interval` seconds.
+    """
+
+    def __init__(self, path: str, reload_interval: float = 60.0) -> None:
+        self.path = path
+        self.reload_interval = reload_interval
+        self.count = 0
+        self._map: mmap.mmap | None = None
+        self._stat: tuple[int, int] = (0, 0)
+        self._checked = 0.0
+        self._open()
+
+    def _open(self) -> None:
+        """Maps the index file and validates its header."""
+        with open(self.path, "rb") as index_file:
+            stat = os.fstat(index_file.fileno())
+            mapped = mmap.mmap(index_file.fileno(), 0,
+                               access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC or len(mapped) != (RECORDS_START +
+                                             count * RECORD_SIZE):
+            mapped.close()
+            raise ValueError(f"{self.path} is not a valid password index")
+        old, self._map = self._map, mapped
+        if old is not None:
+            old.close()
+        self.count = count
+        self._stat = (stat.st_ino, stat.st_mtime_ns)
+        self._checked = time.monotonic()
+
+    def _maybe_reload(self) -> None:
+        """Re-maps the index if the file on disk has been replaced."""
+        now = time.monotonic()
+        if now - self._checked < self.reload_interval:
+            return
+        self._checked = now
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+        if (stat.st_ino, stat.st_mtime_ns) != self._stat:
+            self._open()
+
+    def close(self) -> None:
+        """Unmaps the index file."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def lookup_hash(self, hexdigest: str) -> int:
+        """
+        Returns the breach count of a SHA-1 hash, or 0 if it is absent.
+
+        Args:
+            hexdigest (str): The 40 character SHA-1 hex digest.
+
+        Returns:
+            int: The number of times the hash appears in the dump.
+        """
+        self._maybe_reload()
+        mapped = self._map
+        if mapped is None:
+            raise ValueError("password index is closed")
+        digest = bytes.fromhex(hexdigest)
+        key = digest[2:]
+        bucket = _bucket(digest)
+        low = OFFSET.unpack_from(mapped, TABLE_START + bucket * OFFSET.size)[0]
+        high = OFFSET.unpack_from(mapped,
+                                  TABLE_START + (bucket + 1) * OFFSET.size)[0]
+        while low < high:
+            mid = (low + high) // 2
+            start = RECORDS_START + mid * RECORD_SIZE
+            probe = mapped[start:start + KEY_SIZE]
+            if probe < key:
+                low = mid + 1
+            elif probe > key:
+                high = mid
+            else:
+                return int(COUNT.unpack_from(mapped, start + KEY_SIZE)[0])
+        return 0
+
+    def search_password(self, password: str) -> int:
+        """
+        Returns how many times a plaintext password appears in the dump.
+
+        Args:
+            password (str): The plaintext password.
+
+        Returns:
+            int: The breach count, 0 if the password was not found.
+        """
+        return self.lookup_hash(sha1_hex(password))
+
+
+class PasswordRange:
+    """
+    Compact parsed form of one Pwned Passwords range response.
+
+    Hash suffixes are stored as sorted 18 byte keys in a single bytes
+    object alongside an array of counts, which is a fraction of the size
+    of the raw "SUFFIX:COUNT" text and is searched with a binary search.
+    """
+    __slots__ = ("keys", "counts")
+
+    def __init__(self, text: str) -> None:
+        entries: list[tuple[bytes, int]] = []
+        for line in text.splitlines():
+            suffix, _, count = line.strip().partition(":")
+            # Padding entries added by the API carry a zero count
+            if len(suffix) == 35 and count and count != "0":
+                entries.append((bytes.fromhex("0" + suffix), int(count)))
+        entries.sort()
+        self.keys = b"".join(key for key, _ in entries)
+        self.counts = array("I", (count for _, count in entries))
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by this range."""
+        return (sys.getsizeof(self.keys) +
+                self.counts.itemsize * len(self.counts) + 64)
+
+    def lookup(self, suffix: str) -> int:
+        """
+        Returns the breach count of a hash suffix, or 0 if it is absent.
+
+        Args:
+            suffix (str): The last 35 hex characters of a SHA-1 hash.
+
+        Returns:
+            int: The number of times the hash appears in the range.
+        """
+        key = bytes.fromhex("0" + suffix)
+        low, high = 0, len(self.counts)
+        while low < high:
+            mid = (low + high) // 2
+            probe = self.keys[mid * KEY_SIZE:(mid + 1) * KEY_SIZE]
+            if probe < key:
+                low = mid + 1
+            elif probe > key:
+                high = mid
+            else:
+                return self.counts[mid]
+        return 0
+
+
+class PasswordEngine:
+    """
+    Answers password checks locally, remotely, or locally with a remote
+    fallback.
+
+    In "fallback" mode the remote API is only asked when the local index
+    cannot be opened or does not contain the hash, which covers passwords
+    added to Pwned Passwords after the dump was downloaded. Remote range
+    responses are kept in a prefix-keyed LRU cache bounded by `cache_ttl`
+    seconds and `cache_bytes` of parsed data, and concurrent misses for the
+    same prefix share one fetch. With a cache backend, range responses are
+    also stored there for `cache_ttl` seconds, so they survive restarts
+    and, with a shared backend, are fetched once for all processes.
+    """
+
+    def __init__(self,
+                 client: HIBPClient,
+                 mode: str = "remote",
+                 index_path: str | None = None,
+                 cache_ttl: float = 21600.0,
+                 cache_bytes: int = 64 * 1024 * 1024,
+                 backend: CacheBackend | None = None) -> None:
+        if mode not in MODES:
+            raise ValueError(f"PASSWORD_MODE must be one of {MODES}")
+        self.client = client
+        self.mode = mode
+        self.index: LocalPasswordIndex | None = None
+        self.cache_ttl = cache_ttl
+        self.ranges: TTLCache[str, PasswordRange] = TTLCache(
+            cache_ttl, cache_bytes, lambda rng: rng.nbytes)
+        self.backend = backend
+        self._inflight: SingleFlight[PasswordRange] = SingleFlight()
+        if mode != "remote":
+            if not index_path:
+                raise ValueError(f"PASSWORD_INDEX is required in {mode} mode")
+            try:
+                self.index = LocalPasswordIndex(index_path)
+            except (OSError, ValueError):
+                if mode == "local":
+                    raise
+                print(f"Error: could not open {index_path}, "
+                      "using the remote API")
+
+    async def get_range(self, prefix: str,
+                        check_backend: bool = True) -> PasswordRange:
+        """
+        Returns the parsed remote range for a hash prefix, cached.
+
+        Args:
+            prefix (str): The first 5 hex characters of a SHA-1 hash.
+            check_backend (bool): Whether to look for the range in the
+                cache backend before fetching it; False when the caller
+                already has.
+
+        Returns:
+            PasswordRange: The parsed range.
+
+        Raises:
+            RateLimitError: If the request stayed rate limited.
+            RequestException: If the range could not be fetched.
+        """
+        prefix = prefix[:5].upper()
+        rng = self.ranges.get(prefix)
+        if rng is None:
+            rng = await self._inflight.do(
+                prefix, lambda: self._fetch_range(prefix, check_backend))
+        return rng
+
+    async def _fetch_range(self, prefix: str,
+                           check_backend: bool = True) -> PasswordRange:
+        """Fetches, parses and caches the remote range for a prefix."""
+        saved = None
+        if self.backend is not None and check_backend:
+            saved = await self.backend.get("range", prefix)
+        if saved is not None:
+            hashes: int | str = saved.decode("ascii")
+        else:
+            hashes = await self.client.search_hashes(prefix)
+        if isinstance(hashes, int):
+            if hashes == 429:
+                raise RateLimitError(prefix)
+            raise RequestException(f"range {prefix} returned {hashes}")
+        if saved is None and self.backend is not None:
+            self.backend.put("range", prefix, hashes.encode("ascii"),
+                             self.cache_ttl)
+        rng = PasswordRange(hashes)
+        self.ranges.put(prefix, rng)
+        return rng
+
+    async def _cached_ranges(
+            self, prefixes: Sequence[str]) -> dict[str, PasswordRange]:
+        """Returns the ranges of `prefixes` held in memory or the cache
+        backend, reading the backend with one request."""
+        found: dict[str, PasswordRange] = {}
+        unread = []
+        for prefix in prefixes:
+            rng = self.ranges.get(prefix)
+            if rng is None:
+                unread.append(prefix)
+            else:
+                found[prefix] = rng
+        if self.backend is not None and unread:
+            saved = await self.backend.get_many("range", unread)
+            for prefix, value in zip(unread, saved):
+                if value is not None:
+                    rng = PasswordRange(value.decode("ascii"))
+                    self.ranges.put(prefix, rng)
+                    found[prefix] = rng
+        return found
+
+    async def search_password(self, password: str) -> int:
+        """
+        Returns how many times a password appears in Pwned Passwords.
+
+        Unlike the HIBP client, failures are raised rather than returned
+        so a status code can never be mistaken for a breach count.
+
+        Args:
+            password (str): The plaintext password.
+
+        Returns:
+            int: The breach count.
+
+        Raises:
+            RateLimitError: If the remote request stayed rate limited.
+            RequestException: If the remote request failed.
+        """
+        hexdig = sha1_hex(password)
+        if self.index is not None:
+            breach_num = self.index.lookup_hash(hexdig)
+            if breach_num or self.mode == "local":
+                return breach_num
+        rng = await self.get_range(hexdig)
+        return rng.lookup(hexdig[5:])
+
+    async def count_hashes(self,
+                           hexdigests: Sequence[str],
+                           concurrency: int = 16) -> list[int]:
+        """
+        Returns the breach count of many SHA-1 hashes.
+
+        Hashes are grouped by their 5 character prefix so each range is
+        read or fetched once for every hash that shares it, with up to
+        `concurrency` range fetches in flight. Saved ranges are read from
+        the cache backend `PREFETCH_RANGES` prefixes at a time.
+
+        Args:
+            hexdigests (Sequence[str]): Upper-case SHA-1 hex digests.
+            concurrency (int): Maximum concurrent remote range fetches.
+
+        Returns:
+            list[int]: The breach count of each hash, in input order.
+
+        Raises:
+            RateLimitError: If a remote request stayed rate limited.
+            RequestException: If a remote request failed.
+        """
+        counts = [0] * len(hexdigests)
+        remote: dict[str, list[int]] = {}
+        for position, hexdig in enumerate(hexdigests):
+            if self.index is not None:
+                counts[position] = self.index.lookup_hash(hexdig)
+                if counts[position] or self.mode == "local":
+                    continue
+            remote.setdefault(hexdig[:5], []).append(position)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fill(prefix: str, rng: PasswordRange | None) -> None:
+            if rng is None:
+                async with semaphore:
+                    rng = await self.get_range(prefix, check_backend=False)
+            for position in remote[prefix]:
+                counts[position] = rng.lookup(hexdigests[position][5:])
+
+        prefixes = list(remote)
+        for start in range(0, len(prefixes), PREFETCH_RANGES):
+            batch = prefixes[start:start + PREFETCH_RANGES]
+            cached = await self._cached_ranges(batch)
+            await asyncio.gather(*(fill(prefix, cached.get(prefix))
+                                   for prefix in batch))
+        return counts
+
+
+def _read_source(source: str) -> Iterator[tuple[bytes, int]]:
+    """Yields (digest, count) pairs from a dump file or range directory."""
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            prefix = name.split(".")[0].upper()
+            if len(prefix) != 5:
+                continue
+            with open(os.path.join(source, name), encoding="ascii") as rng:
+                for line in rng:
+                    suffix, _, count = line.strip().partition(":")
+                    if suffix:
+                        yield bytes.fromhex(prefix + suffix), int(count)
+        return
+    with open(source, encoding="ascii") as dump:
+        for line in dump:
+            hexdig, _, count = line.strip().partition(":")
+            if hexdig:
+                yield bytes.fromhex(hexdig), int(count or 0)
+
+
+def build_index(source: str, path: str) -> int:
+    """
+    Builds a password index from a Pwned Passwords SHA-1 dump.
+
+    The index is written next to `path` and moved into place once
+    complete, so processes reading the old index are never disturbed.
+
+    Args:
+        source (str): A "HASH:COUNT" dump ordered by hash, or a directory
+            of per-prefix range files.
+        path (str): Where to write the index.
+
+    Returns:
+        int: The number of hashes written.
+
+    Raises:
+        ValueError: If the source is not ordered by hash.
+    """
+    table = [0] * (BUCKETS + 1)
+    tmp_path = f"{path}.tmp"
+    count = 0
+    previous = b""
+    with open(tmp_path, "wb") as out:
+        out.seek(RECORDS_START)
+        for digest, breach_num in _read_source(source):
+            if digest <= previous:
+                raise ValueError("source must be ordered by hash")
+            previous = digest
+            table[_bucket(digest) + 1] += 1
+            out.write(digest[2:] + COUNT.pack(min(breach_num, 0xFFFFFFFF)))
+            count += 1
+        for bucket in range(BUCKETS):
+            table[bucket + 1] += table[bucket]
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, count))
+        out.write(struct.pack(f"<{BUCKETS + 1}I", *table))
+    os.replace(tmp_path, path)
+    return count
+
+
+def main() -> None:
+    """
+    Command line entry point for building and querying an index.
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build or refresh an index")
+    build.add_argument("source", help="hash dump file or range directory")
+    build.add_argument("index", help="index file to write")
+    query = sub.add_parser("query", help="look up a password")
+    query.add_argument("index", help="index file to read")
+    query.add_argument("password", help="plaintext password")
+    args = parser.parse_args()
+    if args.command == "build":
+        started = time.monotonic()
+        count = build_index(args.source, args.index)
+        print(f"Wrote {count} hashes to {args.index} "
+              f"in {time.monotonic() - started:.1f}s")
+    else:
+        index = LocalPasswordIndex(args.index)
+        print(index.search_password(args.password))
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Central HIBP request scheduler for pwnedBot.
+
+Every rate limited HIBP request waits for a token from one shared token
+bucket sized to the API key tier. Waiting requests are queued per guild
+and served round-robin, with higher priority guilds served first, and a
+`Retry-After` from the API pauses the whole bucket instead of letting
+other requests run into the same 429.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import asyncio
+import time
+from collections import deque
+from collections.abc import Hashable
+from contextvars import ContextVar
+
+# The guild (or other fairness key) a request is made on behalf of. Set
+# once per command invocation and read by the scheduler.
+request_origin: ContextVar[Hashable] = ContextVar("request_origin",
+                                                  default=None)
+
+
+def parse_priorities(spec: str) -> dict[Hashable, int]:
+    """
+    Parses a "guild_id:priority,..." setting into a priority mapping.
+
+    Args:
+        spec (str): Comma separated guild id and priority pairs.
+
+    Returns:
+        dict[Hashable, int]: Priorities keyed by integer guild id.
+    """
+    priorities: dict[Hashable, int] = {}
+    for item in spec.split(","):
+        guild, _, priority = item.strip().partition(":")
+        if guild:
+            priorities[int(guild)] = int(priority or 0)
+    return priorities
+
+
+class RequestScheduler:
+    """
+    Token bucket that hands out request slots fairly across guilds.
+
+    The bucket holds at most `burst` tokens and refills at `rate`
+    requests per minute. Each waiting request is queued under its origin
+    key; the dispatcher serves the highest priority origins first and
+    rotates between origins of equal priority so one busy guild cannot
+    starve the others.
+    """
+
+    def __init__(self,
+                 rate: float,
+                 burst: int = 1,
+                 priorities: dict[Hashable, int] | None = None) -> None:
+        self.rate = rate / 60.0
+        self.burst = burst
+        self.priorities = priorities or {}
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._queues: dict[Hashable, deque[asyncio.Future[None]]] = {}
+        self._order: deque[Hashable] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def queued(self) -> int:
+        """Number of requests waiting for a token."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def acquire(self, origin: Hashable = None) -> None:
+        """
+        Waits until a request on behalf of `origin` may be sent.
+
+        Args:
+            origin (Hashable): The fairness key, usually a guild id.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch())
+        future: asyncio.Future[None] = (
+            asyncio.get_running_loop().create_future())
+        if origin not in self._queues:
+            self._queues[origin] = deque()
+            self._order.append(origin)
+        self._queues[origin].append(future)
+        self._wakeup.set()
+        await future
+
+    def defer(self, delay: float) -> None:
+        """
+        Pauses all requests for `delay` seconds, e.g. from a Retry-After.
+
+        Args:
+            delay (float): Seconds to wait before the next request.
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        self.tokens = 0.0
+
+    async def close(self) -> None:
+        """Stops the dispatcher and cancels waiting requests."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for queue in self._queues.values():
+            for future in queue:
+                future.cancel()
+        self._queues.clear()
+        self._order.clear()
+
+    def _token_wait(self) -> float:
+        """Refills the bucket, returning seconds until a token is free."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            self.updated = self.paused_until
+            return self.paused_until - now
+        self.tokens = min(float(self.burst),
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def _next_queue(self) -> deque[asyncio.Future[None]] | None:
+        """Picks the queue to serve next, dropping empty queues."""
+        best: deque[asyncio.Future[None]] | None = None
+        best_origin: Hashable = None
+        best_priority = 0
+        for origin in list(self._order):
+            queue = self._queues[origin]
+            while queue and queue[0].done():
+                queue.popleft()
+            if not queue:
+                del self._queues[origin]
+                self._order.remove(origin)
+                continue
+            priority = self.priorities.get(origin, 0)
+            if best is None or priority > best_priority:
+                best, best_origin, best_priority = queue, origin, priority
+        if best is not None:
+            self._order.remove(best_origin)
+            self._order.append(best_origin)
+        return best
+
+    async def _dispatch(self) -> None:
+        """Grants tokens to queued requests as the bucket refills."""
+        while True:
+            if not self._order:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            wait = self._token_wait()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            # Requests cancelled while sleeping are skipped without
+            # spending a token
+            queue = self._next_queue()
+            if queue is not None:
+                self.tokens -= 1.0
+                queue.popleft().set_result(None)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+"""
+Sharding, gateway intents and member cache settings for pwnedBot.
+
+A single process can run every shard with discord.py's AutoShardedBot,
+or the launcher in this module can spread the shards over several
+worker processes, each running pwned_bot.py with its own share of the
+shards, HIBP rate limit and metrics port:
+
+    python sharding.py
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+from __future__ import annotations
+import asyncio
+import os
+import signal
+import sys
+from collections.abc import Sequence
+from typing import Any, cast
+import aiohttp
+import discord
+from discord.ext import commands
+from dotenv import load_dotenv
+
+GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
+
+# Member cache policies accepted by MEMBER_CACHE
+MEMBER_CACHE_POLICIES = ("none", "intents", "all")
+
+
+def parse_intents(spec: str | None) -> discord.Intents:
+    """
+    Builds the gateway intents from a comma separated list of names.
+
+    Names are discord.Intents flags such as "guilds" or "message_content";
+    a leading "-" turns a flag off. Without a spec, or for flags the spec
+    does not mention, the default intents plus message content are used.
+    Privileged intents such as "members" must also be enabled for the
+    application in the Discord developer portal.
+
+    Args:
+        spec (str | None): The intents, e.g. "default,-typing".
+
+    Returns:
+        discord.Intents: The intents to connect with.
+
+    Raises:
+        ValueError: If a name is not an intent flag.
+    """
+    intents = discord.Intents.default()
+    intents.message_content = True
+    for name in (spec or "").split(","):
+        name = name.strip().lower()
+        enable = not name.startswith("-")
+        name = name.lstrip("-+")
+        if not name or name == "default":
+            continue
+        if name not in discord.Intents.VALID_FLAGS:
+            raise ValueError(f"Unknown intent: {name}")
+        setattr(intents, name, enable)
+    return intents
+
+
+def member_cache_flags(policy: str,
+                       intents: discord.Intents) -> discord.MemberCacheFlags:
+    """
+    Returns which guild members discord.py keeps in memory.
+
+    "none" keeps no members beyond those attached to incoming events, so
+    memory does not grow with guild sizes; "intents" caches whatever the
+    enabled intents allow and "all" caches every member.
+
+    Args:
+        policy (str): One of MEMBER_CACHE_POLICIES.
+        intents (discord.Intents): The intents the bot connects with.
+
+    Returns:
+        discord.MemberCacheFlags: The member cache flags.
+
+    Raises:
+        ValueError: If the policy is unknown.
+    """
+    if policy == "none":
+        return discord.MemberCacheFlags.none()
+    if policy == "intents":
+        return discord.MemberCacheFlags.from_intents(intents)
+    if policy == "all":
+        return discord.MemberCacheFlags.all()
+    raise ValueError(f"Unknown member cache policy: {policy}")
+
+
+def parse_shard_ids(spec: str | None) -> list[int] | None:
+    """
+    Parses a comma separated list of shard IDs, e.g. "0,1,2".
+
+    Args:
+        spec (str | None): The shard IDs.
+
+    Returns:
+        list[int] | None: The shard IDs, or None to run every shard.
+    """
+    if not spec:
+        return None
+    return [int(shard) for shard in spec.split(",") if shard.strip()]
+
+
+def create_bot(prefix: str,
+               intents: discord.Intents,
+               member_cache: discord.MemberCacheFlags,
+               shard_count: int | None = None,
+               shard_ids: Sequence[int] | None = None,
+               auto_shard: bool = False) -> commands.Bot:
+    """
+    Creates the bot, sharded when asked to.
+
+    Guild member lists are never requested at startup, as no command
+    uses them.
+
+    Args:
+        prefix (str): The command prefix.
+        intents (discord.Intents): The gateway intents.
+        member_cache (discord.MemberCacheFlags): The member cache policy.
+        shard_count (int | None): Total shards across all processes; None
+            lets Discord recommend a count.
+        shard_ids (Sequence[int] | None): The shards this process runs;
+            None runs all of them.
+        auto_shard (bool): Run an AutoShardedBot even without a shard
+            count or IDs.
+
+    Returns:
+        commands.Bot: The bot, an AutoShardedBot when sharded.
+    """
+    options: dict[str, Any] = {
+        "command_prefix": prefix,
+        "intents": intents,
+        "member_cache_flags": member_cache,
+        "chunk_guilds_at_startup": False,
+    }
+    if not (auto_shard or shard_count or shard_ids):
+        return commands.Bot(**options)
+    if shard_ids is not None:
+        options["shard_ids"] = list(shard_ids)
+    # AutoShardedBot has Bot's interface without subclassing it
+    return cast(commands.Bot,
+                commands.AutoShardedBot(shard_count=shard_count, **options))
+
+
+def split_shards(shard_count: int, processes: int) -> list[list[int]]:
+    """
+    Spreads shard IDs evenly over worker processes.
+
+    Args:
+        shard_count (int): Total number of shards.
+        processes (int): Number of worker processes.
+
+    Returns:
+        list[list[int]]: The shard IDs of each process; processes that
+            would get no shards are left out.
+    """
+    groups = [list(range(shard_count))[index::processes]
+              for index in range(max(1, processes))]
+    return [group for group in groups if group]
+
+
+async def recommended_shards(token: str) -> int:
+    """
+    Asks Discord how many shards the bot should use.
+
+    Args:
+        token (str): The bot token.
+
+    Returns:
+        int: The recommended shard count.
+    """
+    headers = {"Authorization": f"Bot {token}"}
+    async with aiohttp.ClientSession(headers=headers) as session:
+        async with session.get(GATEWAY_URL) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+    return int(data["shards"])
+
+
+async def run_worker(env: dict[str, str], name: str) -> None:
+    """
+    Runs pwned_bot.py in a child process, restarting it if it crashes.
+
+    Args:
+        env (dict[str, str]): The child's environment.
+        name (str): A label for log lines, e.g. "shards 0,2".
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "pwned_bot.py")
+    delay = 1.0
+    while True:
+        proc = await asyncio.create_subprocess_exec(sys.executable, script,
+                                                    env=env)
+        try:
+            code = await proc.wait()
+        except asyncio.CancelledError:
+            if proc.returncode is None:
+                proc.terminate()
+                await proc.wait()
+            raise
+        if code == 0:
+            return
+        print(f"Worker for {name} exited with {code}; restarting in "
+              f"{delay:.0f}s", file=sys.stderr)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 60.0)
+
+
+async def launch() -> None:
+    """
+    Starts one worker process per group of shards and waits for them.
+
+    SHARD_PROCESSES sets the number of processes (one per CPU by
+    default) and SHARD_COUNT the total shards, otherwise Discord's
+    recommendation is used. Each process gets an equal share of
+    HIBP_RATE_LIMIT and HIBP_RATE_BURST (at least one request) so the
+    API key's limit holds across all of them, and, if METRICS_PORT is
+    set, its own consecutive metrics port.
+    """
+    load_dotenv()
+    token = os.environ["DISCORD_TOKEN"]
+    processes = int(os.environ.get("SHARD_PROCESSES",
+                                   str(os.cpu_count() or 1)))
+    count_spec = os.environ.get("SHARD_COUNT")
+    shard_count = (int(count_spec) if count_spec
+                   else await recommended_shards(token))
+    groups = split_shards(shard_count, processes)
+    rate_limit = float(os.environ.get("HIBP_RATE_LIMIT", "10"))
+    rate_burst = int(os.environ.get("HIBP_RATE_BURST", "1"))
+    metrics_port = os.environ.get("METRICS_PORT")
+
+    workers = []
+    for index, group in enumerate(groups):
+        env = dict(os.environ)
+        env["SHARD_COUNT"] = str(shard_count)
+        env["SHARD_IDS"] = ",".join(map(str, group))
+        env["HIBP_RATE_LIMIT"] = str(rate_limit / len(groups))
+        env["HIBP_RATE_BURST"] = str(max(1, rate_burst // len(groups)))
+        if metrics_port:
+            env["METRICS_PORT"] = str(int(metrics_port) + index)
+        name = f"shards {env['SHARD_IDS']}"
+        workers.append(asyncio.create_task(run_worker(env, name)))
+    print(f"Running {shard_count} shards in {len(groups)} processes")
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: [w.cancel() for w in workers])
+    await asyncio.gather(*workers, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(launch())
@@ -0,0 +1,70 @@
+"""
+Tests for breach alerts raised around a restart.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+import asyncio
+import os
+import pathlib
+from typing import Any
+import discord
+from breach_feed import BreachFeed, Subscriptions
+
+
+class FakeChannel(discord.abc.Messageable):
+    """A channel recording the embeds sent to it."""
+
+    def __init__(self) -> None:
+        self.embeds: list[discord.Embed] = []
+
+    async def _get_channel(self) -> Any:
+        return self
+
+    async def send(self, *_: Any, **kwargs: Any) -> Any:
+        self.embeds.extend(kwargs.get("embeds") or [])
+
+
+class FakeBot:
+    """A bot whose channel cache is only filled once it is ready."""
+
+    def __init__(self) -> None:
+        self.ready = asyncio.Event()
+        self.channels: dict[int, FakeChannel] = {}
+
+    async def wait_until_ready(self) -> None:
+        await self.ready.wait()
+
+    def get_channel(self, channel_id: int) -> FakeChannel | None:
+        return self.channels.get(channel_id)
+
+
+def breach(name: str) -> dict[str, Any]:
+    """A minimal catalog entry."""
+    return {"Name": name, "Title": name, "ModifiedDate": "2024-01-01",
+            "Description": "", "DataClasses": []}
+
+
+def test_alerts_wait_until_ready(tmp_path: pathlib.Path) -> None:
+    async def test() -> list[str]:
+        bot = FakeBot()
+        subscriptions = Subscriptions(os.path.join(tmp_path, "subs.db"))
+        await subscriptions.add(1, 1)
+        feed = BreachFeed(bot, None, None,  # type: ignore[arg-type]
+                          subscriptions)
+        feed.on_catalog_change([breach("Old")])
+        feed.on_catalog_change([breach("Old"), breach("New")])
+        await asyncio.sleep(0.01)
+        channel = FakeChannel()
+        bot.channels[1] = channel
+        bot.ready.set()
+        await asyncio.sleep(0.01)
+        await feed.stop()
+        return [str(embed.title) for embed in channel.embeds]
+
+    titles = asyncio.run(test())
+    assert len(titles) == 1 and "New" in titles[0]
@@ -0,0 +1,173 @@
+"""
+Tests for the Redis cache backend's RESP client, run against the fake
+Redis server in bench/.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+import asyncio
+from collections.abc import Awaitable, Callable, Sequence
+from typing import Any, TypeVar
+import pytest
+from cache_backend import (RedisBackend, RedisConnection, RedisError,
+                           encode_command)
+from fake_redis import FakeRedis
+
+T = TypeVar("T")
+
+
+def read_reply(data: bytes) -> Any:
+    """Parses one RESP reply."""
+    async def parse() -> Any:
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        connection = RedisConnection("redis://localhost")
+        # pylint: disable-msg=protected-access
+        return await connection._read_reply(reader)
+    return asyncio.run(parse())
+
+
+def with_server(test: Callable[[FakeRedis], Awaitable[T]]) -> T:
+    """Runs a test coroutine against a fresh fake Redis server."""
+    async def run() -> T:
+        server = FakeRedis()
+        await server.start()
+        try:
+            return await test(server)
+        finally:
+            await server.stop()
+    return asyncio.run(run())
+
+
+def test_encode_command() -> None:
+    assert (encode_command(b"GET", b"k") ==
+            b"*2\r\n$3\r\nGET\r\n$1\r\nk\r\n")
+
+
+@pytest.mark.parametrize("data, reply", [
+    (b"+OK\r\n", b"OK"),
+    (b":42\r\n", 42),
+    (b"$5\r\nhe\r\nl\r\n", b"he\r\nl"),
+    (b"$0\r\n\r\n", b""),
+    (b"$-1\r\n", None),
+    (b"*-1\r\n", None),
+    (b"*3\r\n$1\r\na\r\n$-1\r\n:7\r\n", [b"a", None, 7]),
+    (b"*2\r\n*1\r\n+x\r\n*0\r\n", [[b"x"], []]),
+])
+def test_read_reply(data: bytes, reply: Any) -> None:
+    assert read_reply(data) == reply
+
+
+def test_error_reply_is_returned() -> None:
+    reply = read_reply(b"-ERR wrong type\r\n")
+    assert isinstance(reply, RedisError)
+    assert str(reply) == "ERR wrong type"
+
+
+@pytest.mark.parametrize("data", [b"+OK", b"?what\r\n", b"$5\r\nab"])
+def test_truncated_or_unknown_reply(data: bytes) -> None:
+    with pytest.raises((ConnectionError, asyncio.IncompleteReadError)):
+        read_reply(data)
+
+
+def test_pipelined_mget() -> None:
+    async def test(server: FakeRedis) -> list[Any]:
+        connection = RedisConnection(server.url)
+        try:
+            return await connection.pipeline([
+                (b"SET", b"a", b"1"),
+                (b"SET", b"b", b"2", b"PX", b"60000"),
+                (b"MGET", b"a", b"missing", b"b"),
+                (b"NOPE",),
+                (b"GET", b"a"),
+            ])
+        finally:
+            await connection.close()
+
+    replies = with_server(test)
+    assert replies[:3] == [b"OK", b"OK", [b"1", None, b"2"]]
+    assert isinstance(replies[3], RedisError)
+    assert replies[4] == b"1"
+
+
+def test_backend_batches_gets_into_one_mget() -> None:
+    async def test(server: FakeRedis) -> list[bytes | None]:
+        backend = RedisBackend(server.url)
+        backend.put("range", "big", b"x" * 5000, 60)
+        backend.put("range", "small", b"y", 60)
+        await backend.flush()
+        server.commands.clear()
+        try:
+            return await backend.get_many("range", ["big", "none", "small"])
+        finally:
+            await backend.close()
+            assert server.commands["MGET"] == 1
+            assert server.commands["GET"] == 0
+
+    assert with_server(test) == [b"x" * 5000, None, b"y"]
+
+
+def test_backend_counts_only_its_keys() -> None:
+    async def test(server: FakeRedis) -> int:
+        server.data[b"other:key"] = (0.0, b"1")
+        backend = RedisBackend(server.url)
+        for key in "abc":
+            backend.put("range", key, b"v", 60)
+        await backend.flush()
+        # Recount now rather than after COUNT_INTERVAL
+        # pylint: disable-msg=protected-access
+        backend._counted = float("-inf")
+        await backend.get("range", "a")
+        await backend.close()
+        return len(backend)
+
+    assert with_server(test) == 3
+
+
+def test_unanswered_request_is_a_miss() -> None:
+    async def silent(reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        await reader.read()
+        writer.close()
+
+    async def test() -> tuple[bytes | None, int]:
+        server = await asyncio.start_server(silent, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        backend = RedisBackend(f"redis://127.0.0.1:{port}/0", timeout=0.1)
+        try:
+            value = await asyncio.wait_for(backend.get("range", "a"), 5)
+        finally:
+            await backend.close()
+            server.close()
+            await server.wait_closed()
+        return value, backend.misses
+
+    assert asyncio.run(test()) == (None, 1)
+
+
+class BrokenConnection(RedisConnection):
+    """A connection failing with an error the backend does not expect."""
+
+    async def pipeline(self, commands: Sequence[Sequence[bytes]]
+                       ) -> list[Any]:
+        raise ValueError("unexpected")
+
+
+def test_failed_pipeline_resolves_gets_as_misses() -> None:
+    async def test() -> tuple[list[bytes | None], int]:
+        backend = RedisBackend("redis://127.0.0.1:1/0")
+        backend.connection = BrokenConnection("redis://127.0.0.1:1/0")
+        values = await asyncio.wait_for(
+            backend.get_many("range", ["a", "b"]), 5)
+        # pylint: disable-msg=protected-access
+        assert backend._batch is not None
+        with pytest.raises(ValueError):
+            await backend._batch
+        return values, backend.misses
+
+    assert asyncio.run(test()) == ([None, None], 2)
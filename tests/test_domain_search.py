@@ -0,0 +1,89 @@
+"""
+Tests for the incremental JSON object parser behind domain searches.
+
+Copyright (C) 2018  plasticuproject@pm.me
+
+This work is licensed under the Creative Commons Attribution 4.0
+International License. To view a copy of this license, visit
+http://creativecommons.org/licenses/by/4.0/ or send a letter to
+Creative Commons, PO Box 1866, Mountain View, CA 94042, USA.
+"""
+import asyncio
+import json
+from collections.abc import AsyncIterator
+from typing import Any
+import pytest
+from domain_search import ObjectStream, iter_object
+
+DOCUMENT = ('{"alice": ["Adobe", "LinkedIn"], "bob" :[] ,\n'
+            '"caf\\u00e9": ["Caf\\u00e9 \\"Bar\\""], "n": -1.5e10,'
+            ' "m": 1234, "o": {"x": [true, false, null]}, "z": 0}')
+
+
+def parse(pieces: list[str]) -> list[tuple[str, Any]]:
+    """Feeds a document to a parser in pieces."""
+    stream = ObjectStream()
+    members = []
+    for piece in pieces:
+        members.extend(stream.feed(piece))
+    members.extend(stream.feed("", final=True))
+    return members
+
+
+@pytest.mark.parametrize("split", range(len(DOCUMENT) + 1))
+def test_every_split_point(split: int) -> None:
+    members = parse([DOCUMENT[:split], DOCUMENT[split:]])
+    assert members == list(json.loads(DOCUMENT).items())
+
+
+def test_one_character_at_a_time() -> None:
+    assert parse(list(DOCUMENT)) == list(json.loads(DOCUMENT).items())
+
+
+@pytest.mark.parametrize("pieces, value", [
+    (["-1.", "5e10"], -1.5e10),
+    (["12", "34"], 1234),
+    (["1", ".5e", "-3"], 0.0015),
+    (["-", "7"], -7),
+])
+def test_numbers_split_across_pieces(pieces: list[str], value: Any) -> None:
+    assert parse(['{"a": ', *pieces, "}"]) == [("a", value)]
+
+
+def test_members_returned_as_completed() -> None:
+    stream = ObjectStream()
+    assert stream.feed('{"a": [1], "b": [') == [("a", [1])]
+    assert stream.feed('2]}') == [("b", [2])]
+    assert stream.feed("", final=True) == []
+
+
+def test_empty_object() -> None:
+    assert parse(["{", " }"]) == []
+
+
+@pytest.mark.parametrize("document", [
+    "[]",
+    '{"a" 1}',
+    '{"a": 1 "b": 2}',
+    '{"a": 1}x',
+    '{"a": ',
+    '{"a": 1.}',
+    "",
+])
+def test_malformed_documents(document: str) -> None:
+    with pytest.raises(ValueError):
+        parse([document])
+
+
+def test_iter_object_splits_utf8() -> None:
+    data = '{"café": ["über"], "n": 12}'.encode()
+
+    async def collect(size: int) -> list[tuple[str, Any]]:
+        async def chunks() -> AsyncIterator[bytes]:
+            for start in range(0, len(data), size):
+                yield data[start:start + size]
+        return [member async for member in iter_object(chunks())]
+
+    for size in range(1, len(data) + 1):
+        assert asyncio.run(collect(size)) == [("café", ["über"]),
+                                              ("n", 12)]